@@ -1,24 +1,44 @@
 import sys
 from PyQt5.QtWidgets import (
+    QActionGroup,
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QPushButton, QFileDialog, QMessageBox, QTreeWidget, QTreeWidgetItem,
-    QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView, QFrame,
-    QGroupBox, QComboBox, QCheckBox, QDialog, QLineEdit, QFormLayout, QRadioButton,
-    QButtonGroup, QListWidget, QInputDialog, QMenu
+    QTableView, QAbstractItemView, QHeaderView, QFrame,
+    QGroupBox, QComboBox, QDialog, QLineEdit, QFormLayout, QRadioButton,
+    QButtonGroup, QListWidget, QInputDialog, QMenu, QPlainTextEdit, QTableWidget, QTableWidgetItem
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool, QTimer
 from PyQt5.QtGui import QFontMetrics
 from datetime import datetime
-import pandas as pd
+from functools import partial
 import logging
-import webbrowser
+import json
 import os
 
-from history_manager import HistoryManager
+# Only Qt and light modules are imported here so that the window shows quickly; numpy-heavy
+# modules come in with the table model, pandas and the storage layer are imported on the
+# thread pool right after the first paint (see start_history)
+from label_items import JAMA_ITEMS, GQS_ITEMS, DISCERN_ITEMS
+from instrumentation import metrics, profiler, timed
+from autosave import AutosaveManager, AUTOSAVE_INTERVAL_MS
+from workers import Worker
+from table_model import (
+    AnnotationTableModel, AnnotationDelegate, VIEW_COLUMN, JAMA_COLUMN, GQS_COLUMN,
+    DISCERN_COLUMN, CUSTOM_COLUMN_START
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+SYNC_INTERVAL_MS = 5000  # how often edits of other processes on the open layer are pulled in
+# Handling of videos that were imported before (dedup_index.DEDUP_MODES, kept here so that
+# pandas is not imported on the startup path)
+DEDUP_OPTIONS = (
+    ("flag", "标记重复视频并沿用已有标注"),
+    ("skip", "跳过重复视频"),
+    ("off", "不检查重复视频"),
+)
+
 class CustomColumnDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -79,34 +99,517 @@ class CustomColumnDialog(QDialog):
         enum_values = [self.enum_list.item(i).text() for i in range(self.enum_list.count())] if column_type in ["enum", "multi"] else []
         return {"name": name, "type": column_type, "enum_values": enum_values}
 
+class ExportDialog(QDialog):
+    FORMAT_NAMES = {"csv": "CSV", "parquet": "Parquet", "jsonl": "JSON Lines", "xlsx": "Excel (xlsx)"}
+    LAYOUT_NAMES = {"joined": "合并列（每个字段一列）", "wide": "展开列（每个选项一列0/1）"}
+
+    def __init__(self, metas, current_meta=None, parent=None):
+        super().__init__(parent)
+        from export_engine import EXPORT_FORMATS
+        self.setWindowTitle("导出数据")
+        self.setFixedSize(460, 380)
+        self.metas = metas
+        layout = QFormLayout(self)
+
+        self.format_combo = QComboBox()
+        for fmt in EXPORT_FORMATS:
+            self.format_combo.addItem(self.FORMAT_NAMES[fmt], fmt)
+        layout.addRow("文件格式:", self.format_combo)
+
+        self.layout_combo = QComboBox()
+        for name, label in self.LAYOUT_NAMES.items():
+            self.layout_combo.addItem(label, name)
+        layout.addRow("标注列:", self.layout_combo)
+
+        # Several sessions are written into one file, with their timestamp and file name as leading columns
+        self.session_list = QListWidget()
+        self.session_list.setSelectionMode(QListWidget.MultiSelection)
+        for meta in metas:
+            self.session_list.addItem(f"{meta['timestamp']}  {meta['filename']}（{meta['count']}条）")
+            if current_meta is not None and meta["timestamp"] == current_meta["timestamp"]:
+                self.session_list.item(self.session_list.count() - 1).setSelected(True)
+        layout.addRow("历史记录 (多选):", self.session_list)
+
+        button_layout = QHBoxLayout()
+        self.ok_btn = QPushButton("确定")
+        self.ok_btn.clicked.connect(self.accept)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(self.ok_btn)
+        button_layout.addWidget(self.cancel_btn)
+        layout.addRow(button_layout)
+
+    def get_options(self):
+        metas = [self.metas[i] for i in range(len(self.metas)) if self.session_list.item(i).isSelected()]
+        return self.format_combo.currentData(), self.layout_combo.currentData(), metas
+
+class MetricsDialog(QDialog):
+    # Rolling latency percentiles and counters of this run
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("性能统计")
+        self.resize(760, 480)
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.text)
+
+        button_layout = QHBoxLayout()
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.refresh)
+        export_btn = QPushButton("导出JSON")
+        export_btn.clicked.connect(self.export_summary)
+        reset_btn = QPushButton("清空")
+        reset_btn.clicked.connect(self.reset)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        for button in (refresh_btn, export_btn, reset_btn, close_btn):
+            button_layout.addWidget(button)
+        layout.addLayout(button_layout)
+        self.refresh()
+
+    def refresh(self):
+        self.text.setPlainText(metrics.format_summary())
+
+    def export_summary(self):
+        default_filename = f"metrics_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出性能统计", default_filename, "JSON文件 (*.json)")
+        if file_path:
+            try:
+                metrics.write_summary(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"导出性能统计失败：{str(e)}")
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+class AnalyticsDialog(QDialog):
+    # Grouped score summaries. The open session's aggregates follow its edits (checked once a
+    # second); "all sessions" sums the others up on the thread pool and adds the open one live.
+    HEADERS = ["分组", "数据量", "已标注", "JAMA均分", "GQS均分", "DISCERN均分"]
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        self.setWindowTitle("评分统计")
+        self.resize(900, 620)
+        layout = QVBoxLayout(self)
+
+        option_layout = QHBoxLayout()
+        option_layout.addWidget(QLabel("范围:"))
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItem("当前记录", "current")
+        self.scope_combo.addItem("全部历史记录", "all")
+        option_layout.addWidget(self.scope_combo)
+        option_layout.addWidget(QLabel("分组:"))
+        self.group_combo = QComboBox()
+        self.group_combo.setMinimumWidth(160)
+        option_layout.addWidget(self.group_combo)
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.refresh)
+        option_layout.addWidget(refresh_btn)
+        export_btn = QPushButton("导出JSON")
+        export_btn.clicked.connect(self.export_summary)
+        option_layout.addWidget(export_btn)
+        option_layout.addStretch()
+        layout.addLayout(option_layout)
+
+        self.info_label = QLabel("")
+        layout.addWidget(self.info_label)
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setMaximumHeight(220)
+        layout.addWidget(self.table)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.text)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.close)
+        layout.addWidget(close_btn)
+
+        self.worker = None
+        self.parts = None  # aggregates of the sessions that are not open ("all" scope)
+        self.summary = None
+        self.shown = None  # (analytics object, version) on display
+        self.update_group_options()
+        self.scope_combo.currentIndexChanged.connect(self.on_options_changed)
+        self.group_combo.currentIndexChanged.connect(self.on_options_changed)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh_live)
+        self.timer.start()
+        self.refresh()
+
+    def group_options(self):
+        from analytics import GROUP_COLUMNS
+        options = [("不分组", "")]
+        data = self.app.current_data
+        for name in GROUP_COLUMNS:
+            if self.scope_combo.currentData() == "all" or (data is not None and name in data.columns):
+                options.append((name, name))
+        options.append(("GQS评分", "gqs"))
+        options.extend((col["name"], col["name"]) for col in self.app.custom_columns if col["type"] == "enum")
+        return options
+
+    def update_group_options(self):
+        options = self.group_options()
+        current = [(self.group_combo.itemText(i), self.group_combo.itemData(i)) for i in range(self.group_combo.count())]
+        if options == current:
+            return
+        by = self.group_combo.currentData()
+        self.group_combo.blockSignals(True)
+        self.group_combo.clear()
+        for text, name in options:
+            self.group_combo.addItem(text, name)
+        self.group_combo.setCurrentIndex(max(0, self.group_combo.findData(by)))
+        self.group_combo.blockSignals(False)
+
+    def on_options_changed(self):
+        self.update_group_options()
+        self.parts = None
+        self.refresh()
+
+    def refresh(self):
+        by = self.group_combo.currentData() or ""
+        if self.scope_combo.currentData() == "current":
+            self.show_current(by)
+            return
+        if self.worker is not None:
+            self.worker.cancel()
+        self.app.autosave.flush()
+        worker = Worker(self.app.analytics_task, by)
+        worker.signals.progress.connect(
+            lambda done, fraction: self.info_label.setText(f"正在统计：已处理{done}条历史记录")
+        )
+        worker.signals.finished.connect(partial(self.on_parts_ready, worker, by))
+        worker.signals.failed.connect(partial(self.on_parts_failed, worker))
+        self.worker = worker
+        self.info_label.setText("正在统计全部历史记录...")
+        self.app.start_task(worker)
+
+    def show_current(self, by):
+        from analytics import summarize
+        if self.app.current_store is None:
+            self.shown = None
+            self.info_label.setText("请先选择历史记录")
+            return
+        try:
+            analytics = self.app.session_analytics(by)
+            self.show_summary(summarize(analytics.aggregates()))
+        except ValueError as e:
+            self.info_label.setText(str(e))
+            return
+        self.shown = (analytics, analytics.version)
+        self.info_label.setText(f"当前记录：{self.app.current_meta['filename']}（标注后自动更新）")
+
+    def on_parts_ready(self, worker, by, parts):
+        if worker is not self.worker:
+            return
+        self.worker = None
+        self.parts = (by, parts)
+        self.show_all()
+
+    def on_parts_failed(self, worker, message):
+        if worker is not self.worker:
+            return
+        self.worker = None
+        self.info_label.setText(f"统计失败：{message}")
+
+    def show_all(self):
+        # Sessions from the worker plus the open session's live aggregates
+        from analytics import combine, summarize
+        by, parts = self.parts
+        analytics = None
+        if self.app.current_store is not None:
+            try:
+                analytics = self.app.session_analytics(by)
+                parts = parts + [analytics.aggregates()]
+            except ValueError as e:
+                self.info_label.setText(str(e))
+                return
+        self.show_summary(summarize(combine(parts)))
+        self.shown = (analytics, analytics.version) if analytics is not None else None
+        self.info_label.setText(f"全部历史记录：共{len(parts)}条")
+
+    def refresh_live(self):
+        # Re-renders only when the open session's aggregates changed since they were shown
+        self.update_group_options()
+        if self.worker is not None or self.app.current_store is None:
+            return
+        by = self.group_combo.currentData() or ""
+        if self.scope_combo.currentData() == "all" and (self.parts is None or self.parts[0] != by):
+            return
+        try:
+            analytics = self.app.session_analytics(by)
+            analytics.refresh()
+        except ValueError:
+            return
+        if self.shown == (analytics, analytics.version):
+            return
+        if self.scope_combo.currentData() == "current":
+            self.show_current(by)
+        else:
+            self.show_all()
+
+    def show_summary(self, summary):
+        from analytics import format_analytics
+        self.summary = summary
+        groups = [summary["total"]] + (summary["groups"] if summary["by"] else [])
+        self.table.setRowCount(len(groups))
+        for row, group in enumerate(groups):
+            values = [group["group"], str(group["rows"]), str(group["annotated"])] + [
+                "-" if group.get(f"{field}_mean") is None else f"{group[f'{field}_mean']:.2f}"
+                for field in ("jama", "gqs", "discern")
+            ]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(value))
+        self.text.setPlainText(format_analytics(summary))
+
+    def export_summary(self):
+        if self.summary is None:
+            return
+        default_filename = f"analytics_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出评分统计", default_filename, "JSON文件 (*.json)")
+        if file_path:
+            try:
+                with open(file_path, "w", encoding="utf-8") as f:
+                    json.dump(self.summary, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"导出评分统计失败：{str(e)}")
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        self.app.analytics_dialog = None
+        super().closeEvent(event)
+
+class MergeDialog(QDialog):
+    STRATEGY_NAMES = {
+        "majority": "多数一致（超过半数标注员选择）",
+        "union": "并集（任一标注员选择）",
+        "intersection": "交集（全部标注员选择）",
+    }
+
+    def __init__(self, annotators, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("合并标注员")
+        self.setFixedSize(420, 340)
+        layout = QFormLayout(self)
+
+        self.annotator_list = QListWidget()
+        self.annotator_list.setSelectionMode(QListWidget.MultiSelection)
+        for name in annotators:
+            self.annotator_list.addItem(name)
+            self.annotator_list.item(self.annotator_list.count() - 1).setSelected(True)
+        layout.addRow("标注员 (多选):", self.annotator_list)
+
+        self.strategy_combo = QComboBox()
+        for name, label in self.STRATEGY_NAMES.items():
+            self.strategy_combo.addItem(label, name)
+        layout.addRow("合并方式:", self.strategy_combo)
+
+        self.target_edit = QLineEdit()
+        self.target_edit.setPlaceholderText("留空写入主标注（覆盖其内容）")
+        layout.addRow("写入标注层:", self.target_edit)
+
+        button_layout = QHBoxLayout()
+        self.ok_btn = QPushButton("确定")
+        self.ok_btn.clicked.connect(self.accept)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(self.ok_btn)
+        button_layout.addWidget(self.cancel_btn)
+        layout.addRow(button_layout)
+
+    def get_options(self):
+        annotators = [item.text() for item in self.annotator_list.selectedItems()]
+        return annotators, self.strategy_combo.currentData(), self.target_edit.text().strip()
+
+class ReliabilityDialog(QDialog):
+    # Agreement between the annotation layers of the current session, computed on the thread
+    # pool (bootstrap replicates on a process pool); the rows coders disagree on most are listed
+    def __init__(self, app, meta, annotators):
+        super().__init__(app)
+        self.app = app
+        self.meta = meta
+        self.setWindowTitle(f"标注一致性 - {meta['filename']}")
+        self.resize(900, 620)
+        layout = QVBoxLayout(self)
+
+        option_layout = QHBoxLayout()
+        option_layout.addWidget(QLabel("标注层 (多选):"))
+        self.layer_list = QListWidget()
+        self.layer_list.setSelectionMode(QListWidget.MultiSelection)
+        self.layer_list.setMaximumHeight(90)
+        for name in [""] + annotators:
+            self.layer_list.addItem(name or "主标注")
+            item = self.layer_list.item(self.layer_list.count() - 1)
+            item.setData(Qt.UserRole, name)
+            item.setSelected(bool(name) or len(annotators) < 2)
+        option_layout.addWidget(self.layer_list)
+        self.run_btn = QPushButton("计算")
+        self.run_btn.clicked.connect(self.run)
+        option_layout.addWidget(self.run_btn)
+        self.export_btn = QPushButton("导出分歧数据...")
+        self.export_btn.clicked.connect(self.export_disagreements)
+        self.export_btn.setEnabled(False)
+        option_layout.addWidget(self.export_btn)
+        layout.addLayout(option_layout)
+
+        self.info_label = QLabel("选择至少两个标注层后点击计算")
+        layout.addWidget(self.info_label)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.text)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.close)
+        layout.addWidget(close_btn)
+        self.worker = None
+        self.report = None
+
+    def run(self):
+        annotators = [item.data(Qt.UserRole) for item in self.layer_list.selectedItems()]
+        if len(annotators) < 2:
+            QMessageBox.warning(self, "提示", "请至少选择两个标注层")
+            return
+        self.app.autosave.flush()
+        worker = Worker(self.app.reliability_task, self.meta, annotators)
+        worker.signals.progress.connect(
+            lambda done, fraction: self.info_label.setText(f"正在计算置信区间：bootstrap {done}次")
+        )
+        worker.signals.finished.connect(partial(self.on_finished, worker))
+        worker.signals.failed.connect(partial(self.on_failed, worker))
+        self.worker = worker
+        self.run_btn.setEnabled(False)
+        self.info_label.setText("正在计算一致性...")
+        self.app.start_task(worker)
+
+    def on_finished(self, worker, report):
+        if worker is not self.worker:
+            return
+        from reliability import format_reliability
+        self.worker = None
+        self.report = report
+        self.run_btn.setEnabled(True)
+        self.export_btn.setEnabled(bool(report["disagreements"]))
+        self.info_label.setText(f"共同标注的数据：{report['units']}条")
+        self.text.setPlainText(format_reliability(report))
+
+    def on_failed(self, worker, message):
+        if worker is not self.worker:
+            return
+        self.worker = None
+        self.run_btn.setEnabled(True)
+        self.info_label.setText(f"计算失败：{message}")
+
+    def export_disagreements(self):
+        from reliability import disagreement_frame
+        default_filename = f"disagreements_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出分歧数据", default_filename, "CSV文件 (*.csv)")
+        if file_path:
+            try:
+                disagreement_frame(self.report).to_csv(file_path, index=False, encoding="utf-8-sig")
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"导出分歧数据失败：{str(e)}")
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        super().closeEvent(event)
+
+class HistoryItem(QTreeWidgetItem):
+    # Tree row that carries its history meta, so selection needs no lookup
+    def __init__(self, meta, columns):
+        super().__init__(columns)
+        self.meta = meta
+
 class App(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Label Tool v1.0")
         self.resize(1200, 750)
+        profiler.start_from_env()  # LABEL_TOOL_PROFILE=cprofile|tracemalloc|all
 
-        self.history_manager = HistoryManager()
-        self.jama_items = ["作者身份", "信息来源", "披露声明", "时效性"]
-        self.gqs_items = ["差(1)", "一般(2)", "中等(3)", "良好(4)", "优秀(5)"]
-        self.discern_items = [
-            "视频目的清晰且简洁",
-            "信息来源可靠且明确提及",
-            "内容基于可靠证据或研究",
-            "提及不同的治疗或管理选项",
-            "披露利益冲突或资助来源"
-        ]
+        self.history_manager = None  # opened on the thread pool after the first paint
+        self.autosave = None  # created together with the history manager
+        self.session_cache = None  # SessionCache of recently opened sessions, same lifetime
+        self.jama_items = JAMA_ITEMS
+        self.gqs_items = GQS_ITEMS
+        self.discern_items = DISCERN_ITEMS
         self.custom_columns = []  # Store custom column definitions
         self.current_meta = None
         self.current_data = None
-        self.current_jama = None
-        self.current_gqs = None
-        self.current_discern = None
-        self.current_custom_data = None  # Store custom column data
+        self.current_store = None  # AnnotationStore with JAMA/GQS/DISCERN and custom column data
+        self.current_scores = None  # Score columns, updated in place per edited row
+        self.sort_keys = None  # SortKeyCache of the current session
+        self.search_index = None  # SessionIndex of the current session, built while loading
+        self.current_analytics = None  # group field -> SessionAnalytics of the current session
+        self.analytics_cache = None  # AnalyticsCache of the other sessions, used on the thread pool
+        self.analytics_dialog = None
         self.sort_column = -1
         self.sort_order = Qt.AscendingOrder
+        self.thread_pool = QThreadPool(self)  # imports and session loads run here
+        self.import_worker = None
+        self.load_worker = None
+        self.export_worker = None
+        self.merge_worker = None
+        self.tasks = set()  # workers are referenced until they report back, superseded ones included
 
         self.init_ui()
-        self.load_history()
+        self.import_btn.setEnabled(False)
+        self.export_btn.setEnabled(False)
+        self.status_label.setText("正在加载历史记录...")
+        QTimer.singleShot(0, self.start_history)
+
+    def start_history(self):
+        worker = Worker(self.open_history)
+        worker.signals.finished.connect(self.on_history_ready)
+        worker.signals.failed.connect(self.on_history_failed)
+        self.start_task(worker)
+
+    def open_history(self, progress=None):
+        # Runs on the thread pool: the storage layer (and with it pandas) is imported here,
+        # the search and sort modules are warmed up for the first session load
+        from history_manager import open_history_manager
+        import search_index, sort_keys, export_engine
+        manager = open_history_manager()
+        return manager, manager.get_history()
+
+    def on_history_ready(self, result):
+        self.history_manager, metas = result
+        self.autosave = AutosaveManager(
+            self.history_manager,
+            interval_ms=int(os.environ.get("LABEL_TOOL_AUTOSAVE_MS", AUTOSAVE_INTERVAL_MS)),
+            parent=self
+        )
+        self.autosave.statusChanged.connect(self.status_label.setText)
+        from session_cache import SessionCache
+        self.session_cache = SessionCache(write_back=lambda entry: self.history_manager.save_annotations(
+            entry.meta, entry.store, annotator=entry.annotator
+        ))
+        self.import_btn.setEnabled(True)
+        self.export_btn.setEnabled(True)
+        self.update_action.setEnabled(True)
+        self.analytics_action.setEnabled(True)
+        self.collab_menu.setEnabled(True)
+        self.update_window_title()
+        # Edits other annotators' processes append to the same layer are pulled in periodically
+        self.sync_timer.start(int(os.environ.get("LABEL_TOOL_SYNC_MS", SYNC_INTERVAL_MS)))
+        self.fill_history_tree(metas)
+        self.status_label.setText("等待操作...")
+
+    def on_history_failed(self, message):
+        QMessageBox.critical(self, "错误", f"加载历史记录失败：{message}")
+        self.status_label.setText("加载历史记录失败")
 
     def init_ui(self):
         central_widget = QWidget()
@@ -144,15 +647,56 @@ class App(QMainWindow):
         save_btn.clicked.connect(self.save_records)
         top_layout.addWidget(save_btn)
 
-        export_btn = QPushButton("导出数据")
-        export_btn.setMaximumHeight(30)
-        export_btn.clicked.connect(self.export_data)
-        top_layout.addWidget(export_btn)
+        self.export_btn = QPushButton("导出数据")
+        self.export_btn.setMaximumHeight(30)
+        self.export_btn.clicked.connect(self.export_data)
+        top_layout.addWidget(self.export_btn)
+
+        self.cancel_btn = QPushButton("取消任务")
+        self.cancel_btn.setMaximumHeight(30)
+        self.cancel_btn.clicked.connect(self.cancel_tasks)
+        self.cancel_btn.setVisible(False)
+        top_layout.addWidget(self.cancel_btn)
 
         top_layout.addStretch()
         top_frame.setMaximumHeight(50)
         main_layout.addWidget(top_frame)
 
+        # Import menu: what happens to videos that an earlier import already stored
+        import_menu = self.menuBar().addMenu("导入")
+        self.update_action = import_menu.addAction("用重新抓取的数据更新当前记录...", self.update_session)
+        self.update_action.setEnabled(False)
+        import_menu.addSeparator()
+        self.dedup_group = QActionGroup(self)
+        default_mode = os.environ.get("LABEL_TOOL_DEDUP", "flag")
+        for mode, text in DEDUP_OPTIONS:
+            action = import_menu.addAction(text)
+            action.setCheckable(True)
+            action.setChecked(mode == default_mode)
+            action.setData(mode)
+            self.dedup_group.addAction(action)
+
+        # Collaboration menu: annotation layers of several coders on the same imported data
+        self.collab_menu = self.menuBar().addMenu("协作")
+        self.collab_menu.addAction("切换标注员...", self.switch_annotator)
+        self.collab_menu.addAction("合并标注员...", self.merge_annotators)
+        self.collab_menu.addAction("标注一致性...", self.show_reliability)
+        self.collab_menu.addAction("立即同步", self.sync_annotations)
+        self.collab_menu.setEnabled(False)
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.sync_annotations)
+
+        # Analytics menu
+        analytics_menu = self.menuBar().addMenu("分析")
+        self.analytics_action = analytics_menu.addAction("评分统计...", self.show_analytics)
+        self.analytics_action.setEnabled(False)
+
+        # Diagnostics menu
+        diagnostics_menu = self.menuBar().addMenu("诊断")
+        diagnostics_menu.addAction("性能统计...", lambda: MetricsDialog(self).exec_())
+        self.profile_action = diagnostics_menu.addAction("开始性能分析", self.toggle_profiling)
+        self.update_profile_action()
+
         self.status_label = QLabel("等待操作...")
         self.status_label.setMinimumHeight(60)
         self.status_label.setMaximumHeight(60)
@@ -171,52 +715,70 @@ class App(QMainWindow):
         self.history_tree.itemSelectionChanged.connect(self.on_history_select)
         main_layout.addWidget(self.history_tree)
 
-        # Data table
-        self.data_table = QTableWidget()
+        # Filter bar: keywords match title/author, "field op value" terms filter on annotations
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("筛选:"))
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("标题/作者关键词，或 jama<2、gqs:空、discern>=3、字段名=选项、字段名:空（空格分隔，同时满足）")
+        self.filter_edit.textChanged.connect(lambda: self.filter_timer.start())
+        filter_layout.addWidget(self.filter_edit)
+        self.filter_count_label = QLabel("")
+        filter_layout.addWidget(self.filter_count_label)
+        clear_filter_btn = QPushButton("清除")
+        clear_filter_btn.clicked.connect(self.filter_edit.clear)
+        filter_layout.addWidget(clear_filter_btn)
+        main_layout.addLayout(filter_layout)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self.apply_filter)
+
+        # Data table: a model/view pair, cell editors are only created while a cell is edited
+        self.table_model = AnnotationTableModel(self.jama_items, self.gqs_items, self.discern_items, self)
+        self.table_model.cellEdited.connect(self.on_cell_edited)
+        self.data_table = QTableView()
+        self.data_table.setModel(self.table_model)
+        self.data_table.setItemDelegate(AnnotationDelegate(self.data_table))
         self.data_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.data_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.data_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.data_table.setEditTriggers(
+            QAbstractItemView.SelectedClicked | QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed
+        )
         self.update_table_columns()
-        self.data_table.cellClicked.connect(self.on_data_click)
+        self.data_table.clicked.connect(
+            lambda index: self.on_data_click(self.table_model.source_row(index.row()), index.column())
+        )
         self.data_table.horizontalHeader().sectionClicked.connect(self.on_header_clicked)
         self.data_table.horizontalHeader().setSortIndicatorShown(True)
         main_layout.addWidget(self.data_table)
 
     def update_table_columns(self):
-        base_columns = [
-            "标题", "发布时间", "作者", "点赞数", "评论数", "分享数", "收藏数",
-            "认证状态", "查看", "视频时长（秒）", "JAMA评分", "GQS评分", "DISCERN评分"
-        ]
-        custom_column_names = [col["name"] for col in self.custom_columns]
-        all_columns = base_columns + custom_column_names
-        self.data_table.setColumnCount(len(all_columns))
-        self.data_table.setHorizontalHeaderLabels(all_columns)
+        self.table_model.set_custom_columns(self.custom_columns)
         self.data_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
 
         # Calculate column widths
-        font = self.data_table.font()
-        font_metrics = QFontMetrics(font)
-        min_width = 80  # Minimum width for columns
         base_column_widths = [300, 160, 140, 100, 100, 100, 100, 160, 80, 120, 480, 160, 1000]  # Default widths
-        custom_column_widths = []
-
-        for col_def in self.custom_columns:
-            col_width = min_width
-            if col_def["type"] == "numeric":
-                col_width = max(col_width, font_metrics.width(col_def["name"]) + 20)
-            elif col_def["type"] == "enum":
-                max_option_width = max([font_metrics.width(opt) for opt in col_def["enum_values"]] + [font_metrics.width("未选择")])
-                col_width = max(col_width, max_option_width + 40)  # Extra padding for combo box
-            else:  # multi
-                # Calculate width needed for all checkboxes + score label
-                checkbox_width = sum(font_metrics.width(opt) + 30 for opt in col_def["enum_values"])  # 30 for checkbox size
-                score_width = font_metrics.width(f"({len(col_def['enum_values'])}/{len(col_def['enum_values'])})") + 20
-                col_width = max(col_width, checkbox_width + score_width + 20)  # Extra padding
-            custom_column_widths.append(col_width)
+        custom_column_widths = [self.custom_column_width(col_def) for col_def in self.custom_columns]
 
         column_widths = base_column_widths + custom_column_widths
         for i, width in enumerate(column_widths):
             self.data_table.setColumnWidth(i, width)
 
+    def custom_column_width(self, col_def):
+        font_metrics = QFontMetrics(self.data_table.font())
+        col_width = 80  # Minimum width for columns
+        if col_def["type"] == "numeric":
+            col_width = max(col_width, font_metrics.width(col_def["name"]) + 20)
+        elif col_def["type"] == "enum":
+            max_option_width = max([font_metrics.width(opt) for opt in col_def["enum_values"]] + [font_metrics.width("未选择")])
+            col_width = max(col_width, max_option_width + 40)  # Extra padding for combo box
+        else:  # multi
+            # Calculate width needed for all checkboxes + score label
+            checkbox_width = sum(font_metrics.width(opt) + 30 for opt in col_def["enum_values"])  # 30 for checkbox size
+            score_width = font_metrics.width(f"({len(col_def['enum_values'])}/{len(col_def['enum_values'])})") + 20
+            col_width = max(col_width, checkbox_width + score_width + 20)  # Extra padding
+        return col_width
+
     def add_custom_column(self):
         dialog = CustomColumnDialog(self)
         if dialog.exec_():
@@ -226,16 +788,13 @@ class App(QMainWindow):
                     QMessageBox.warning(self, "警告", "字段名称已存在！")
                     return
                 self.custom_columns.append(column_def)
-                self.update_table_columns()
-                if self.current_data is not None:
-                    # Initialize with empty set for multi-select or empty string for others
-                    initial_value = set() if column_def["type"] == "multi" else ""
-                    self.current_custom_data[column_def["name"]] = [initial_value for _ in range(len(self.current_data))]
-                    self.load_data_table(
-                        self.current_data, self.current_jama, self.current_gqs,
-                        self.current_discern, self.current_custom_data
-                    )
-                self.history_manager.save_custom_columns(self.current_meta, self.custom_columns)
+                if self.current_store is not None:
+                    self.current_store.add_custom_column(column_def)
+                # Only the new column is inserted, existing rows are left as they are
+                col_idx = self.table_model.insert_custom_column(column_def)
+                self.data_table.setColumnWidth(col_idx, self.custom_column_width(column_def))
+                if self.history_manager is not None:
+                    self.history_manager.save_custom_columns(self.current_meta, self.custom_columns)
                 QMessageBox.information(self, "提示", f"已添加字段：{column_def['name']}")
 
     def delete_custom_column(self):
@@ -269,17 +828,24 @@ class App(QMainWindow):
                 )
                 if reply == QMessageBox.Yes:
                     self.custom_columns = [col for col in self.custom_columns if col["name"] != col_name]
-                    if self.current_custom_data and col_name in self.current_custom_data:
-                        del self.current_custom_data[col_name]
+                    col_idx = self.table_model.remove_custom_column(col_name)
+                    if self.current_store is not None:
+                        self.current_store.remove_custom_column(col_name)
+                    if self.sort_keys is not None:
+                        self.sort_keys.invalidate(col_name)
+                    if self.search_index is not None:
+                        self.search_index.invalidate(col_name)
                     if self.current_data is not None and col_name in self.current_data.columns:
                         self.current_data.drop(columns=[col_name], inplace=True)
-                    self.update_table_columns()
-                    self.history_manager.save_custom_columns(self.current_meta, self.custom_columns)
-                    if self.current_data is not None:
-                        self.load_data_table(
-                            self.current_data, self.current_jama, self.current_gqs,
-                            self.current_discern, self.current_custom_data
-                        )
+                    if self.sort_column == col_idx:
+                        self.sort_column = -1
+                    elif self.sort_column > col_idx:
+                        self.sort_column -= 1
+                    self.data_table.horizontalHeader().setSortIndicator(self.sort_column, self.sort_order)
+                    if self.current_meta:
+                        self.current_meta["custom_columns"] = self.custom_columns
+                    if self.history_manager is not None:
+                        self.history_manager.save_custom_columns(self.current_meta, self.custom_columns)
                     QMessageBox.information(self, "提示", f"已删除字段：{col_name}")
                     dialog.accept()
         
@@ -295,64 +861,189 @@ class App(QMainWindow):
         if not file_path:
             return
 
-        try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path, encoding="utf-8-sig")
-            elif file_path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
-            elif file_path.endswith('.txt'):
-                df = pd.read_csv(file_path, sep='\t', encoding="utf-8")
-            else:
-                raise ValueError("不支持的文件格式")
+        filename = os.path.basename(file_path)
+        self.import_btn.setEnabled(False)
+        # Read and stored chunk by chunk on the thread pool, so the window stays responsive
+        checked = self.dedup_group.checkedAction()
+        worker = Worker(
+            self.history_manager.add_history_from_file, file_path, list(self.custom_columns),
+            dedup=checked.data() if checked is not None else "off"
+        )
+        worker.signals.progress.connect(
+            lambda rows, fraction: self.status_label.setText(
+                f"正在导入：{filename}，已读取{rows}条" + (f"（{fraction * 100:.0f}%）" if fraction is not None else "")
+            )
+        )
+        worker.signals.finished.connect(self.on_import_finished)
+        worker.signals.failed.connect(self.on_import_failed)
+        worker.signals.cancelled.connect(self.on_import_cancelled)
+        self.import_worker = worker
+        self.start_task(worker)
 
-            expected_columns = [
-                "title", "publish_time", "author_name", "like_count", "comment_count",
-                "share_count", "collect_count", "video_url", "danmaku_count", "duration",
-                "video_id", "play_count", "author_official_role", "is_verified"
-            ]
-            for col in expected_columns:
-                if col not in df.columns:
-                    if col in ["like_count", "comment_count", "share_count", "collect_count",
-                               "danmaku_count", "play_count", "author_official_role", "is_verified"]:
-                        df[col] = 0
-                    else:
-                        df[col] = ""
-            filename = os.path.basename(file_path)
-            self.history_manager.add_history(filename, df.to_dict('records'), self.custom_columns)
-            self.load_history()
-            self.status_label.setText(f"导入完成，文件：{filename}，数据量：{len(df)}")
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"导入失败：{str(e)}")
-            self.status_label.setText("等待操作...")
+    def on_import_finished(self, meta):
+        self.import_worker = None
+        self.import_btn.setEnabled(True)
+        self.update_task_state()
+        self.load_history()
+        from dedup_index import format_dedup_stats
+        stats = format_dedup_stats(meta.get("dedup"))
+        self.status_label.setText(f"导入完成，文件：{meta['filename']}，数据量：{meta['count']}" + (f"，{stats}" if stats else ""))
+
+    def update_session(self):
+        # Re-crawl of the open session: counts are refreshed and new videos appended on the
+        # thread pool; annotations are not touched, so editing can go on meanwhile
+        meta = self.current_meta
+        if not meta:
+            QMessageBox.warning(self, "提示", "请先选择要更新的历史记录")
+            return
+        if self.import_worker is not None:
+            QMessageBox.warning(self, "提示", "正在导入文件，请稍后再试")
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, f"选择用于更新 {meta['filename']} 的文件", "",
+            "支持的文件 (*.csv *.xlsx *.xls *.txt);;CSV文件 (*.csv);;Excel文件 (*.xlsx *.xls);;文本文件 (*.txt);;所有文件 (*)"
+        )
+        if not file_path:
+            return
+
+        filename = os.path.basename(file_path)
+        self.import_btn.setEnabled(False)
+        worker = Worker(self.history_manager.update_history_from_file, meta, file_path)
+        worker.signals.progress.connect(
+            lambda rows, fraction: self.status_label.setText(
+                f"正在更新：{meta['filename']}，已读取{filename}中{rows}条" + (f"（{fraction * 100:.0f}%）" if fraction is not None else "")
+            )
+        )
+        worker.signals.finished.connect(self.on_update_finished)
+        worker.signals.failed.connect(self.on_import_failed)
+        worker.signals.cancelled.connect(self.on_import_cancelled)
+        self.import_worker = worker
+        self.start_task(worker)
+
+    def on_update_finished(self, meta):
+        self.import_worker = None
+        self.import_btn.setEnabled(True)
+        self.update_task_state()
+        self.load_history()
+        from delta_import import format_update_stats
+        QMessageBox.information(self, "提示", f"更新完成：{meta['filename']}\n{format_update_stats(meta['last_update'])}")
+        # The data of the open session changed on disk: its cache entry is stale and it is reloaded
+        if self.current_meta and self.current_meta["timestamp"] == meta["timestamp"]:
+            self.start_session_load(meta)
+
+    def on_import_failed(self, message):
+        self.import_worker = None
+        self.import_btn.setEnabled(True)
+        self.update_task_state()
+        QMessageBox.critical(self, "错误", f"导入失败：{message}")
+        self.status_label.setText("等待操作...")
+
+    def on_import_cancelled(self):
+        self.import_worker = None
+        self.import_btn.setEnabled(True)
+        self.update_task_state()
+        self.status_label.setText("导入已取消")
+
+    def start_task(self, worker):
+        for signal in (worker.signals.finished, worker.signals.failed, worker.signals.cancelled):
+            signal.connect(partial(self.release_task, worker))
+        self.tasks.add(worker)
+        self.thread_pool.start(worker)
+        self.update_task_state()
+
+    def release_task(self, worker, *args):
+        self.tasks.discard(worker)
+
+    def update_task_state(self):
+        self.cancel_btn.setVisible(any(
+            worker is not None for worker in (self.import_worker, self.load_worker, self.export_worker, self.merge_worker)
+        ))
+
+    def cancel_tasks(self):
+        for worker in (self.import_worker, self.load_worker, self.export_worker, self.merge_worker):
+            if worker is not None:
+                worker.cancel()
+        self.status_label.setText("正在取消...")
 
     def export_data(self):
-        if self.current_data is None or self.current_data.empty or self.current_meta is None:
-            QMessageBox.warning(self, "警告", "请先选择历史数据")
-            return
-
-        export_df = self.current_data.copy()
-        export_df['jama_details'] = [', '.join(j) if j else '' for j in self.current_jama or [[]] * len(export_df)]
-        export_df['discern_details'] = [', '.join(d) if d else '' for d in self.current_discern or [[]] * len(export_df)]
-        for col_name in self.current_custom_data or {}:
-            # Convert sets to comma-separated strings for multi-select columns
-            col_def = next((col for col in self.custom_columns if col["name"] == col_name), None)
-            if col_def and col_def["type"] == "multi":
-                export_df[col_name] = [', '.join(val) if isinstance(val, set) else val for val in self.current_custom_data[col_name]]
-            else:
-                export_df[col_name] = self.current_custom_data[col_name]
+        from export_engine import EXPORT_FORMATS, frame_source, session_source
+        metas = self.history_manager.get_history()
+        if not metas:
+            QMessageBox.warning(self, "警告", "没有可导出的历史数据")
+            return
+        dialog = ExportDialog(metas, self.current_meta, self)
+        if not dialog.exec_():
+            return
+        fmt, layout, metas = dialog.get_options()
+        if not metas:
+            QMessageBox.warning(self, "警告", "请至少选择一个历史记录")
+            return
 
+        ext = EXPORT_FORMATS[fmt]
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        default_filename = f"{self.current_meta['filename']}_{timestamp}.csv"
-        file_path, _ = QFileDialog.getSaveFileName(self, "保存数据", default_filename, "CSV文件 (*.csv)")
-        if file_path:
-            try:
-                export_df.to_csv(file_path, index=False, encoding='utf-8-sig')
-                QMessageBox.information(self, "提示", f"数据成功导出到 {file_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"导出数据失败：{str(e)}")
+        name = metas[0]["filename"] if len(metas) == 1 else "合并导出"
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存数据", f"{name}_{timestamp}{ext}", f"{ExportDialog.FORMAT_NAMES[fmt]}文件 (*{ext})"
+        )
+        if not file_path:
+            return
+        if not file_path.lower().endswith(ext):
+            file_path += ext
+
+        # The open session is exported from memory (with a snapshot of its annotations),
+        # the others are streamed from the history manager
+        sources = []
+        for meta in metas:
+            if self.current_meta is not None and meta["timestamp"] == self.current_meta["timestamp"] \
+                    and self.current_data is not None:
+                meta = dict(self.current_meta, count=len(self.current_data))
+                sources.append(frame_source(meta, self.current_data, self.current_store.copy()))
+            else:
+                sources.append(session_source(self.history_manager, meta))
+
+        self.export_btn.setEnabled(False)
+        worker = Worker(self.export_task, sources, file_path, fmt, layout)
+        worker.signals.progress.connect(
+            lambda rows, fraction: self.status_label.setText(
+                f"正在导出：已写入{rows}条" + (f"（{fraction * 100:.0f}%）" if fraction is not None else "")
+            )
+        )
+        worker.signals.finished.connect(self.on_export_finished)
+        worker.signals.failed.connect(self.on_export_failed)
+        worker.signals.cancelled.connect(self.on_export_cancelled)
+        self.export_worker = worker
+        self.start_task(worker)
+
+    def export_task(self, sources, file_path, fmt, layout, progress=None):
+        # Runs on the thread pool; pending autosaves of other sessions land first
+        from export_engine import export_sessions
+        self.autosave.wait_idle()
+        return file_path, export_sessions(sources, file_path, fmt, layout, progress=progress)
 
+    def on_export_finished(self, result):
+        file_path, rows = result
+        self.export_worker = None
+        self.export_btn.setEnabled(True)
+        self.update_task_state()
+        self.status_label.setText(f"导出完成，共{rows}条")
+        QMessageBox.information(self, "提示", f"数据成功导出到 {file_path}")
+
+    def on_export_failed(self, message):
+        self.export_worker = None
+        self.export_btn.setEnabled(True)
+        self.update_task_state()
+        QMessageBox.critical(self, "错误", f"导出数据失败：{message}")
+        self.status_label.setText("等待操作...")
+
+    def on_export_cancelled(self):
+        self.export_worker = None
+        self.export_btn.setEnabled(True)
+        self.update_task_state()
+        self.status_label.setText("导出已取消")
+
+    @timed("ui.sort")
     def on_header_clicked(self, logicalIndex):
-        if logicalIndex == 8:  # Skip "查看" column
+        if logicalIndex == VIEW_COLUMN:  # Skip "查看" column
             return
         if self.current_data is None or self.current_data.empty:
             return
@@ -363,7 +1054,7 @@ class App(QMainWindow):
             self.sort_order = Qt.AscendingOrder
         self.sort_column = logicalIndex
 
-        header = self.data_table.horizontalHeaderItem(logicalIndex).text()
+        header = self.table_model.headerData(logicalIndex, Qt.Horizontal)
         column_map = {
             "标题": "title",
             "发布时间": "publish_time",
@@ -381,30 +1072,11 @@ class App(QMainWindow):
         column_map.update({col["name"]: col["name"] for col in self.custom_columns})
         column = column_map.get(header)
 
-        if column and (column in self.current_data.columns or column in self.current_custom_data):
+        if column and (column in self.current_data.columns or column in self.current_store.types or column in self.current_scores):
             try:
-                if column == "publish_time":
-                    self.current_data["publish_time"] = pd.to_datetime(self.current_data["publish_time"], errors='coerce')
-                elif column == "duration" or any(col["name"] == column and col["type"] == "numeric" for col in self.custom_columns):
-                    if column in self.current_data.columns:
-                        self.current_data[column] = pd.to_numeric(self.current_data[column], errors='coerce')
-                    else:
-                        self.current_custom_data[column] = pd.to_numeric(self.current_custom_data[column], errors='coerce')
-                indices = (self.current_data if column in self.current_data.columns else pd.Series(self.current_custom_data[column])).sort_values(
-                    ascending=(self.sort_order == Qt.AscendingOrder),
-                    na_position='last'
-                ).index.tolist()
-                self.current_data = self.current_data.iloc[indices].reset_index(drop=True)
-                self.current_jama = [self.current_jama[i] for i in indices]
-                self.current_gqs = [self.current_gqs[i] for i in indices]
-                self.current_discern = [self.current_discern[i] for i in indices]
-                if self.current_custom_data:
-                    for col in self.current_custom_data:
-                        self.current_custom_data[col] = [self.current_custom_data[col][i] for i in indices]
-                self.load_data_table(
-                    self.current_data, self.current_jama, self.current_gqs,
-                    self.current_discern, self.current_custom_data
-                )
+                # Typed keys and permutations are cached per session; only the view is reordered
+                order = self.sort_keys.order(column, ascending=(self.sort_order == Qt.AscendingOrder))
+                self.table_model.set_order(order)
                 self.data_table.horizontalHeader().setSortIndicator(logicalIndex, self.sort_order)
             except Exception as e:
                 QMessageBox.warning(self, "警告", f"排序失败：{str(e)}")
@@ -413,274 +1085,252 @@ class App(QMainWindow):
         selected_items = self.history_tree.selectedItems()
         if not selected_items:
             return
-        item = selected_items[0]
-        idx = self.history_tree.indexOfTopLevelItem(item)
-        metas = self.history_manager.get_history()
-        meta = metas[idx]
-
-        data_return = self.history_manager.get_data(meta)
-        df = data_return[0]
-        jama = data_return[1] if len(data_return) > 1 else None
-        gqs = data_return[2] if len(data_return) > 2 else None
-        discern = data_return[3] if len(data_return) > 3 else None
-        custom_data = data_return[4] if len(data_return) > 4 else None
-        self.custom_columns = meta.get("custom_columns", [])
+        self.start_session_load(selected_items[0].meta)
+
+    def start_session_load(self, meta):
+        # Pending edits are handed to the autosave thread first; the load waits for them
+        self.autosave.flush()
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            self.load_worker = None
+            self.update_task_state()
+        if self.bind_cached_session(meta):
+            return
+        worker = Worker(self.load_session, meta, self.history_manager.annotator)
+        worker.signals.progress.connect(
+            lambda rows, fraction: self.status_label.setText(f"正在加载：{meta['filename']}，已读取{rows}条")
+        )
+        worker.signals.finished.connect(partial(self.on_session_loaded, worker))
+        worker.signals.failed.connect(partial(self.on_session_failed, worker))
+        worker.signals.cancelled.connect(partial(self.on_session_cancelled, worker))
+        self.load_worker = worker
+        self.status_label.setText(f"正在加载：{meta['filename']}")
+        self.start_task(worker)
+
+    def load_session(self, meta, annotator, progress=None):
+        # Runs on the thread pool; the UI thread only binds the result
+        from search_index import SessionIndex
+        from session_cache import CachedSession, frame_nbytes
+        self.autosave.wait_idle()
+        stamp = self.history_manager.data_stamp(meta)
+        # The layer the cache entry is keyed by, even if the annotator is switched meanwhile
+        df, store = self.history_manager.get_data(meta, progress=progress, annotator=annotator)
+        if progress is not None:
+            progress(len(df), 0.9)
+        return CachedSession(meta, annotator, df, store, stamp, frame_nbytes(df) + store.nbytes, SessionIndex(df, store))
+
+    @timed("ui.session_cached")
+    def bind_cached_session(self, meta):
+        # Rebinds a session still held in the cache; False when it has to be loaded from disk
+        key = (meta["timestamp"], self.history_manager.annotator)
+        if key not in self.session_cache:
+            return False
+        entry = self.session_cache.get(key, self.history_manager.data_stamp(meta))
+        if entry is None:
+            return False
+        # Edits of other processes since it was last shown; our own are written first
+        self.autosave.wait_idle()
+        try:
+            rows = self.history_manager.sync_annotations(entry.meta, entry.store)
+        except Exception as e:
+            logging.error(f"❌ 同步注解失败：{str(e)}")
+            rows = None
+        if rows is None:
+            self.session_cache.remove(key)
+            return False
+        metrics.count("ui.session_cache_hits")
+        self.bind_session(entry)
+        if rows:
+            self.on_annotations_synced(rows)
+        return True
+
+    def on_session_failed(self, worker, message):
+        if worker is not self.load_worker:
+            return
+        self.load_worker = None
+        self.update_task_state()
+        QMessageBox.critical(self, "错误", f"加载数据失败：{message}")
+        self.status_label.setText("等待操作...")
+
+    def on_session_cancelled(self, worker):
+        if worker is not self.load_worker:
+            return
+        self.load_worker = None
+        self.update_task_state()
+        self.status_label.setText("加载已取消")
+
+    @timed("ui.session_bind")
+    def on_session_loaded(self, worker, result):
+        # Results of a load that was superseded by a later selection are dropped
+        if worker is not self.load_worker:
+            return
+        self.load_worker = None
+        self.update_task_state()
+        self.session_cache.put(result)
+        self.bind_session(result)
 
-        if jama is None or not isinstance(jama, list) or not all(isinstance(s, set) for s in jama):
-            jama = [set() for _ in range(len(df))]
-        if gqs is None or not isinstance(gqs, list) or not all(isinstance(s, int) for s in gqs):
-            gqs = [1 for _ in range(len(df))]
-        if discern is None or not isinstance(discern, list) or not all(isinstance(s, set) for s in discern):
-            discern = [set() for _ in range(len(df))]
-        if custom_data is None:
-            custom_data = {col["name"]: [set() if col["type"] == "multi" else "" for _ in range(len(df))] for col in self.custom_columns}
+    def bind_session(self, entry):
+        # Shows a loaded session; sort keys and score columns are built once per cache entry
+        meta, df, store = entry.meta, entry.df, entry.store
+        self.autosave.bind(meta, store)
+        self.custom_columns = meta.get("custom_columns", [])
 
         self.current_meta = meta
         self.current_data = df
-        self.current_jama = jama
-        self.current_gqs = gqs
-        self.current_discern = discern
-        self.current_custom_data = custom_data
-
-        if self.current_data is not None:
-            self.current_data['jama_score'] = [len(j) for j in self.current_jama]
-            self.current_data['gqs_score'] = self.current_gqs
-            self.current_data['discern_score'] = [len(d) for d in self.current_discern]
-            for col in self.current_custom_data:
-                self.current_data[col] = self.current_custom_data[col]
+        self.current_store = store
 
+        if entry.scores is None:
+            from sort_keys import SortKeyCache
+            self.init_scores()
+            entry.scores = self.current_scores
+            entry.sort_keys = SortKeyCache(df, store, self.current_scores)
+        self.current_scores = entry.scores
+        self.sort_keys = entry.sort_keys
+        self.search_index = entry.search_index
+        self.current_analytics = entry.analytics
+
+        self.sort_column = -1
+        self.data_table.horizontalHeader().setSortIndicator(-1, self.sort_order)
         self.update_table_columns()
-        self.load_data_table(df, jama, gqs, discern, custom_data)
+        self.load_data_table(df, store)
+        if self.filter_edit.text().strip():
+            self.apply_filter()
+        metrics.count("ui.rows_loaded", len(df))
+        self.status_label.setText(f"加载完成：{meta['filename']}，数据量：{len(df)}")
+
+    @timed("ui.filter")
+    def apply_filter(self):
+        if self.search_index is None:
+            return
+        try:
+            mask = self.search_index.query(self.filter_edit.text())
+        except ValueError as e:
+            self.filter_count_label.setText(f"条件无效：{str(e)}")
+            return
+        self.table_model.set_filter(mask)
+        if mask is None:
+            self.filter_count_label.setText("")
+        else:
+            self.filter_count_label.setText(f"显示 {self.table_model.rowCount()} / {len(self.current_data)} 行")
+
+    def init_scores(self):
+        self.current_scores = {
+            "jama_score": self.current_store.scores("jama"),
+            "gqs_score": self.current_store.values("gqs"),
+            "discern_score": self.current_store.scores("discern"),
+        }
 
     def load_history(self):
+        self.fill_history_tree(self.history_manager.get_history())
+
+    def fill_history_tree(self, metas):
         self.history_tree.clear()
-        metas = self.history_manager.get_history()
         for meta in metas:
             try:
                 ts_fmt = datetime.strptime(meta["timestamp"], "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
             except:
                 ts_fmt = meta.get("timestamp", "")
-            item = QTreeWidgetItem([
+            item = HistoryItem(meta, [
                 ts_fmt,
                 meta["filename"],
                 str(meta["count"])
             ])
             self.history_tree.addTopLevelItem(item)
 
-    def load_data_table(self, df, jama, gqs, discern, custom_data=None):
-        self.data_table.setRowCount(len(df))
-        self.jama_checkboxes = []
-        self.discern_checkboxes = []
-        self.custom_widgets = {col["name"]: [] for col in self.custom_columns}
-        for i, row in df.iterrows():
-            selected_jama_items = jama[i] if i < len(jama) else set()
-            jama_score = len(selected_jama_items)
-            selected_discern_items = discern[i] if i < len(discern) else set()
-            discern_score = len(selected_discern_items)
-
-            self.data_table.setItem(i, 0, QTableWidgetItem(str(row.get("title", ""))))
-            self.data_table.setItem(i, 1, QTableWidgetItem(str(row.get("publish_time", ""))))
-            self.data_table.setItem(i, 2, QTableWidgetItem(str(row.get("author_name", ""))))
-            self.data_table.setItem(i, 3, QTableWidgetItem(str(int(row.get("like_count", 0)) if not pd.isna(row.get("like_count")) else 0)))
-            self.data_table.setItem(i, 4, QTableWidgetItem(str(int(row.get("comment_count", 0)) if not pd.isna(row.get("comment_count")) else 0)))
-            self.data_table.setItem(i, 5, QTableWidgetItem(str(int(row.get("share_count", 0)) if not pd.isna(row.get("share_count")) else 0)))
-            self.data_table.setItem(i, 6, QTableWidgetItem(str(int(row.get("collect_count", 0)) if not pd.isna(row.get("collect_count")) else 0)))
-            self.data_table.setItem(i, 7, QTableWidgetItem(str(row.get("is_verified", ""))))
-            self.data_table.setItem(i, 8, QTableWidgetItem("查看"))
-            self.data_table.setItem(i, 9, QTableWidgetItem(str(row.get("duration", ""))))
-
-            # JAMA annotation
-            jama_widget = QWidget()
-            jama_layout = QHBoxLayout(jama_widget)
-            jama_layout.setContentsMargins(0, 0, 0, 0)
-            jama_layout.setSpacing(5)
-            row_jama_checkboxes = {}
-            for item in self.jama_items:
-                cb = QCheckBox(item)
-                cb.setChecked(item in selected_jama_items)
-                cb.stateChanged.connect(lambda state, r=i, it=item: self.update_jama(r, it, state))
-                jama_layout.addWidget(cb)
-                row_jama_checkboxes[item] = cb
-            jama_score_label = QLabel(f"({jama_score}/4)")
-            jama_layout.addWidget(jama_score_label)
-            jama_layout.addStretch()
-            self.data_table.setCellWidget(i, 10, jama_widget)
-            self.jama_checkboxes.append(row_jama_checkboxes)
-
-            # GQS annotation
-            gqs_widget = QWidget()
-            gqs_layout = QHBoxLayout(gqs_widget)
-            gqs_layout.setContentsMargins(0, 0, 0, 0)
-            gqs_layout.setSpacing(5)
-            gqs_combo = QComboBox()
-            gqs_combo.addItems(self.gqs_items)
-            current_gqs_score = gqs[i] if i < len(gqs) else 1
-            if current_gqs_score > 0:
-                gqs_combo.setCurrentIndex(current_gqs_score - 1)
-            gqs_combo.currentIndexChanged.connect(lambda idx, r=i: self.update_gqs(r, idx + 1))
-            gqs_layout.addWidget(gqs_combo)
-            gqs_score_label = QLabel(f"({gqs_combo.currentIndex() + 1}/5)")
-            gqs_layout.addWidget(gqs_score_label)
-            gqs_layout.addStretch()
-            self.data_table.setCellWidget(i, 11, gqs_widget)
-
-            # DISCERN annotation
-            discern_widget = QWidget()
-            discern_layout = QHBoxLayout(discern_widget)
-            discern_layout.setContentsMargins(0, 0, 0, 0)
-            discern_layout.setSpacing(5)
-            row_discern_checkboxes = {}
-            for item in self.discern_items:
-                cb = QCheckBox(item)
-                cb.setChecked(item in selected_discern_items)
-                cb.stateChanged.connect(lambda state, r=i, it=item: self.update_discern(r, it, state))
-                discern_layout.addWidget(cb)
-                row_discern_checkboxes[item] = cb
-            discern_score_label = QLabel(f"({discern_score}/5)")
-            discern_layout.addWidget(discern_score_label)
-            discern_layout.addStretch()
-            self.data_table.setCellWidget(i, 12, discern_widget)
-            self.discern_checkboxes.append(row_discern_checkboxes)
-
-            # Custom columns
-            for col_idx, col_def in enumerate(self.custom_columns, 13):
-                col_name = col_def["name"]
-                col_type = col_def["type"]
-                current_value = custom_data.get(col_name, [set() if col_type == "multi" else "" for _ in range(len(df))])[i]
-                widget = QWidget()
-                layout = QHBoxLayout(widget)
-                layout.setContentsMargins(0, 0, 0, 0)
-                layout.setSpacing(5)
-                if col_type == "numeric":
-                    line_edit = QLineEdit()
-                    line_edit.setText(str(current_value))
-                    line_edit.textChanged.connect(lambda text, r=i, cn=col_name: self.update_custom_data(r, cn, text))
-                    layout.addWidget(line_edit)
-                    layout.addStretch()
-                elif col_type == "enum":
-                    combo = QComboBox()
-                    combo.addItems(["未选择"] + col_def["enum_values"])
-                    combo.setCurrentText(str(current_value) if current_value else "未选择")
-                    combo.currentTextChanged.connect(lambda text, r=i, cn=col_name: self.update_custom_data(r, cn, text))
-                    layout.addWidget(combo)
-                    layout.addStretch()
-                else:  # multi
-                    multi_widget = QWidget()
-                    multi_layout = QHBoxLayout(multi_widget)
-                    multi_layout.setContentsMargins(0, 0, 0, 0)
-                    multi_layout.setSpacing(5)
-                    row_multi_checkboxes = {}
-                    for item in col_def["enum_values"]:
-                        cb = QCheckBox(item)
-                        cb.setChecked(item in current_value)
-                        cb.stateChanged.connect(lambda state, r=i, cn=col_name, it=item: self.update_custom_multi(r, cn, it, state))
-                        multi_layout.addWidget(cb)
-                        row_multi_checkboxes[item] = cb
-                    score_label = QLabel(f"({len(current_value)}/{len(col_def['enum_values'])})")
-                    multi_layout.addWidget(score_label)
-                    multi_layout.addStretch()
-                    layout.addWidget(multi_widget)
-                    self.custom_widgets[col_name].append(row_multi_checkboxes)
-                self.data_table.setCellWidget(i, col_idx, widget)
-                if col_type != "multi":
-                    self.custom_widgets[col_name].append(widget)
+    @timed("ui.load_data_table")
+    def load_data_table(self, df, store):
+        self.table_model.set_session(df, store, self.custom_columns)
+
+    @timed("ui.cell_edit")
+    def on_cell_edited(self, row, col, value):
+        metrics.count("ui.cells_edited")
+        if self.sort_keys is not None:
+            self.sort_keys.invalidate(self.sort_key_name(col))
+        if self.search_index is not None:
+            self.search_index.invalidate(self.table_model.column_field(col))
+        for analytics in self.current_analytics.values():
+            analytics.invalidate_rows([row])
+        if col == JAMA_COLUMN:
+            item, checked = value
+            self.update_jama(row, item, Qt.Checked if checked else Qt.Unchecked)
+        elif col == GQS_COLUMN:
+            self.update_gqs(row, value)
+        elif col == DISCERN_COLUMN:
+            item, checked = value
+            self.update_discern(row, item, Qt.Checked if checked else Qt.Unchecked)
+        elif col >= CUSTOM_COLUMN_START:
+            col_def = self.custom_columns[col - CUSTOM_COLUMN_START]
+            if col_def["type"] == "multi":
+                item, checked = value
+                self.update_custom_multi(row, col_def["name"], item, Qt.Checked if checked else Qt.Unchecked)
+            else:
+                self.update_custom_data(row, col_def["name"], value)
+        self.autosave.mark_dirty()
+
+    def sort_key_name(self, col):
+        if col == JAMA_COLUMN:
+            return "jama_score"
+        if col == GQS_COLUMN:
+            return "gqs_score"
+        if col == DISCERN_COLUMN:
+            return "discern_score"
+        return self.custom_columns[col - CUSTOM_COLUMN_START]["name"]
 
     def update_jama(self, row, item, state):
-        if not self.current_jama or row >= len(self.current_jama):
+        if self.current_store is None or row >= self.current_store.n_rows:
             return
-        if not isinstance(self.current_jama[row], set):
-            self.current_jama[row] = set()
-        if state == Qt.Checked:
-            self.current_jama[row].add(item)
-        else:
-            self.current_jama[row].discard(item)
-        score = len(self.current_jama[row])
-        if 0 <= row < self.data_table.rowCount():
-            jama_widget = self.data_table.cellWidget(row, 10)
-            if jama_widget and jama_widget.layout():
-                score_label = jama_widget.layout().itemAt(jama_widget.layout().count() - 1).widget()
-                if score_label:
-                    score_label.setText(f"({score}/4)")
-        self.current_data['jama_score'] = [len(j) for j in self.current_jama]
+        self.current_store.set_item("jama", row, item, state == Qt.Checked)
+        self.table_model.refresh_cell(row, JAMA_COLUMN)
+        self.current_scores["jama_score"][row] = self.current_store.score("jama", row)
 
     def update_gqs(self, row, score):
-        if not self.current_gqs or row >= len(self.current_gqs):
+        if self.current_store is None or row >= self.current_store.n_rows:
             return
-        self.current_gqs[row] = score
-        if 0 <= row < self.data_table.rowCount():
-            gqs_widget = self.data_table.cellWidget(row, 11)
-            if gqs_widget and gqs_widget.layout():
-                score_label = gqs_widget.layout().itemAt(1).widget()
-                if score_label:
-                    score_label.setText(f"({score}/5)")
-        self.current_data['gqs_score'] = self.current_gqs
+        self.current_store.set_value("gqs", row, score)
+        self.table_model.refresh_cell(row, GQS_COLUMN)
+        self.current_scores["gqs_score"][row] = score
 
     def update_discern(self, row, item, state):
-        if not self.current_discern or row >= len(self.current_discern):
+        if self.current_store is None or row >= self.current_store.n_rows:
             return
-        if not isinstance(self.current_discern[row], set):
-            self.current_discern[row] = set()
-        if state == Qt.Checked:
-            self.current_discern[row].add(item)
-        else:
-            self.current_discern[row].discard(item)
-        score = len(self.current_discern[row])
-        if 0 <= row < self.data_table.rowCount():
-            discern_widget = self.data_table.cellWidget(row, 12)
-            if discern_widget and discern_widget.layout():
-                score_label = discern_widget.layout().itemAt(discern_widget.layout().count() - 1).widget()
-                if score_label:
-                    score_label.setText(f"({score}/5)")
-        self.current_data['discern_score'] = [len(d) for d in self.current_discern]
+        self.current_store.set_item("discern", row, item, state == Qt.Checked)
+        self.table_model.refresh_cell(row, DISCERN_COLUMN)
+        self.current_scores["discern_score"][row] = self.current_store.score("discern", row)
 
     def update_custom_data(self, row, column_name, value):
-        if not self.current_custom_data or row >= len(self.current_data):
+        if self.current_store is None or row >= self.current_store.n_rows:
             return
         try:
             if any(col["name"] == column_name and col["type"] == "numeric" for col in self.custom_columns):
                 value = float(value) if value.strip() else ""
-            self.current_custom_data[column_name][row] = value
-            self.current_data[column_name] = self.current_custom_data[column_name]
+            elif value == "未选择":
+                value = ""
+            self.current_store.set_value(column_name, row, value)
+            col_idx = CUSTOM_COLUMN_START + [col["name"] for col in self.custom_columns].index(column_name)
+            self.table_model.refresh_cell(row, col_idx)
         except ValueError:
             QMessageBox.warning(self, "警告", f"请输入有效的数字到 {column_name}")
 
     def update_custom_multi(self, row, column_name, item, state):
-        if not self.current_custom_data or row >= len(self.current_data):
+        if self.current_store is None or row >= self.current_store.n_rows:
             return
-        if not isinstance(self.current_custom_data[column_name][row], set):
-            self.current_custom_data[column_name][row] = set()
-        if state == Qt.Checked:
-            self.current_custom_data[column_name][row].add(item)
-        else:
-            self.current_custom_data[column_name][row].discard(item)
-        score = len(self.current_custom_data[column_name][row])
-        col_def = next((col for col in self.custom_columns if col["name"] == column_name), None)
-        if col_def and 0 <= row < self.data_table.rowCount():
-            col_idx = 13 + [col["name"] for col in self.custom_columns].index(column_name)
-            cell_widget = self.data_table.cellWidget(row, col_idx)
-            if cell_widget and cell_widget.layout():
-                multi_widget = cell_widget.layout().itemAt(0).widget()
-                if multi_widget and multi_widget.layout():
-                    score_label = multi_widget.layout().itemAt(multi_widget.layout().count() - 1).widget()
-                    if score_label:
-                        score_label.setText(f"({score}/{len(col_def['enum_values'])})")
-        self.current_data[column_name] = self.current_custom_data[column_name]
+        self.current_store.set_item(column_name, row, item, state == Qt.Checked)
+        col_idx = CUSTOM_COLUMN_START + [col["name"] for col in self.custom_columns].index(column_name)
+        self.table_model.refresh_cell(row, col_idx)
 
     def on_data_click(self, row, col):
-        if col == 8:  # 查看列
+        if col == VIEW_COLUMN:  # 查看列
             url = self.current_data.loc[row, "video_url"] if self.current_data is not None and row < len(self.current_data) else None
             if not url:
                 url = self.current_data.loc[row, "note_url"] if self.current_data is not None and row < len(self.current_data) else None
             if url:
+                import webbrowser
                 webbrowser.open_new_tab(url)
 
     def save_records(self):
-        if self.current_meta and self.current_jama and self.current_gqs and self.current_discern:
+        if self.current_meta and self.current_store is not None:
             try:
-                self.history_manager.save_annotations(
-                    self.current_meta, self.current_jama, self.current_gqs,
-                    self.current_discern, self.current_custom_data
-                )
+                self.history_manager.save_annotations(self.current_meta, self.current_store)
                 QMessageBox.information(self, "提示", "记录保存成功")
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"保存记录失败：{str(e)}")
@@ -690,27 +1340,32 @@ class App(QMainWindow):
         if not selected_items:
             QMessageBox.warning(self, "提示", "请先选择要删除的历史记录")
             return
-        item = selected_items[0]
-        idx = self.history_tree.indexOfTopLevelItem(item)
-        metas = self.history_manager.get_history()
-        meta = metas[idx]
+        meta = selected_items[0].meta
         reply = QMessageBox.question(
             self, "确认删除", f"确定要删除文件 {meta['filename']} 的记录吗？",
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No
         )
         if reply == QMessageBox.Yes:
+            if self.load_worker is not None and self.load_worker.args[0]["timestamp"] == meta["timestamp"]:
+                self.load_worker.cancel()
+                self.load_worker = None
+                self.update_task_state()
+            if self.current_meta and self.current_meta["timestamp"] == meta["timestamp"]:
+                self.autosave.bind(None, None, flush=False)
+            self.session_cache.discard(meta["timestamp"])
             try:
                 success = self.history_manager.delete_history(meta)
                 if success:
                     QMessageBox.information(self, "提示", "删除成功")
                     self.load_history()
-                    self.data_table.clearContents()
+                    self.table_model.clear()
                     self.current_meta = None
                     self.current_data = None
-                    self.current_jama = None
-                    self.current_gqs = None
-                    self.current_discern = None
-                    self.current_custom_data = None
+                    self.current_store = None
+                    self.current_scores = None
+                    self.sort_keys = None
+                    self.search_index = None
+                    self.filter_count_label.setText("")
                     self.custom_columns = []
                     self.update_table_columns()
                 else:
@@ -718,6 +1373,185 @@ class App(QMainWindow):
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"删除历史记录失败：{str(e)}")
 
+    def update_window_title(self):
+        annotator = self.history_manager.annotator if self.history_manager is not None else ""
+        self.setWindowTitle(f"Label Tool v1.0 - 标注员：{annotator}" if annotator else "Label Tool v1.0")
+
+    def switch_annotator(self):
+        from history_manager import check_annotator
+        name, ok = QInputDialog.getText(
+            self, "切换标注员", "标注员名称（留空为主标注）:", text=self.history_manager.annotator
+        )
+        if not ok:
+            return
+        try:
+            name = check_annotator(name)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        # Edits so far belong to the previous layer: they are written before switching
+        self.autosave.flush()
+        self.autosave.wait_idle()
+        self.history_manager.annotator = name
+        self.update_window_title()
+        if self.current_meta is not None:
+            self.start_session_load(self.current_meta)
+
+    def merge_annotators(self):
+        if self.current_meta is None:
+            QMessageBox.warning(self, "提示", "请先选择历史记录")
+            return
+        annotators = self.history_manager.list_annotators(self.current_meta)
+        if not annotators:
+            QMessageBox.warning(self, "提示", "该历史记录还没有标注员的标注")
+            return
+        dialog = MergeDialog(annotators, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        annotators, strategy, target = dialog.get_options()
+        if not annotators:
+            QMessageBox.warning(self, "提示", "请至少选择一个标注员")
+            return
+        self.autosave.flush()
+        worker = Worker(self.merge_task, self.current_meta, annotators, strategy, target)
+        worker.signals.finished.connect(self.on_merge_finished)
+        worker.signals.failed.connect(self.on_merge_failed)
+        worker.signals.cancelled.connect(self.on_merge_cancelled)
+        self.merge_worker = worker
+        self.status_label.setText("正在合并标注...")
+        self.start_task(worker)
+
+    def merge_task(self, meta, annotators, strategy, target, progress=None):
+        from annotation_merge import merge_annotations
+        self.autosave.wait_idle()
+        progress(0)  # last point to cancel before the target layer is overwritten
+        merge_annotations(self.history_manager, meta, annotators, strategy, target)
+        return meta, target
+
+    def on_merge_finished(self, result):
+        self.merge_worker = None
+        self.update_task_state()
+        meta, target = result
+        self.status_label.setText(f"合并完成：{meta['filename']} → {target or '主标注'}")
+        # The open layer was overwritten: show the merged result
+        if self.current_meta is not None and meta["timestamp"] == self.current_meta["timestamp"] \
+                and target == self.history_manager.annotator:
+            self.start_session_load(meta)
+
+    def on_merge_failed(self, message):
+        self.merge_worker = None
+        self.update_task_state()
+        QMessageBox.critical(self, "错误", f"合并标注失败：{message}")
+        self.status_label.setText("等待操作...")
+
+    def on_merge_cancelled(self):
+        self.merge_worker = None
+        self.update_task_state()
+        self.status_label.setText("合并已取消")
+
+    def show_reliability(self):
+        if self.current_meta is None:
+            QMessageBox.warning(self, "提示", "请先选择历史记录")
+            return
+        annotators = self.history_manager.list_annotators(self.current_meta)
+        if not annotators:
+            QMessageBox.warning(self, "提示", "该历史记录还没有标注员的标注")
+            return
+        ReliabilityDialog(self, self.current_meta, annotators).exec_()
+
+    def reliability_task(self, meta, annotators, progress=None):
+        from reliability import load_sources, analyze
+        self.autosave.wait_idle()
+        sources = load_sources(self.history_manager, [meta], annotators)
+        return analyze(sources, jobs=os.cpu_count() or 1, progress=progress)
+
+    def sync_annotations(self):
+        # Only while nothing of ours is waiting to be written, so synced rows never race an autosave
+        if self.current_store is None or self.load_worker is not None or self.autosave.pending_rows:
+            return
+        try:
+            rows = self.history_manager.sync_annotations(self.current_meta, self.current_store)
+        except Exception as e:
+            logging.error(f"❌ 同步注解失败：{str(e)}")
+            return
+        if rows is None:
+            # Compacted elsewhere since we loaded it
+            self.start_session_load(self.current_meta)
+        elif rows:
+            self.on_annotations_synced(rows)
+
+    def on_annotations_synced(self, rows):
+        store = self.current_store
+        for name, values in (("jama_score", store.scores("jama")), ("gqs_score", store.values("gqs")),
+                             ("discern_score", store.scores("discern"))):
+            self.current_scores[name][:] = values
+        for field in list(store.fields()) + list(self.current_scores):
+            if self.sort_keys is not None:
+                self.sort_keys.invalidate(field)
+            if self.search_index is not None:
+                self.search_index.invalidate(field)
+        for analytics in self.current_analytics.values():
+            analytics.invalidate_rows(rows)
+        self.table_model.refresh_annotations()
+        self.status_label.setText(f"已同步其他进程的标注：{len(rows)}行")
+
+    def show_analytics(self):
+        if self.analytics_dialog is None:
+            self.analytics_dialog = AnalyticsDialog(self)
+        self.analytics_dialog.show()
+        self.analytics_dialog.raise_()
+
+    def session_analytics(self, by):
+        # Aggregates of the open session, kept with its cache entry and updated per edited row
+        from analytics import SessionAnalytics
+        analytics = self.current_analytics.get(by)
+        if analytics is None:
+            analytics = self.current_analytics[by] = SessionAnalytics(self.current_data, self.current_store, by)
+        return analytics
+
+    def analytics_task(self, by, progress=None):
+        # Runs on the thread pool: every session but the open one, from what is stored; cached
+        # aggregates only re-add the rows whose annotations changed since the last run
+        from analytics import AnalyticsCache
+        if self.analytics_cache is None:
+            self.analytics_cache = AnalyticsCache(self.history_manager)
+        self.autosave.wait_idle()
+        current = self.current_meta["timestamp"] if self.current_meta is not None else None
+        metas = [meta for meta in self.history_manager.get_history() if meta["timestamp"] != current]
+        parts = []
+        for i, meta in enumerate(metas):
+            progress(i, i / len(metas))
+            parts.append(self.analytics_cache.get(meta, by).aggregates().copy())
+        return parts
+
+    def toggle_profiling(self):
+        if profiler.active:
+            try:
+                paths = profiler.stop()
+                QMessageBox.information(self, "提示", "性能分析结果已保存：\n" + "\n".join(paths))
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"保存性能分析结果失败：{str(e)}")
+        else:
+            profiler.start(cpu=True, memory=True)
+        self.update_profile_action()
+
+    def update_profile_action(self):
+        self.profile_action.setText("停止性能分析并保存" if profiler.active else "开始性能分析（cProfile + tracemalloc）")
+
+    def closeEvent(self, event):
+        # Stop background tasks, then write pending annotation edits before the window goes away
+        self.sync_timer.stop()
+        for worker in (self.import_worker, self.load_worker, self.export_worker, self.merge_worker):
+            if worker is not None:
+                worker.cancel()
+        self.thread_pool.waitForDone()
+        if self.autosave is not None:
+            self.autosave.stop()
+            self.session_cache.clear()
+        if profiler.active:
+            profiler.stop()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = App()
@@ -0,0 +1,338 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from annotation_store import MAX_BITMASK_ITEMS, popcount
+from label_items import GQS_ITEMS
+from instrumentation import timed
+
+# Score summaries over the annotated rows (an untouched row would count as GQS 1 and score 0),
+# grouped by a data column (is_verified, author_name, ...) or by a GQS/enum annotation field.
+# Everything is kept as per-group sums, so a changed row is subtracted with its old values and
+# added with its new ones, and the aggregates of several sessions simply add up.
+ALL_GROUP = "全部"
+EMPTY_GROUP = "（空）"
+GROUP_COLUMNS = ("is_verified", "author_name", "author_official_role")  # offered besides the enum fields
+SCORE_FIELDS = ("jama", "gqs", "discern")
+
+
+class Aggregates:
+    # Per-group sums of one or more sessions. Each block is (column labels, groups x columns
+    # array) and is keyed (field, kind), kind one of
+    #   "score"   rows per score value          "items"   rows per checked item of a multi field
+    #   "enum"    rows per enum value           "numeric" filled rows and sum of a numeric field
+    # Blocks are matched by label when sessions are combined, so different vocabularies add up.
+    def __init__(self, by, groups):
+        self.by = by
+        self.groups = list(groups)
+        self.rows = np.zeros(len(self.groups))
+        self.annotated = np.zeros(len(self.groups))
+        self.blocks = {}
+        self.sessions = 1
+
+    def block(self, key, labels):
+        if key not in self.blocks:
+            self.blocks[key] = (list(labels), np.zeros((len(self.groups), len(labels))))
+        return self.blocks[key][1]
+
+    def copy(self):
+        result = Aggregates(self.by, self.groups)
+        result.rows = self.rows.copy()
+        result.annotated = self.annotated.copy()
+        result.blocks = {key: (list(labels), values.copy()) for key, (labels, values) in self.blocks.items()}
+        result.sessions = self.sessions
+        return result
+
+
+def combine(parts):
+    # Adds up the aggregates of several sessions, aligning groups and block columns by label
+    parts = list(parts)
+    if not parts:
+        return Aggregates("", [])
+    groups = list(dict.fromkeys(group for part in parts for group in part.groups))
+    result = Aggregates(parts[0].by, groups)
+    result.sessions = sum(part.sessions for part in parts)
+    position = {group: i for i, group in enumerate(groups)}
+    for part in parts:
+        rows = np.array([position[group] for group in part.groups], dtype=np.int64)
+        result.rows[rows] += part.rows
+        result.annotated[rows] += part.annotated
+        for key, (labels, values) in part.blocks.items():
+            known, total = result.blocks.get(key, ([], np.zeros((len(groups), 0))))
+            added = [label for label in labels if label not in known]
+            if added:
+                known = known + added
+                total = np.hstack([total, np.zeros((len(groups), len(added)))])
+            columns = [known.index(label) for label in labels]
+            total[np.ix_(rows, columns)] += values
+            result.blocks[key] = (known, total)
+    return result
+
+
+def _factorize(column, n_rows):
+    # Group codes of a data column; values as text, so 1 / "1" / 1.0 fall into one group
+    values = column.astype(object).where(column.notna(), "").map(str).str.strip()
+    codes, uniques = pd.factorize(values, sort=True)
+    labels = [label or EMPTY_GROUP for label in uniques]
+    if len(codes) < n_rows:  # rows the frame does not have
+        if EMPTY_GROUP not in labels:
+            labels.append(EMPTY_GROUP)
+        codes = np.concatenate([codes, np.full(n_rows - len(codes), labels.index(EMPTY_GROUP))])
+    return codes[:n_rows].astype(np.int64), labels
+
+
+class SessionAnalytics:
+    # Live aggregates of one loaded session. invalidate_rows() after editing rows of the store;
+    # aggregates() then re-adds only those rows, vectorized. A changed row count or set of
+    # fields (custom column added or deleted) rebuilds everything.
+    def __init__(self, df, store, by=""):
+        self.df = df
+        self.store = store
+        self.by = by
+        self.version = 0  # increases whenever the aggregates change
+        self._pending = set()
+        self._build()
+
+    def _build(self):
+        store = self.store
+        self.n_rows = store.n_rows
+        self.fields = store.fields()
+        self.types = dict(store.types)
+        self.vocab = {field: list(values) for field, values in store.vocab.items()}
+        by = self.by
+        if not by:
+            self._codes, labels = np.zeros(self.n_rows, dtype=np.int64), [ALL_GROUP]
+        elif by in self.types:
+            if self.types[by] == "gqs":
+                labels = list(GQS_ITEMS)
+            elif self.types[by] == "enum":
+                labels = [EMPTY_GROUP] + self.vocab[by]
+            else:
+                raise ValueError(f"不能按多选或数值字段分组：{by}")
+            self._codes = None  # follows the annotations, see _group_codes()
+        elif self.df is not None and by in self.df.columns:
+            self._codes, labels = _factorize(self.df[by], self.n_rows)
+        else:
+            # A field of other sessions only: all rows fall into the empty group
+            self._codes, labels = np.zeros(self.n_rows, dtype=np.int64), [EMPTY_GROUP]
+        self.result = Aggregates(by, labels)
+        self._snapshot = self._row_values(np.arange(self.n_rows))
+        self._accumulate(self._snapshot, 1)
+        self._pending = set()
+        self.version += 1
+
+    def _group_codes(self, rows):
+        if self._codes is not None:
+            return self._codes[rows]
+        values = self.store.arrays[self.by][rows].astype(np.int64)
+        return values.clip(1, len(GQS_ITEMS)) - 1 if self.types[self.by] == "gqs" else values
+
+    def _scores(self, field, rows, full):
+        if full:
+            return self.store.scores(field)
+        counts = popcount(self.store.arrays[field][rows])
+        overflow = self.store.overflow
+        if overflow:
+            counts += np.array([len(overflow.get((field, int(row)), ())) for row in rows], dtype=np.int64)
+        return counts
+
+    def _row_values(self, rows):
+        # What the rows contribute: group, annotated flag and per-field values
+        full = len(rows) == self.n_rows
+        annotated = self.store.annotated()
+        values = {"codes": self._group_codes(rows), "annotated": annotated if full else annotated[rows]}
+        for field in self.fields:
+            col_type = self.types[field]
+            values[field] = self.store.arrays[field][rows]
+            if col_type == "multi":
+                values[(field, "score")] = self._scores(field, rows, full)
+        return values
+
+    def _accumulate(self, values, sign):
+        result = self.result
+        n_groups = len(result.groups)
+        codes = values["codes"]
+        annotated = values["annotated"]
+        groups = codes[annotated]
+        result.rows += sign * np.bincount(codes, minlength=n_groups)
+        result.annotated += sign * np.bincount(groups, minlength=n_groups)
+
+        def add(key, labels, columns):
+            # columns: label index per annotated row; counted per (group, label) in one bincount
+            width = len(labels)
+            counts = np.bincount(groups * width + columns, minlength=n_groups * width)
+            result.block(key, labels)[:] += sign * counts.reshape(n_groups, width)
+
+        for field in self.fields:
+            col_type = self.types[field]
+            column = values[field][annotated]
+            if col_type == "gqs":
+                add((field, "score"), list(range(1, len(GQS_ITEMS) + 1)), column.astype(np.int64).clip(1, len(GQS_ITEMS)) - 1)
+            elif col_type == "multi":
+                vocab = self.vocab[field][:MAX_BITMASK_ITEMS]
+                if field in SCORE_FIELDS:
+                    scores = values[(field, "score")][annotated]
+                    add((field, "score"), list(range(len(vocab) + 1)), scores.clip(0, len(vocab)))
+                items = result.block((field, "items"), vocab)
+                for bit in range(len(vocab)):
+                    checked = ((column >> column.dtype.type(bit)) & 1).astype(np.float64)
+                    items[:, bit] += sign * np.bincount(groups, weights=checked, minlength=n_groups)
+            elif col_type == "enum":
+                vocab = self.vocab[field]
+                if vocab:
+                    chosen = column > 0
+                    counts = np.bincount(groups[chosen] * len(vocab) + column[chosen].astype(np.int64) - 1,
+                                         minlength=n_groups * len(vocab))
+                    result.block((field, "enum"), vocab)[:] += sign * counts.reshape(n_groups, len(vocab))
+            else:
+                filled = ~np.isnan(column)
+                numeric = result.block((field, "numeric"), ["filled", "sum"])
+                numeric[:, 0] += sign * np.bincount(groups[filled], minlength=n_groups)
+                numeric[:, 1] += sign * np.bincount(groups[filled], weights=column[filled], minlength=n_groups)
+
+    def invalidate_rows(self, rows):
+        self._pending.update(rows)
+
+    @timed("analytics.refresh")
+    def refresh(self):
+        store = self.store
+        if store.n_rows != self.n_rows or store.fields() != self.fields or any(
+                store.vocab.get(field) != vocab for field, vocab in self.vocab.items()):
+            self._build()
+            return
+        if not self._pending:
+            return
+        rows = np.array(sorted(row for row in self._pending if row < self.n_rows), dtype=np.int64)
+        self._pending = set()
+        old = {key: values[rows] for key, values in self._snapshot.items()}
+        new = self._row_values(rows)
+        self._accumulate(old, -1)
+        self._accumulate(new, 1)
+        for key, values in new.items():
+            self._snapshot[key][rows] = values
+        self.version += 1
+
+    def aggregates(self):
+        self.refresh()
+        return self.result
+
+
+class AnalyticsCache:
+    # Aggregates of sessions that are not open, kept with the annotations they were built from:
+    # a later request pulls in the rows changed since (sync_annotations) and re-adds only those.
+    # A session whose data changed (data_stamp) is rebuilt.
+    def __init__(self, manager):
+        self.manager = manager
+        self._entries = {}  # (timestamp, annotator, by) -> (data stamp, SessionAnalytics)
+        self._lock = threading.Lock()  # a superseded task may still be running
+
+    def get(self, meta, by="", annotator=None):
+        with self._lock:
+            return self._get(meta, by, annotator)
+
+    def _get(self, meta, by, annotator):
+        manager = self.manager
+        annotator = manager.annotator if annotator is None else annotator
+        key = (meta["timestamp"], annotator, by)
+        stamp = manager.data_stamp(meta)
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] == stamp:
+            rows = manager.sync_annotations(meta, cached[1].store, annotator)
+            if rows is not None:
+                cached[1].invalidate_rows(rows)
+                return cached[1]
+        n_rows = meta.get("count", 0)
+        df = None
+        if by and by in manager.data_columns(meta):
+            # Only the group column is kept
+            df = pd.concat([chunk[[by]] for chunk in manager.iter_data(meta)], ignore_index=True)
+        store = manager.load_annotations(meta, n_rows, annotator)
+        analytics = SessionAnalytics(df, store, by)
+        self._entries[key] = (stamp, analytics)
+        return analytics
+
+    def discard(self, timestamp):
+        for key in [key for key in self._entries if key[0] == timestamp]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _rates(counts, total):
+    return [float(count / total) if total else None for count in counts]
+
+
+def _summary(result, i):
+    # One group (row i of the aggregates) as plain JSON-ready values
+    annotated = float(result.annotated[i])
+    summary = {
+        "group": result.groups[i],
+        "rows": int(result.rows[i]),
+        "annotated": int(annotated),
+        "distributions": {},
+        "pass_rates": {},
+        "custom": {},
+    }
+    for (field, kind), (labels, values) in result.blocks.items():
+        row = values[i]
+        if kind == "score":
+            summary[f"{field}_mean"] = float(np.dot(labels, row) / annotated) if annotated else None
+            names = GQS_ITEMS if field == "gqs" else [str(label) for label in labels]
+            summary["distributions"][field] = {name: int(count) for name, count in zip(names, row)}
+        elif kind == "items":
+            summary["pass_rates"][field] = dict(zip(labels, _rates(row, annotated)))
+        elif kind == "enum":
+            summary["custom"][field] = {"counts": {label: int(count) for label, count in zip(labels, row)}}
+        else:
+            summary["custom"][field] = {"filled": int(row[0]), "mean": float(row[1] / row[0]) if row[0] else None}
+    return summary
+
+
+def summarize(result):
+    # {"by", "sessions", "total", "groups": [...]}; means and pass rates are over annotated rows
+    total = Aggregates(result.by, [ALL_GROUP])
+    total.rows = result.rows.sum(keepdims=True)
+    total.annotated = result.annotated.sum(keepdims=True)
+    total.blocks = {key: (labels, values.sum(axis=0, keepdims=True)) for key, (labels, values) in result.blocks.items()}
+    return {
+        "by": result.by,
+        "sessions": result.sessions,
+        "total": _summary(total, 0),
+        "groups": [_summary(result, i) for i in range(len(result.groups)) if result.rows[i] > 0],
+    }
+
+
+def _fmt(value, percent=False):
+    if value is None:
+        return "-"
+    return f"{value * 100:.1f}%" if percent else f"{value:.2f}"
+
+
+def format_group(summary):
+    lines = [
+        f"【{summary['group']}】共{summary['rows']}条，已标注{summary['annotated']}条，"
+        f"JAMA均分{_fmt(summary.get('jama_mean'))}，GQS均分{_fmt(summary.get('gqs_mean'))}，"
+        f"DISCERN均分{_fmt(summary.get('discern_mean'))}"
+    ]
+    for field, counts in summary["distributions"].items():
+        lines.append(f"  {field.upper()}分布：" + "，".join(f"{label}:{count}" for label, count in counts.items()))
+    for field, rates in summary["pass_rates"].items():
+        lines.append(f"  {field}通过率：" + "，".join(f"{item} {_fmt(rate, True)}" for item, rate in rates.items()))
+    for field, values in summary["custom"].items():
+        if "counts" in values:
+            lines.append(f"  {field}：" + "，".join(f"{label}:{count}" for label, count in values["counts"].items()))
+        else:
+            lines.append(f"  {field}：已填写{values['filled']}条，均值{_fmt(values['mean'])}")
+    return lines
+
+
+def format_analytics(summary):
+    lines = [f"共{summary['sessions']}条历史记录" + (f"，按{summary['by']}分组" if summary["by"] else "")]
+    lines.extend(format_group(summary["total"]))
+    if summary["by"]:
+        for group in summary["groups"]:
+            lines.append("")
+            lines.extend(format_group(group))
+    return "\n".join(lines)
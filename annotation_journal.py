@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class AnnotationJournal:
+    # Append-only log of row-level annotation deltas, one JSON object per line:
+    #   {"row": 12, "ts": 1700000000.0, "ann": {"jama": [...], "gqs": 3, ...}}
+    # Each entry carries the full record of one row, so replaying is idempotent.
+    def __init__(self, path, fsync_policy="always", fsync_interval=1.0):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"未知的fsync策略：{fsync_policy}")
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._last_fsync = 0.0
+        self.count = 0  # entries written or replayed since the last clear()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def append(self, entries):
+        # entries: iterable of (row, record)
+        now = time.time()
+        lines = [
+            json.dumps({"row": row, "ts": now, "ann": record}, ensure_ascii=False, separators=(",", ":"))
+            for row, record in entries
+        ]
+        if not lines:
+            return 0
+        # Start on a fresh line if a previous write was torn
+        if self.size() > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines[0] = "\n" + lines[0]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            if self.fsync_policy == "always" or (
+                self.fsync_policy == "interval" and now - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(f.fileno())
+                self._last_fsync = now
+        self.count += len(lines)
+        return len(lines)
+
+    def entries(self, offset=0):
+        # (row, record, ts) from a byte offset; a torn last line from a crash is skipped
+        return self.read(offset)[0]
+
+    def read(self, offset=0):
+        # ([(row, record, ts)], end offset) of the complete lines after offset; the end offset
+        # is where the next read continues, so a sync only parses what was appended since
+        if not os.path.exists(self.path):
+            return [], 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        result = []
+        for line_no, line in enumerate(data[:end].decode("utf-8", errors="replace").splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                result.append((int(entry["row"]), entry["ann"], entry.get("ts", 0.0)))
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning(f"⚠️ 跳过损坏的日志行（{self.path}:{line_no}）：{str(e)}")
+        return result, offset + end
+
+    def apply(self, store, entries, skip=(), only_changed=False):
+        # Applies entries in order; rows in skip (e.g. local unsaved edits) are left alone.
+        # Returns the sorted rows that were applied (with only_changed, those whose record
+        # differed from the store, so re-reading our own appends reports nothing).
+        rows = set()
+        for row, record, _ in entries:
+            if row in skip:
+                continue
+            if row >= store.n_rows:
+                store.resize(row + 1)
+            elif only_changed and store.record(row) == record:
+                continue
+            store.apply_record(row, record)
+            rows.add(row)
+        store.dirty.difference_update(rows)  # already on disk, not to be written back
+        return sorted(rows)
+
+    def replay(self, store):
+        # Replays the whole journal; returns (entries, end offset)
+        entries, offset = self.read()
+        self.apply(store, entries)
+        self.count = len(entries)
+        return len(entries), offset
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.count = 0
+
+
+def write_json_atomic(path, data):
+    # Write to a temp file in the same directory, fsync, then rename over the target.
+    # dumps() encodes in one C call; dump() would hand the file thousands of small chunks.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,149 @@
+import logging
+import warnings
+from collections import Counter
+
+import numpy as np
+
+from annotation_store import AnnotationStore, MAX_BITMASK_ITEMS
+
+# majority:     an item is kept when more than half of the annotators chose it
+# union:        items chosen by at least one annotator
+# intersection: items chosen by every annotator
+# Single-valued fields are merged the same way under every strategy: GQS and enum fields take
+# the most frequent value (ties go to the lower score / earlier option, unset enums do not
+# vote), numeric fields the median.
+MERGE_STRATEGIES = ("majority", "union", "intersection")
+
+
+def required_votes(strategy, n_annotators):
+    if strategy == "union":
+        return 1
+    if strategy == "intersection":
+        return n_annotators
+    return n_annotators // 2 + 1
+
+
+def _mode(stack, ignore_zero=False):
+    # Most frequent value per column of an (annotators, rows) int array, ties to the smallest
+    # Codes and scores are small ints: counting over their range avoids sorting the stack
+    candidates = np.arange(int(stack.min()), int(stack.max()) + 1, dtype=stack.dtype) if stack.size else np.zeros(1, stack.dtype)
+    counts = np.stack([(stack == value).sum(axis=0) for value in candidates])
+    if ignore_zero and candidates[0] == 0:
+        counts[0] = 0  # rows nobody set stay 0 because argmax falls back to the first candidate
+    return candidates[counts.argmax(axis=0)]
+
+
+def merge_stores(stores, strategy="majority", rows=None, out=None):
+    # Row-by-row merge of the annotator layers of one session, one numpy pass per field.
+    # With rows (and the out store of an earlier merge) only those rows are recomputed.
+    if strategy not in MERGE_STRATEGIES:
+        raise ValueError(f"不支持的合并方式：{strategy}")
+    if not stores:
+        raise ValueError("没有可合并的标注")
+    n_rows = max(store.n_rows for store in stores)
+    for store in stores:
+        store.resize(n_rows)
+    if out is None:
+        out = AnnotationStore(n_rows, stores[0].custom_columns)
+        rows = None
+    out.resize(n_rows)
+    index = slice(None) if rows is None else np.asarray(rows, dtype=np.int64)
+    in_rows = None if rows is None else set(index.tolist())
+    need = required_votes(strategy, len(stores))
+
+    for field in out.fields():
+        col_type = out.types[field]
+        stack = np.stack([store.arrays[field][index] for store in stores])
+        target = out.arrays[field]
+        extras = [
+            (row, value) for store in stores for (name, row), value in store.overflow.items()
+            if name == field and value and (in_rows is None or row in in_rows)
+        ]
+        for key in [key for key in out.overflow if key[0] == field and (in_rows is None or key[1] in in_rows)]:
+            del out.overflow[key]
+
+        if col_type == "multi":
+            merged = np.zeros(stack.shape[1], dtype=target.dtype)
+            for bit in range(min(len(out.vocab[field]), MAX_BITMASK_ITEMS)):
+                flag = target.dtype.type(1 << bit)
+                votes = ((stack & flag) != 0).sum(axis=0, dtype=np.int16)
+                merged |= np.where(votes >= need, flag, target.dtype.type(0))
+            target[index] = merged
+            # Items outside the vocabulary are counted per row the same way
+            votes = Counter((row, item) for row, extra in extras for item in extra)
+            for (row, item), count in votes.items():
+                if count >= need:
+                    out.overflow.setdefault((field, row), set()).add(item)
+            continue
+
+        if col_type == "numeric":
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # rows nobody filled
+                target[index] = np.nanmedian(stack, axis=0)
+            unset = np.isnan(target)
+        else:
+            target[index] = _mode(stack, ignore_zero=col_type == "enum")
+            unset = target == 0 if col_type == "enum" else np.zeros(n_rows, dtype=bool)
+        # Raw values outside the vocabulary only fill rows the arrays left unset
+        raw = {}
+        for row, value in extras:
+            raw.setdefault(row, Counter())[value] += 1
+        for row, counts in raw.items():
+            if unset[row]:
+                out.overflow[(field, row)] = counts.most_common(1)[0][0]
+
+    # A merged row counts as rated when any annotator rated it
+    out.rated[index] = np.stack([store.rated[index] for store in stores]).any(axis=0)
+    out.dirty = set()
+    return out
+
+
+class LayerMerge:
+    # Merged view of several annotator layers that stays current cheaply: every layer is
+    # loaded once, refresh() then syncs each one from what was appended since (journal offset
+    # or seq) and re-merges only the rows that changed.
+    def __init__(self, manager, meta, annotators=None, strategy="majority"):
+        if strategy not in MERGE_STRATEGIES:
+            raise ValueError(f"不支持的合并方式：{strategy}")
+        self.manager = manager
+        self.meta = meta
+        self.annotators = list(annotators) if annotators else manager.list_annotators(meta)
+        if not self.annotators:
+            raise ValueError(f"历史记录没有标注员的标注：{meta['timestamp']}")
+        self.strategy = strategy
+        self.stores = {}
+        self.merged = None
+
+    def refresh(self):
+        # Rows whose merged value was recomputed; None when everything was (first call,
+        # or a layer was compacted by someone and had to be reloaded)
+        n_rows = self.meta.get("count", 0)
+        changed = set()
+        full = self.merged is None
+        for annotator in self.annotators:
+            store = self.stores.get(annotator)
+            rows = None if store is None else self.manager.sync_annotations(self.meta, store, annotator)
+            if rows is None:
+                self.stores[annotator] = self.manager.load_annotations(self.meta, n_rows, annotator)
+                full = True
+            else:
+                changed.update(rows)
+        stores = [self.stores[annotator] for annotator in self.annotators]
+        if full:
+            self.merged = merge_stores(stores, self.strategy)
+            return None
+        if changed:
+            merge_stores(stores, self.strategy, sorted(changed), self.merged)
+        return sorted(changed)
+
+
+def merge_annotations(manager, meta, annotators=None, strategy="majority", target=""):
+    # Merges annotator layers into the target layer ("" = the session's main annotations,
+    # which exports and the main GUI view use); returns the merged store
+    merge = LayerMerge(manager, meta, annotators, strategy)
+    if target in merge.annotators:
+        raise ValueError(f"合并结果不能写入参与合并的标注员：{target}")
+    merge.refresh()
+    manager.replace_annotations(meta, merge.merged, target)
+    logging.info(f"🔀 成功合并标注：{meta['timestamp']}（{', '.join(merge.annotators)} → {target or '主标注'}，{strategy}）")
+    return merge.merged
@@ -0,0 +1,429 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from label_items import JAMA_ITEMS, GQS_ITEMS, DISCERN_ITEMS
+
+MAX_BITMASK_ITEMS = 64
+RATED_KEY = "_rated"  # in records of rows a coder has rated
+
+
+def mask_dtype(n_items):
+    if n_items <= 8:
+        return np.uint8
+    if n_items <= 16:
+        return np.uint16
+    if n_items <= 32:
+        return np.uint32
+    return np.uint64
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount(values):
+        return np.bitwise_count(values).astype(np.int64)
+else:
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+    def popcount(values):
+        values = np.ascontiguousarray(values)
+        as_bytes = values.view(np.uint8).reshape(len(values), values.itemsize)
+        return _BYTE_POPCOUNT[as_bytes].sum(axis=1)
+
+
+class AnnotationStore:
+    # Column-wise annotation state of one session:
+    #   jama / discern / multi custom fields -> bitmask arrays over their vocabulary
+    #   gqs                                  -> int8 array
+    #   enum custom fields                   -> int16 codes (0 = unset, i + 1 = enum_values[i])
+    #   numeric custom fields                -> float64 (NaN = unset)
+    # Values that do not fit the vocabulary are kept in `overflow` so that
+    # conversion to and from annotations.json records is lossless. `rated` marks the rows a
+    # coder has set (set_value / set_item), so a row rated GQS 1 with no item ticked is told
+    # apart from one nobody looked at.
+    def __init__(self, n_rows, custom_columns=()):
+        self.n_rows = n_rows
+        self.vocab = {"jama": list(JAMA_ITEMS), "discern": list(DISCERN_ITEMS)}
+        self.types = {"jama": "multi", "gqs": "gqs", "discern": "multi"}
+        self.arrays = {
+            "jama": np.zeros(n_rows, dtype=mask_dtype(len(JAMA_ITEMS))),
+            "gqs": np.ones(n_rows, dtype=np.int8),
+            "discern": np.zeros(n_rows, dtype=mask_dtype(len(DISCERN_ITEMS))),
+        }
+        self.rated = np.zeros(n_rows, dtype=bool)
+        self.custom_columns = []
+        self.overflow = {}  # (field, row) -> raw value
+        self.dirty = set()  # rows edited since the last take_dirty()
+        self.sync_state = None  # position in its storage layer, set by the history manager on load
+        for col_def in custom_columns:
+            self.add_custom_column(col_def)
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.arrays.values()) + self.rated.nbytes
+
+    def _empty_array(self, col_type, n_items, n_rows):
+        if col_type == "multi":
+            return np.zeros(n_rows, dtype=mask_dtype(n_items))
+        if col_type == "enum":
+            return np.zeros(n_rows, dtype=np.int16)
+        return np.full(n_rows, np.nan)
+
+    def add_custom_column(self, col_def):
+        name = col_def["name"]
+        self.custom_columns.append(col_def)
+        self.types[name] = col_def["type"]
+        if col_def["type"] in ("enum", "multi"):
+            self.vocab[name] = list(col_def["enum_values"])
+        self.arrays[name] = self._empty_array(col_def["type"], len(col_def["enum_values"]), self.n_rows)
+
+    def remove_custom_column(self, name):
+        self.custom_columns = [col for col in self.custom_columns if col["name"] != name]
+        self.types.pop(name, None)
+        self.vocab.pop(name, None)
+        self.arrays.pop(name, None)
+        self.overflow = {key: value for key, value in self.overflow.items() if key[0] != name}
+
+    def resize(self, n_rows):
+        if n_rows <= self.n_rows:
+            return
+        for field, values in self.arrays.items():
+            extra = n_rows - self.n_rows
+            if field == "gqs":
+                padding = np.ones(extra, dtype=values.dtype)
+            else:
+                padding = self._empty_array(self.types[field], len(self.vocab.get(field, [])), extra).astype(values.dtype)
+            self.arrays[field] = np.concatenate([values, padding])
+        self.rated = np.concatenate([self.rated, np.zeros(n_rows - self.n_rows, dtype=bool)])
+        self.n_rows = n_rows
+
+    # --- per-row access ---------------------------------------------------
+
+    def _bit(self, field, item):
+        vocab = self.vocab[field]
+        if item in vocab and vocab.index(item) < MAX_BITMASK_ITEMS:
+            return vocab.index(item)
+        return None
+
+    def get_items(self, field, row):
+        mask = int(self.arrays[field][row])
+        selected = {item for bit, item in enumerate(self.vocab[field][:MAX_BITMASK_ITEMS]) if mask >> bit & 1}
+        extra = self.overflow.get((field, row))
+        if extra:
+            selected |= extra
+        return selected
+
+    def set_item(self, field, row, item, checked):
+        self.dirty.add(row)
+        self.rated[row] = True
+        bit = self._bit(field, item)
+        if bit is None:
+            extra = self.overflow.setdefault((field, row), set())
+            if checked:
+                extra.add(item)
+            else:
+                extra.discard(item)
+            return
+        values = self.arrays[field]
+        flag = values.dtype.type(1 << bit)
+        if checked:
+            values[row] |= flag
+        else:
+            values[row] &= ~flag
+
+    def get_value(self, field, row):
+        col_type = self.types[field]
+        if col_type == "multi":
+            return self.get_items(field, row)
+        if (field, row) in self.overflow:
+            return self.overflow[(field, row)]
+        value = self.arrays[field][row]
+        if col_type == "gqs":
+            return int(value)
+        if col_type == "enum":
+            return self.vocab[field][value - 1] if value > 0 else ""
+        return "" if np.isnan(value) else float(value)
+
+    def set_value(self, field, row, value):
+        self.dirty.add(row)
+        self.rated[row] = True
+        col_type = self.types[field]
+        if col_type == "multi":
+            self.arrays[field][row] = 0
+            self.overflow.pop((field, row), None)
+            for item in value:
+                self.set_item(field, row, item, True)
+            return
+        self.overflow.pop((field, row), None)
+        values = self.arrays[field]
+        if col_type == "gqs":
+            values[row] = int(value)
+        elif col_type == "enum":
+            if value in ("", None):
+                values[row] = 0
+            elif value in self.vocab[field]:
+                values[row] = self.vocab[field].index(value) + 1
+            else:
+                values[row] = 0
+                self.overflow[(field, row)] = value
+        elif value in ("", None):
+            values[row] = np.nan
+        else:
+            try:
+                values[row] = float(value)
+            except (TypeError, ValueError):
+                values[row] = np.nan
+                self.overflow[(field, row)] = value
+
+    def take_dirty(self):
+        rows = sorted(self.dirty)
+        self.dirty = set()
+        return rows
+
+    def fields(self):
+        return ["jama", "gqs", "discern"] + [col["name"] for col in self.custom_columns]
+
+    def record(self, row):
+        # One row in annotations.json form
+        record = {}
+        for field in self.fields():
+            value = self.get_value(field, row)
+            if self.types[field] == "multi":
+                vocab = self.vocab[field]
+                value = [item for item in vocab if item in value] + sorted(value.difference(vocab))
+            record[field] = value
+        if self.rated[row]:
+            record[RATED_KEY] = True
+        return record
+
+    def apply_record(self, row, record):
+        # Fields unknown to this store (e.g. a deleted custom column) are ignored
+        for field, value in record.items():
+            if field in self.types:
+                self.set_value(field, row, value)
+        self.rated[row] = bool(record.get(RATED_KEY))
+
+    def score(self, field, row):
+        return int(self.arrays[field][row]).bit_count() + len(self.overflow.get((field, row), ()))
+
+    # --- column-wise access -----------------------------------------------
+
+    def _overflow_in(self, field, start, stop):
+        # (row - start, value) of the overflow entries of field within [start, stop)
+        return [
+            (row - start, value) for (name, row), value in self.overflow.items()
+            if name == field and start <= row < stop
+        ]
+
+    def scores(self, field, start=0, stop=None):
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        counts = popcount(self.arrays[field][start:stop])
+        for row, extra in self._overflow_in(field, start, stop):
+            counts[row] += len(extra)
+        return counts
+
+    def _mask_labels(self, field, masks, sep):
+        # Every distinct mask is joined once, then broadcast back to the rows
+        vocab = self.vocab[field][:MAX_BITMASK_ITEMS]
+        uniques, inverse = np.unique(masks, return_inverse=True)
+        labels = np.array(
+            [sep.join(item for bit, item in enumerate(vocab) if int(mask) >> bit & 1) for mask in uniques] or [""],
+            dtype=object
+        )
+        return labels[inverse] if len(uniques) else np.array([], dtype=object)
+
+    def values(self, field, sep=", ", start=0, stop=None):
+        # Export-ready column (or the rows [start, stop) of it): joined labels for multi
+        # fields, labels for enums, floats ("" = unset) for numeric fields, ints for GQS
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        col_type = self.types[field]
+        values = self.arrays[field][start:stop]
+        if col_type == "multi":
+            result = self._mask_labels(field, values, sep)
+            for row, extra in self._overflow_in(field, start, stop):
+                if extra:
+                    result[row] = sep.join([s for s in [result[row]] if s] + sorted(extra))
+            return result
+        if col_type == "enum":
+            result = np.array([""] + self.vocab[field], dtype=object)[values]
+        elif col_type == "gqs":
+            return values.astype(np.int64)
+        else:
+            result = values.astype(object)
+            result[np.isnan(values)] = ""
+        for row, raw in self._overflow_in(field, start, stop):
+            result[row] = raw
+        return result
+
+    def item_flags(self, field, start=0, stop=None):
+        # {item: 0/1 int8 column} over the vocabulary of a multi field, rows [start, stop)
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        values = self.arrays[field][start:stop]
+        return {
+            item: ((values >> values.dtype.type(bit)) & 1).astype(np.int8)
+            for bit, item in enumerate(self.vocab[field][:MAX_BITMASK_ITEMS])
+        }
+
+    def extra_items(self, field, sep=", ", start=0, stop=None):
+        # Joined out-of-vocabulary items of a multi field, rows [start, stop)
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        result = np.full(stop - start, "", dtype=object)
+        for row, extra in self._overflow_in(field, start, stop):
+            result[row] = sep.join(sorted(extra))
+        return result
+
+    def annotated(self):
+        # Boolean column: rows a coder rated, or where any field differs from its empty value
+        # (annotations saved before the rated flag existed)
+        mask = self.rated.copy()
+        for field, values in self.arrays.items():
+            if self.types[field] == "gqs":
+                mask |= values != 1
+            elif self.types[field] == "numeric":
+                mask |= ~np.isnan(values)
+            else:
+                mask |= values != 0
+        for (_, row), value in self.overflow.items():
+            if value not in (None, "") and row < self.n_rows:
+                mask[row] = True
+        return mask
+
+    def has_overflow(self, field):
+        return any(name == field and value for (name, _), value in self.overflow.items())
+
+    def copy(self):
+        # Independent snapshot, e.g. for exporting on a worker thread while editing continues
+        store = AnnotationStore(0, self.custom_columns)
+        store.n_rows = self.n_rows
+        store.arrays = {field: values.copy() for field, values in self.arrays.items()}
+        store.rated = self.rated.copy()
+        store.overflow = {key: set(value) if isinstance(value, set) else value for key, value in self.overflow.items()}
+        return store
+
+    # --- annotations.json conversion ----------------------------------------
+
+    @classmethod
+    def from_records(cls, records, custom_columns=(), n_rows=None):
+        # Decoded one field at a time: each column is pulled out of the records once and
+        # converted to its array with per-value caches instead of per-row set_value() calls
+        store = cls(max(len(records), n_rows or 0), custom_columns)
+        for field in store.fields():
+            store._decode_column(field, [ann.get(field) for ann in records])
+        store.rated[:len(records)] = [bool(ann.get(RATED_KEY)) for ann in records]
+        store.dirty = set()
+        return store
+
+    def _decode_column(self, field, column):
+        col_type = self.types[field]
+        n = len(column)
+        if col_type == "multi":
+            bit_index = {item: bit for bit, item in enumerate(self.vocab[field][:MAX_BITMASK_ITEMS])}
+            cache = {(): (0, None)}
+            masks = []
+            for row, items in enumerate(column):
+                key = tuple(items) if items else ()
+                decoded = cache.get(key)
+                if decoded is None:
+                    mask, extra = 0, set()
+                    for item in key:
+                        bit = bit_index.get(item)
+                        if bit is None:
+                            extra.add(item)
+                        else:
+                            mask |= 1 << bit
+                    decoded = cache[key] = (mask, extra or None)
+                masks.append(decoded[0])
+                if decoded[1]:
+                    self.overflow[(field, row)] = set(decoded[1])
+            self.arrays[field][:n] = np.array(masks, dtype=np.uint64).astype(self.arrays[field].dtype)
+        elif col_type == "gqs":
+            values = [1 if value is None else value for value in column]
+            try:
+                self.arrays[field][:n] = np.array(values, dtype=np.int64)
+            except (TypeError, ValueError):
+                self.arrays[field][:n] = [int(value) for value in values]
+        elif col_type == "enum":
+            codes = {item: code for code, item in enumerate(self.vocab[field], 1)}
+            result = np.zeros(n, dtype=np.int16)
+            for row, value in enumerate(column):
+                if value in ("", None):
+                    continue
+                code = codes.get(value) if isinstance(value, str) else None
+                if code is None:
+                    self.overflow[(field, row)] = value
+                else:
+                    result[row] = code
+            self.arrays[field][:n] = result
+        else:
+            try:
+                values = pd.to_numeric(pd.Series(column, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+            except (TypeError, ValueError):
+                values = np.full(n, np.nan)
+            self.arrays[field][:n] = values
+            # Rows that did not convert cleanly take the per-row path (overflow for raw strings)
+            for row in np.flatnonzero(np.isnan(values)):
+                if column[row] not in ("", None):
+                    self.set_value(field, row, column[row])
+
+    def to_records(self):
+        fields = self.fields()
+        columns = {}
+        for field in fields:
+            col_type = self.types[field]
+            if col_type == "multi":
+                vocab = self.vocab[field][:MAX_BITMASK_ITEMS]
+                uniques, inverse = np.unique(self.arrays[field], return_inverse=True)
+                lists = [[item for bit, item in enumerate(vocab) if int(mask) >> bit & 1] for mask in uniques]
+                columns[field] = [list(lists[i]) for i in inverse]
+                for (name, row), extra in self.overflow.items():
+                    if name == field and extra:
+                        columns[field][row] = columns[field][row] + sorted(extra)
+            elif col_type == "gqs":
+                columns[field] = self.arrays[field].tolist()
+            else:
+                columns[field] = self.values(field).tolist()
+        records = [{field: columns[field][row] for field in fields} for row in range(self.n_rows)]
+        for row in np.flatnonzero(self.rated):
+            records[row][RATED_KEY] = True
+        return records
+
+    # --- binary snapshot (annotations.npz) ------------------------------------
+
+    def to_arrays(self):
+        # Arrays for np.savez; field names, vocabularies and overflow travel in a JSON header
+        fields = self.fields()
+        overflow = [
+            [name, int(row), sorted(value) if self.types[name] == "multi" else value]
+            for (name, row), value in self.overflow.items()
+        ]
+        header = {
+            "n_rows": self.n_rows,
+            "fields": fields,
+            "types": {field: self.types[field] for field in fields},
+            "vocab": self.vocab,
+            "overflow": overflow,
+        }
+        arrays = {f"a{i}": self.arrays[field] for i, field in enumerate(fields)}
+        arrays["rated"] = self.rated
+        arrays["header"] = np.array(json.dumps(header, ensure_ascii=False))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data, custom_columns=(), n_rows=0):
+        # None when a field's type or vocabulary differs from custom_columns, so the caller
+        # can fall back to annotations.json; fields no longer defined are dropped
+        header = json.loads(str(data["header"]))
+        store = cls(max(header["n_rows"], n_rows), custom_columns)
+        for i, field in enumerate(header["fields"]):
+            if field not in store.types:
+                continue
+            if header["types"][field] != store.types[field] or header["vocab"].get(field) != store.vocab.get(field):
+                return None
+            values = data[f"a{i}"]
+            store.arrays[field][:len(values)] = values.astype(store.arrays[field].dtype)
+        if "rated" in data:  # snapshots written before the rated flag existed have none
+            store.rated[:len(data["rated"])] = data["rated"]
+        for name, row, value in header["overflow"]:
+            if name in store.types:
+                store.overflow[(name, row)] = set(value) if store.types[name] == "multi" else value
+        return store
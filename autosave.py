@@ -0,0 +1,141 @@
+import time
+import threading
+import logging
+
+from PyQt5.QtCore import QCoreApplication, QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+
+from instrumentation import metrics, profiler
+
+AUTOSAVE_INTERVAL_MS = 2000
+AUTOSAVE_MAX_DELAY_MS = 10000
+
+
+class AutosaveWorker(QObject):
+    # Lives on the autosave thread; only touches the journal files
+    flushed = pyqtSignal(int, float)  # rows written, latency in ms
+    failed = pyqtSignal(object, object, str)  # meta, rows not written, error message
+
+    def __init__(self, history_manager):
+        super().__init__()
+        self.history_manager = history_manager
+        self.queued = 0  # batches handed over but not written yet, guarded by idle
+        self.idle = threading.Condition()
+
+    def enqueue(self):
+        with self.idle:
+            self.queued += 1
+
+    def wait_idle(self, timeout=None):
+        # Callable from any thread; True once every queued batch has been written or failed
+        with self.idle:
+            return self.idle.wait_for(lambda: self.queued == 0, timeout)
+
+    @pyqtSlot(object, object)
+    def write(self, meta, entries):
+        start = time.perf_counter()
+        try:
+            written = profiler.call(self.history_manager.append_annotations, meta, entries)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            metrics.record("autosave.write", elapsed_ms)
+            metrics.count("autosave.rows", written)
+            self.flushed.emit(written, elapsed_ms)
+        except Exception as e:
+            self.failed.emit(meta, [row for row, _ in entries], str(e))
+        finally:
+            with self.idle:
+                self.queued -= 1
+                self.idle.notify_all()
+
+
+class AutosaveManager(QObject):
+    # Collects dirty rows of the bound session and flushes them on a debounce
+    # timer; the disk write happens on a background QThread.
+    flushRequested = pyqtSignal(object, object)
+    statusChanged = pyqtSignal(str)
+
+    def __init__(self, history_manager, interval_ms=AUTOSAVE_INTERVAL_MS, max_delay_ms=AUTOSAVE_MAX_DELAY_MS, parent=None):
+        super().__init__(parent)
+        self.interval_ms = interval_ms
+        self.max_delay_ms = max_delay_ms
+        self.meta = None
+        self.store = None
+        self.in_flight = 0
+        self._first_dirty = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+        self.thread = QThread(self)
+        self.worker = AutosaveWorker(history_manager)
+        self.worker.moveToThread(self.thread)
+        self.flushRequested.connect(self.worker.write)
+        self.worker.flushed.connect(self._on_flushed)
+        self.worker.failed.connect(self._on_failed)
+        self.thread.start()
+        if QCoreApplication.instance() is not None:
+            QCoreApplication.instance().aboutToQuit.connect(self.stop)
+
+    @property
+    def pending_rows(self):
+        return (len(self.store.dirty) if self.store is not None else 0) + self.in_flight
+
+    def bind(self, meta, store, flush=True):
+        # Switch to another session; pending rows of the previous one are written first
+        if flush:
+            self.flush()
+        else:
+            self.timer.stop()
+        self.meta = meta
+        self.store = store
+        self._first_dirty = None
+
+    def mark_dirty(self):
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if self._first_dirty is None:
+            self._first_dirty = now
+        # Restart the debounce window unless edits have been pending for too long
+        if (now - self._first_dirty) * 1000 < self.max_delay_ms:
+            self.timer.start(self.interval_ms)
+        elif not self.timer.isActive():
+            self.timer.start(0)
+        self.statusChanged.emit(f"待自动保存：{self.pending_rows}行")
+
+    def flush(self):
+        self.timer.stop()
+        self._first_dirty = None
+        if self.store is None or not self.store.dirty:
+            return 0
+        rows = self.store.take_dirty()
+        # Records are built on the UI thread so the worker never reads the live store
+        entries = [(row, self.store.record(row)) for row in rows]
+        self.in_flight += len(entries)
+        self.worker.enqueue()
+        self.flushRequested.emit(self.meta, entries)
+        return len(entries)
+
+    def wait_idle(self, timeout=None):
+        # Lets a background session load start only after earlier edits reached the journal
+        return self.worker.wait_idle(timeout)
+
+    def stop(self):
+        if not self.thread.isRunning():
+            return
+        self.flush()
+        self.worker.wait_idle(AUTOSAVE_MAX_DELAY_MS / 1000)
+        self.thread.quit()
+        self.thread.wait()
+
+    def _on_flushed(self, written, latency_ms):
+        self.in_flight = max(0, self.in_flight - written)
+        self.statusChanged.emit(f"自动保存完成：{written}行，耗时{latency_ms:.1f}ms，待保存{self.pending_rows}行")
+
+    def _on_failed(self, meta, rows, message):
+        self.in_flight = max(0, self.in_flight - len(rows))
+        # Keep the rows pending so the next flush retries them
+        if self.store is not None and meta is self.meta:
+            self.store.dirty.update(rows)
+        logging.error(f"❌ 自动保存失败：{message}")
+        self.statusChanged.emit(f"自动保存失败：{message}")
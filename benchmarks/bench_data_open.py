@@ -0,0 +1,65 @@
+# Time needed to open an imported session: data.csv versus the columnar snapshot.
+# Usage: python benchmarks/bench_data_open.py [rows ...]
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+from synthetic import make_crawl
+
+import pandas as pd
+
+from history_manager import HistoryManager, SNAPSHOT_FILE, feather, typed_frame
+
+REPEATS = 3
+
+
+def best_of(fn, repeats=REPEATS):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(n_rows, history_dir):
+    manager = HistoryManager(history_dir)
+    meta = manager.add_history(f"crawl_{n_rows}.csv", make_crawl(n_rows).to_dict("records"), [])
+    crawl_folder = os.path.join(history_dir, meta["timestamp"])
+    data_path = os.path.join(crawl_folder, "data.csv")
+    snapshot_path = os.path.join(crawl_folder, SNAPSHOT_FILE)
+
+    csv_s = best_of(lambda: typed_frame(pd.read_csv(data_path, encoding="utf-8-sig")))
+    manager.get_data(meta)  # first open writes the snapshot
+    snapshot_s = best_of(lambda: manager._read_snapshot(snapshot_path, data_path))
+    annotations_s = best_of(lambda: manager.load_annotations(meta, n_rows))
+    snapshot_mb = os.path.getsize(snapshot_path) / (1024 * 1024)
+    manager.delete_history(meta)
+    return csv_s, snapshot_s, annotations_s, snapshot_mb
+
+
+def main():
+    if feather is None:
+        print("pyarrow 未安装，无法生成列式快照")
+        return 1
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    history_dir = tempfile.mkdtemp(prefix="label_tool_bench_")
+    try:
+        # Data columns only; annotation loading is reported separately as it does not depend on the format
+        print(f"{'rows':>8} {'csv (ms)':>10} {'snapshot (ms)':>14} {'speedup':>8} "
+              f"{'snapshot (MB)':>14} {'annotations (ms)':>17}")
+        for n_rows in sizes:
+            csv_s, snapshot_s, annotations_s, snapshot_mb = run(n_rows, history_dir)
+            print(f"{n_rows:>8} {csv_s * 1000:>10.1f} {snapshot_s * 1000:>14.1f} {csv_s / snapshot_s:>7.1f}x "
+                  f"{snapshot_mb:>14.1f} {annotations_s * 1000:>17.1f}")
+    finally:
+        shutil.rmtree(history_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# Time and peak memory of exporting one session: whole frame in memory versus the streaming export engine.
+# Every export runs in a fresh process so that peak RSS is not shared between runs. Streaming
+# exports read the memory-mapped snapshot, whose clean file pages also count towards RSS.
+# Usage: python benchmarks/bench_export.py [rows ...]
+import os
+import sys
+import time
+import shutil
+import logging
+import resource
+import tempfile
+import subprocess
+
+from synthetic import CUSTOM_COLUMNS, make_crawl, make_store, rss_mb
+
+from history_manager import HistoryManager
+from export_engine import EXPORT_FORMATS, annotation_columns, export_sessions, session_source
+
+MODES = ["memory-csv"] + [f"stream-{fmt}" for fmt in EXPORT_FORMATS if fmt != "xlsx"]
+
+
+def peak_mb():
+    # VmHWM belongs to this process image; ru_maxrss would carry over the parent's peak across exec
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def child(history_dir, mode, out_path):
+    # Prints "seconds peak_delta_mb" for one export
+    logging.disable(logging.INFO)
+    manager = HistoryManager(history_dir)
+    meta = manager.get_history()[0]
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if mode == "memory-csv":
+        # What the GUI did before the export engine: the whole session as one frame
+        df, store = manager.get_data(meta)
+        for name, values in annotation_columns(store).items():
+            df[name] = values
+        df.to_csv(out_path, index=False, encoding="utf-8-sig")
+    else:
+        export_sessions([session_source(manager, meta)], out_path, mode.split("-", 1)[1])
+    print(f"{time.perf_counter() - start} {peak_mb() - baseline}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+        return 0
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 500000]
+    work_dir = tempfile.mkdtemp(prefix="label_tool_bench_")
+    try:
+        print(f"{'rows':>8} {'mode':>15} {'time (s)':>9} {'peak RSS Δ (MB)':>16} {'file (MB)':>10}")
+        for n_rows in sizes:
+            history_dir = os.path.join(work_dir, str(n_rows))
+            manager = HistoryManager(history_dir)
+            meta = manager.add_history(f"crawl_{n_rows}.csv", make_crawl(n_rows).to_dict("records"), CUSTOM_COLUMNS)
+            manager.save_annotations(meta, make_store(n_rows, CUSTOM_COLUMNS))
+            manager.get_data(meta)  # writes the columnar snapshot, as a first open in the GUI would
+            for mode in MODES:
+                out_path = os.path.join(work_dir, f"export_{n_rows}_{mode}")
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", history_dir, mode, out_path],
+                    capture_output=True, text=True, check=True
+                ).stdout.split()
+                seconds, delta = float(output[-2]), float(output[-1])
+                size_mb = os.path.getsize(out_path) / (1024 * 1024)
+                print(f"{n_rows:>8} {mode:>15} {seconds:>9.2f} {delta:>16.1f} {size_mb:>10.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
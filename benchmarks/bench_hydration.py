@@ -0,0 +1,75 @@
+# Rows per second of annotation hydration: annotations.json records versus the annotations.npz snapshot.
+# Usage: python benchmarks/bench_hydration.py [rows ...]
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+from synthetic import CUSTOM_COLUMNS, make_store
+
+import numpy as np
+
+from annotation_store import AnnotationStore
+from history_manager import HistoryManager, ANNOTATION_SNAPSHOT_FILE
+
+REPEATS = 3
+
+
+def best_of(fn, repeats=REPEATS):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(n_rows, history_dir):
+    store = make_store(n_rows, CUSTOM_COLUMNS)
+    records = store.to_records()
+    manager = HistoryManager(history_dir)
+    meta = manager.add_history(f"crawl_{n_rows}.csv", [{"title": ""}] * n_rows, CUSTOM_COLUMNS)
+    crawl_folder = os.path.join(history_dir, meta["timestamp"])
+    manager.compact_annotations(meta, store)
+    anno_path = os.path.join(crawl_folder, "annotations.json")
+    npz_path = os.path.join(crawl_folder, ANNOTATION_SNAPSHOT_FILE)
+
+    def from_json():
+        with open(anno_path, "r", encoding="utf-8") as f:
+            AnnotationStore.from_records(json.load(f), CUSTOM_COLUMNS, n_rows=n_rows)
+
+    def from_npz():
+        with np.load(npz_path, allow_pickle=False) as data:
+            AnnotationStore.from_arrays(data, CUSTOM_COLUMNS, n_rows)
+
+    timings = {
+        "records": best_of(lambda: AnnotationStore.from_records(records, CUSTOM_COLUMNS, n_rows=n_rows)),
+        "json": best_of(from_json),
+        "npz": best_of(from_npz),
+        "load_annotations": best_of(lambda: manager.load_annotations(meta, n_rows)),
+    }
+    manager.delete_history(meta)
+    return timings
+
+
+def main():
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000]
+    history_dir = tempfile.mkdtemp(prefix="label_tool_bench_")
+    try:
+        # records: from_records() on parsed records; json: json.load + from_records();
+        # npz: from_arrays() on the binary snapshot; load_annotations: the get_data() path
+        print(f"{'rows':>8} {'records (rows/s)':>17} {'json (rows/s)':>14} {'npz (rows/s)':>14} {'load_annotations (rows/s)':>26}")
+        for n_rows in sizes:
+            t = run(n_rows, history_dir)
+            print(f"{n_rows:>8} {n_rows / t['records']:>17,.0f} {n_rows / t['json']:>14,.0f} "
+                  f"{n_rows / t['npz']:>14,.0f} {n_rows / t['load_annotations']:>26,.0f}")
+    finally:
+        shutil.rmtree(history_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
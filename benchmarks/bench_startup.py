@@ -0,0 +1,141 @@
+# Startup cost of the GUI: import time of Gui.py (python -X importtime) and, per fresh process,
+# the time until the window is first painted and until the history tree is filled.
+# Usage: python benchmarks/bench_startup.py [--sessions N] [--repeats N] [--offscreen]
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import statistics
+import subprocess
+
+# Nothing heavy at module level: the child process must start as light as main.py does
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOP_IMPORTS = 10
+
+
+def child(timeout_s):
+    # Prints one JSON line: seconds since `start` (epoch, from the parent) to first paint and to history ready
+    start = float(os.environ["LABEL_TOOL_BENCH_START"])
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+    import Gui
+
+    app = QApplication(sys.argv[:1])
+    result = {}
+
+    class PaintProbe(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and "paint_s" not in result:
+                result["paint_s"] = time.time() - start
+                result["pandas_at_paint"] = "pandas" in sys.modules
+            return False
+
+    def poll():
+        if window.history_manager is not None and "paint_s" in result:
+            result["ready_s"] = time.time() - start
+            result["sessions"] = window.history_tree.topLevelItemCount()
+            app.quit()
+
+    window = Gui.App()
+    probe = PaintProbe()
+    window.installEventFilter(probe)
+    window.show()
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(2)
+    QTimer.singleShot(int(timeout_s * 1000), app.quit)
+    app.exec_()
+    window.close()
+    print(json.dumps(result))
+
+
+def import_profile():
+    # (total Gui import seconds, [(seconds, module)] of the heaviest modules imported by it)
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import Gui"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    ).stderr
+    total, children, pending = 0.0, [], []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        seconds = int(cumulative) / 1e6
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # importtime prints a module after everything it imported
+        if depth == 1:
+            pending.append((seconds, name.strip()))
+        elif depth == 0:
+            if name.strip() == "Gui":
+                total, children = seconds, pending
+            pending = []
+    return total, sorted(children, reverse=True)[:TOP_IMPORTS]
+
+
+def measure(work_dir, repeats, offscreen):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    runs = []
+    for _ in range(repeats):
+        env["LABEL_TOOL_BENCH_START"] = repr(time.time())
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", action="store_true")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--offscreen", action="store_true", help="不使用显示器（QT_QPA_PLATFORM=offscreen）")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    if args.child:
+        child(args.timeout)
+        return 0
+
+    sys.path.insert(0, ROOT_DIR)
+    from synthetic import make_crawl
+    from history_manager import HistoryManager, HISTORY_DIR, INDEX_FILE
+
+    logging.disable(logging.INFO)
+    total, modules = import_profile()
+    print(f"import Gui: {total * 1000:.1f} ms")
+    for seconds, name in modules:
+        print(f"  {seconds * 1000:>8.1f} ms  {name}")
+
+    work_dir = tempfile.mkdtemp(prefix="label_tool_bench_")
+    try:
+        manager = HistoryManager(os.path.join(work_dir, HISTORY_DIR))
+        records = make_crawl(20).to_dict("records")
+        for i in range(args.sessions):
+            manager.add_history(f"crawl_{i}.csv", records, [])
+        index_path = os.path.join(work_dir, HISTORY_DIR, INDEX_FILE)
+        print(f"\n{'index':>7} {'first paint (ms)':>17} {'history ready (ms)':>19} "
+              f"{'sessions':>9} {'pandas before paint':>20}")
+        for label in ("cold", "cached"):
+            if label == "cold" and os.path.exists(index_path):
+                os.remove(index_path)
+            runs = measure(work_dir, 1 if label == "cold" else args.repeats, args.offscreen)
+            paint = statistics.median(run["paint_s"] for run in runs)
+            ready = statistics.median(run.get("ready_s", float("nan")) for run in runs)
+            print(f"{label:>7} {paint * 1000:>17.1f} {ready * 1000:>19.1f} "
+                  f"{runs[-1].get('sessions', 0):>9} {str(any(run['pandas_at_paint'] for run in runs)):>20}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# Time and memory needed to bind a session to the data table.
+# Usage: python benchmarks/bench_table_load.py [rows ...]
+import os
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from synthetic import CUSTOM_COLUMNS, make_crawl, make_store, rss_mb
+
+from PyQt5.QtWidgets import QApplication, QTableView, QHeaderView
+
+from annotation_store import JAMA_ITEMS, GQS_ITEMS, DISCERN_ITEMS
+from table_model import AnnotationTableModel, AnnotationDelegate
+
+
+def run(n_rows, app):
+    df = make_crawl(n_rows)
+    store = make_store(n_rows, CUSTOM_COLUMNS)
+    view = QTableView()
+    view.resize(1200, 600)
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    model = AnnotationTableModel(JAMA_ITEMS, GQS_ITEMS, DISCERN_ITEMS)
+    view.setModel(model)
+    view.setItemDelegate(AnnotationDelegate(view))
+    view.show()
+    app.processEvents()
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    model.set_session(df, store, CUSTOM_COLUMNS)
+    app.processEvents()
+    load_s = time.perf_counter() - start
+    rss_after = rss_mb()
+
+    view.close()
+    view.deleteLater()
+    app.processEvents()
+    return load_s, rss_after - rss_before
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    print(f"{'rows':>8} {'load (ms)':>10} {'RSS delta (MB)':>15}")
+    for n_rows in sizes:
+        load_s, rss_delta = run(n_rows, app)
+        print(f"{n_rows:>8} {load_s * 1000:>10.1f} {rss_delta:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
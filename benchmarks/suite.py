@@ -0,0 +1,361 @@
+# Benchmark suite for the storage layer, the annotation hot paths and the Qt table.
+# Every operation is timed over several runs (latency percentiles, throughput in rows/s) and
+# run once more under tracemalloc for its peak traced allocation (numpy and pandas buffers
+# included; pyarrow's own pool and memory-mapped files are not traced).
+# Usage:
+#   python benchmarks/suite.py --sizes 1k 10k 100k --out results.json
+#   python benchmarks/suite.py --sizes 1m --repeats 3 --ops get_data sort --out big.json
+#   python benchmarks/suite.py --compare before.json after.json
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from synthetic import CUSTOM_COLUMNS, ROOT_DIR, make_crawl, make_store
+
+import numpy as np
+import pandas as pd
+
+from history_manager import SNAPSHOT_FILE, open_history_manager
+from export_engine import export_sessions, session_source
+from annotation_merge import merge_stores
+from sort_keys import SortKeyCache
+from search_index import SessionIndex
+from analytics import SessionAnalytics
+
+DEFAULT_SIZES = ["1k", "10k", "100k"]
+TOGGLE_SAMPLES = 200  # single-row edits timed one by one
+SAVE_ROWS = 500  # dirty rows per save_annotations call
+HISTORY_SESSIONS = 100  # small extra sessions listed by get_history
+REGRESSION_THRESHOLD = 0.10  # p50 slower by more than this counts as a regression in --compare
+
+
+def parse_size(text):
+    text = text.lower()
+    factor = {"k": 1000, "m": 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * factor)
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else None
+
+
+class Session:
+    # One synthetic session stored through the history manager, plus its in-memory copies
+    def __init__(self, manager, work_dir, n_rows):
+        self.manager = manager
+        self.n_rows = n_rows
+        self.df = make_crawl(n_rows)
+        self.store = make_store(n_rows, CUSTOM_COLUMNS)
+        self.csv_path = os.path.join(work_dir, f"crawl_{n_rows}.csv")
+        self.df.to_csv(self.csv_path, index=False, encoding="utf-8-sig")
+        self.meta = manager.add_history(os.path.basename(self.csv_path), self.df.to_dict("records"), CUSTOM_COLUMNS)
+        manager.compact_annotations(self.meta, self.store)
+        self.loaded, _ = manager.get_data(self.meta)  # typed frame; also writes the columnar snapshot
+        self.scores = {
+            "jama_score": self.store.scores("jama"),
+            "gqs_score": self.store.values("gqs"),
+            "discern_score": self.store.scores("discern"),
+        }
+
+
+class Suite:
+    def __init__(self, work_dir, backend, repeats):
+        self.work_dir = work_dir
+        self.backend = backend
+        self.repeats = repeats
+        self.results = []
+
+    def open_manager(self, n_rows):
+        if self.backend == "sqlite":
+            return open_history_manager("sqlite", db_path=os.path.join(self.work_dir, f"history_{n_rows}.db"))
+        return open_history_manager("files", history_dir=os.path.join(self.work_dir, f"history_{n_rows}"))
+
+    def measure(self, op, rows, fn, setup=None, repeats=None):
+        # fn(state) is timed; setup() builds its state outside the timing. One more run under
+        # tracemalloc, not counted in the latencies, records the peak traced allocation.
+        repeats = repeats or self.repeats
+        samples = []
+        for _ in range(repeats):
+            state = setup() if setup is not None else None
+            start = time.perf_counter()
+            fn(state)
+            samples.append(time.perf_counter() - start)
+        state = setup() if setup is not None else None
+        tracemalloc.start()
+        try:
+            fn(state)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        p50 = float(np.median(samples))
+        result = {
+            "op": op,
+            "backend": self.backend,
+            "rows": rows,
+            "samples": len(samples),
+            "mean_ms": float(np.mean(samples)) * 1000,
+            "p50_ms": p50 * 1000,
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+            "max_ms": max(samples) * 1000,
+            "rows_per_s": rows / p50 if p50 > 0 else None,
+            "peak_mb": peak / (1024 * 1024),
+        }
+        self.results.append(result)
+        print(f"{op:>24} {rows:>9} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+              f"{result['p99_ms']:>10.2f} {result['peak_mb']:>10.1f}", flush=True)
+        return result
+
+    # --- storage ---------------------------------------------------------------------
+
+    def bench_storage(self, session, ops):
+        manager, meta, n = session.manager, session.meta, session.n_rows
+        records = session.df.to_dict("records")
+        created = []
+
+        def add(_):
+            created.append(manager.add_history("bench.csv", records, CUSTOM_COLUMNS))
+
+        def import_file(_):
+            created.append(manager.add_history_from_file(session.csv_path, CUSTOM_COLUMNS))
+
+        if "add_history" in ops:
+            self.measure("add_history", n, add)
+        if "import_file" in ops:
+            self.measure("import_file", n, import_file)
+        for extra in created:
+            manager.delete_history(extra)
+
+        if "get_history" in ops:
+            small = records[:10]
+            extras = [manager.add_history("small.csv", small, []) for _ in range(HISTORY_SESSIONS)]
+            self.measure("get_history", len(manager.get_history()), lambda _: manager.get_history(), repeats=50)
+            for extra in extras:
+                manager.delete_history(extra)
+        if "get_data" in ops:
+            if self.backend == "files":
+                snapshot = os.path.join(manager.history_dir, meta["timestamp"], SNAPSHOT_FILE)
+
+                def drop_snapshot():
+                    if os.path.exists(snapshot):
+                        os.remove(snapshot)
+
+                self.measure("get_data_csv", n, lambda _: manager.get_data(meta), setup=drop_snapshot)
+            self.measure("get_data", n, lambda _: manager.get_data(meta))
+        if "load_annotations" in ops:
+            self.measure("load_annotations", n, lambda _: manager.load_annotations(meta, n))
+        if "save_annotations" in ops:
+            dirty = min(n, SAVE_ROWS)
+            rng = np.random.default_rng(0)
+            self.measure("save_annotations", dirty, lambda _: manager.save_annotations(meta, session.store),
+                         setup=lambda: session.store.dirty.update(rng.choice(n, dirty, replace=False).tolist()))
+            manager.compact_annotations(meta, session.store)
+        if "compact_annotations" in ops:
+            self.measure("compact_annotations", n, lambda _: manager.compact_annotations(meta, session.store))
+        if "append_annotations" in ops:
+            rng = np.random.default_rng(0)
+
+            def toggle_row():
+                row = int(rng.integers(0, n))
+                session.store.set_item("jama", row, "时效性", not session.store.get_items("jama", row))
+                return [(row, session.store.record(row))]
+
+            self.measure("append_annotations", 1, lambda entries: manager.append_annotations(meta, entries),
+                         setup=toggle_row, repeats=TOGGLE_SAMPLES)
+            manager.compact_annotations(meta, session.store)
+
+    # --- in-memory hot paths --------------------------------------------------------
+
+    def bench_memory(self, session, ops):
+        df, store, n = session.loaded, session.store, session.n_rows
+        if "sort" in ops:
+            for column in ("like_count", "publish_time", "duration", "title", "jama_score", "标签"):
+                self.measure(f"sort_{column}", n,
+                             lambda cache: cache.order(column),
+                             setup=lambda: SortKeyCache(df, store, session.scores))
+        if "filter" in ops:
+            self.measure("filter_index_build", n, lambda _: SessionIndex(df, store))
+            index = SessionIndex(df, store)
+            for query in ("科普", "作者1", "jama<2 gqs>=3", "视频类型=广告 标签=医学"):
+                self.measure(f"filter '{query}'", n, lambda _: index.query(query),
+                             setup=lambda: index._masks.clear())
+        if "export" in ops:
+            for fmt in ("csv", "parquet"):
+                path = os.path.join(self.work_dir, f"export.{fmt}")
+                self.measure(f"export_{fmt}", n, lambda _: export_sessions(
+                    [session_source(session.manager, session.meta)], path, fmt
+                ))
+                os.remove(path)
+        if "merge" in ops:
+            # Three annotators; a sync re-merges only the rows it reported
+            layers = [make_store(n, CUSTOM_COLUMNS, seed=seed) for seed in range(3)]
+            self.measure("merge_full", n, lambda _: merge_stores(layers, "majority"))
+            merged = merge_stores(layers, "majority")
+            rng = np.random.default_rng(2)
+            self.measure("merge_rows_100", 100, lambda rows: merge_stores(layers, "majority", rows, merged),
+                         setup=lambda: np.sort(rng.choice(n, min(n, 100), replace=False)))
+        if "analytics" in ops:
+            # Full build per group field, then the refresh after 100 edited rows
+            for by in ("", "is_verified", "视频类型"):
+                self.measure(f"analytics_build '{by}'", n, lambda _: SessionAnalytics(df, store, by).aggregates())
+            analytics = SessionAnalytics(df, store, "is_verified")
+            rng = np.random.default_rng(3)
+            self.measure("analytics_rows_100", 100, lambda _: analytics.aggregates(),
+                         setup=lambda: analytics.invalidate_rows(rng.choice(n, min(n, 100), replace=False).tolist()))
+
+    # --- Qt table -------------------------------------------------------------------
+
+    def bench_qt(self, session, ops):
+        from PyQt5.QtWidgets import QApplication, QTableView, QHeaderView
+        from label_items import JAMA_ITEMS, GQS_ITEMS, DISCERN_ITEMS
+        from table_model import AnnotationTableModel, AnnotationDelegate, JAMA_COLUMN
+
+        app = QApplication.instance() or QApplication(sys.argv[:1])
+        df, store, n = session.loaded, session.store, session.n_rows
+        view = QTableView()
+        view.resize(1200, 600)
+        view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        model = AnnotationTableModel(JAMA_ITEMS, GQS_ITEMS, DISCERN_ITEMS)
+        view.setModel(model)
+        view.setItemDelegate(AnnotationDelegate(view))
+        view.show()
+        app.processEvents()
+
+        def on_edit(row, col, value):
+            # What App.update_jama does for a checkbox click
+            item, checked = value
+            store.set_item("jama", row, item, checked)
+            model.refresh_cell(row, col)
+            session.scores["jama_score"][row] = store.score("jama", row)
+
+        model.cellEdited.connect(on_edit)
+
+        def load(_):
+            model.set_session(df, store, CUSTOM_COLUMNS)
+            app.processEvents()
+
+        if "qt_table_load" in ops:
+            self.measure("qt_table_load", n, load)
+        load(None)
+        if "qt_toggle" in ops:
+            rng = np.random.default_rng(1)
+            visible = max(1, min(n, 20))
+
+            def toggle(row):
+                index = model.index(row, JAMA_COLUMN)
+                model.setData(index, ("作者身份", "作者身份" not in store.get_items("jama", model.source_row(row))))
+                app.processEvents()
+
+            self.measure("qt_toggle", 1, toggle, setup=lambda: int(rng.integers(0, visible)), repeats=TOGGLE_SAMPLES)
+        if "qt_sort" in ops:
+            cache = SortKeyCache(df, store, session.scores)
+
+            def sort(ascending):
+                model.set_order(cache.order("like_count", ascending))
+                app.processEvents()
+
+            flips = iter(range(10 ** 9))
+            self.measure("qt_sort", n, sort, setup=lambda: next(flips) % 2 == 0)
+        model.cellEdited.disconnect(on_edit)
+        view.close()
+        view.deleteLater()
+        app.processEvents()
+
+
+STORAGE_OPS = ["add_history", "import_file", "get_history", "get_data", "load_annotations",
+               "save_annotations", "compact_annotations", "append_annotations"]
+MEMORY_OPS = ["sort", "filter", "export", "merge", "analytics"]
+QT_OPS = ["qt_table_load", "qt_toggle", "qt_sort"]
+
+
+def run_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(old_path, new_path, threshold):
+    # p50 and peak memory of every (op, backend, rows) present in both runs; 1 if anything regressed
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = {(r["op"], r["backend"], r["rows"]): r for r in json.load(f)["results"]}
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = {(r["op"], r["backend"], r["rows"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"{'op':>24} {'rows':>9} {'p50 old':>10} {'p50 new':>10} {'ratio':>7} {'peak old':>9} {'peak new':>9}")
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (k[2], k[0])):
+        before, after = old[key], new[key]
+        ratio = after["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ⚠️ 变慢"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  ✅ 变快"
+        print(f"{key[0]:>24} {key[2]:>9} {before['p50_ms']:>10.2f} {after['p50_ms']:>10.2f} {ratio:>6.2f}x "
+              f"{before['peak_mb']:>9.1f} {after['peak_mb']:>9.1f}{flag}")
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"{key[0]:>24} {key[2]:>9}  只在{'旧' if key in old else '新'}结果中")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label Tool 性能基准测试")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="数据行数，例如 1k 100k 1m")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--backend", choices=["files", "sqlite"], default="files")
+    parser.add_argument("--ops", nargs="+", help="只运行指定的操作：" + " ".join(STORAGE_OPS + MEMORY_OPS + QT_OPS))
+    parser.add_argument("--no-qt", action="store_true", help="跳过Qt表格测试")
+    parser.add_argument("--out", help="结果JSON文件")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="比较两次结果")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    logging.disable(logging.INFO)
+    ops = set(args.ops or STORAGE_OPS + MEMORY_OPS + ([] if args.no_qt else QT_OPS))
+    suite = Suite(tempfile.mkdtemp(prefix="label_tool_bench_"), args.backend, args.repeats)
+    print(f"{'op':>24} {'rows':>9} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'peak (MB)':>10}")
+    try:
+        for n_rows in [parse_size(size) for size in args.sizes]:
+            manager = suite.open_manager(n_rows)
+            session = Session(manager, suite.work_dir, n_rows)
+            suite.bench_storage(session, ops)
+            suite.bench_memory(session, ops)
+            if ops & set(QT_OPS):
+                suite.bench_qt(session, ops)
+            if hasattr(manager, "close"):
+                manager.close()
+    finally:
+        shutil.rmtree(suite.work_dir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"run": run_info(), "results": suite.results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存：{args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from annotation_store import AnnotationStore, JAMA_ITEMS, DISCERN_ITEMS
+
+# Custom fields of the benchmark sessions: one enum, one multi and one numeric field
+CUSTOM_COLUMNS = [
+    {"name": "视频类型", "type": "enum", "enum_values": ["科普", "广告", "其他"]},
+    {"name": "标签", "type": "multi", "enum_values": ["医学", "营养", "运动"]},
+    {"name": "得分", "type": "numeric", "enum_values": []},
+]
+
+
+def make_crawl(n_rows, seed=0):
+    # Synthetic crawl following the expected_columns schema of an imported file
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp("2024-01-01")
+    seconds = rng.integers(5, 600, n_rows)
+    ids = np.arange(7000000000000000000, 7000000000000000000 + n_rows, dtype=np.int64)
+    return pd.DataFrame({
+        "title": [f"科普视频 #{i} 关于健康的话题" for i in range(n_rows)],
+        "publish_time": (base + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, n_rows), unit="s")).astype(str),
+        "author_name": [f"作者{i % 997}" for i in range(n_rows)],
+        "like_count": rng.integers(0, 100000, n_rows),
+        "comment_count": rng.integers(0, 5000, n_rows),
+        "share_count": rng.integers(0, 5000, n_rows),
+        "collect_count": rng.integers(0, 5000, n_rows),
+        "video_url": [f"https://www.douyin.com/video/{i}" for i in ids],
+        "danmaku_count": rng.integers(0, 1000, n_rows),
+        "duration": [f"{s // 60}:{s % 60:02d}" for s in seconds],
+        "video_id": ids.astype(str),
+        "play_count": rng.integers(0, 1000000, n_rows),
+        "author_official_role": rng.integers(0, 3, n_rows),
+        "is_verified": rng.integers(0, 2, n_rows),
+    })
+
+
+def make_store(n_rows, custom_columns=(), seed=0):
+    # Randomly filled annotation state for a crawl of n_rows
+    rng = np.random.default_rng(seed + 1)
+    store = AnnotationStore(n_rows, custom_columns)
+    store.arrays["jama"][:] = rng.integers(0, 1 << len(JAMA_ITEMS), n_rows)
+    store.arrays["discern"][:] = rng.integers(0, 1 << len(DISCERN_ITEMS), n_rows)
+    store.arrays["gqs"][:] = rng.integers(1, 6, n_rows)
+    for col in store.custom_columns:
+        values = store.arrays[col["name"]]
+        if col["type"] == "multi":
+            values[:] = rng.integers(0, 1 << len(col["enum_values"]), n_rows)
+        elif col["type"] == "enum":
+            values[:] = rng.integers(0, len(col["enum_values"]) + 1, n_rows)
+        else:
+            values[:] = rng.integers(0, 100, n_rows)
+    return store
+
+
+def make_records(n_rows, custom_columns=(), seed=0):
+    # The same annotations in annotations.json record form
+    return make_store(n_rows, custom_columns, seed).to_records()
+
+
+def rss_mb():
+    # Current resident set size, falls back to the peak where /proc is unavailable
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
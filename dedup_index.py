@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import logging
+
+import pandas as pd
+
+from annotation_store import AnnotationStore
+from annotation_journal import write_json_atomic
+from file_lock import FileLock
+
+# Crawls overlap: the same video is imported again and again. Every stored row gets a key,
+#   "id:<video_id>"     when video_id is set, or when the URL carries the id (/video/<id>)
+#   "url:<host><path>"  the URL without scheme, www./m. prefix, query, fragment and trailing slash
+# and the index maps each key to the first stored copy (oldest session, lowest row).
+DEDUP_INDEX_FILE = "dedup_index.json"
+DEDUP_MODES = ("flag", "skip", "off")
+DEDUP_ENV = "LABEL_TOOL_DEDUP"
+DUPLICATE_COLUMN = "duplicate_of"  # "<timestamp>#<row number>" of the first copy, "" for new videos
+DEDUP_LOCK_TIMEOUT = 3600  # the index lock is held while it is refreshed or a session registered
+URL_PATTERN = re.compile(r"^(?:[a-z][a-z0-9+.-]*://)?(?:www\.|m\.)?([^/?#\s]+)([^?#\s]*)", re.IGNORECASE)
+URL_ID_PATTERN = re.compile(r"/(?:video|note)/(\d+)")
+
+
+def _text(column):
+    # Values as stripped strings, "" when missing; ids read as float (a column with gaps) lose ".0"
+    if column.dtype.kind in "iu":
+        return column.astype(str).tolist()
+    if column.dtype.kind == "f":
+        text = pd.Series("", index=column.index, dtype=object)
+        valid = column.notna()
+        text[valid] = column[valid].astype("int64").astype(str)
+        return text.tolist()
+    return [str(value).strip() if valid else "" for value, valid in zip(column.tolist(), column.notna().tolist())]
+
+
+def url_key(url):
+    match = URL_PATTERN.match(url)
+    if match is None:
+        return ""
+    path = match.group(2).rstrip("/")
+    found = URL_ID_PATTERN.search(path)
+    return f"id:{found.group(1)}" if found else f"url:{match.group(1).lower()}{path}"
+
+
+def dedup_keys(df):
+    # Key of every row of a frame ("" = nothing to match on). One precompiled regex match per
+    # URL is cheaper here than pandas' .str.extract, which builds a frame per pattern group.
+    n = len(df)
+    ids = _text(df["video_id"]) if "video_id" in df.columns else [""] * n
+    urls = _text(df["video_url"]) if "video_url" in df.columns else [""] * n
+    return [f"id:{video_id}" if video_id else url_key(url) for video_id, url in zip(ids, urls)]
+
+
+def dedup_mode(mode=None):
+    mode = mode or os.environ.get(DEDUP_ENV, "off")
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"不支持的去重方式：{mode}")
+    return mode
+
+
+class DedupIndex:
+    # Persistent key index over every stored session. The file keeps the key of each row per
+    # session, so a deleted or updated session is dropped or rescanned without touching the
+    # others; lookups go through the in-memory key -> (timestamp, row) dict.
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(f"{path}.lock", timeout=DEDUP_LOCK_TIMEOUT)
+        self.sessions = {}  # timestamp -> {"count": meta count, "keys": [key per row]}
+        self.first = {}  # key -> (timestamp, row) of the first copy
+        self._mtime = None
+
+    def load(self):
+        # Re-read only when another process rewrote the file
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self.sessions = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.sessions = json.load(f).get("sessions", {})
+            except (OSError, ValueError, AttributeError) as e:
+                logging.error(f"❌ 加载去重索引失败（{self.path}）：{str(e)}，将重新建立")
+        self._mtime = mtime
+        self._rebuild()
+
+    def _rebuild(self):
+        first = {}
+        for timestamp in sorted(self.sessions):
+            for row, key in enumerate(self.sessions[timestamp]["keys"]):
+                if key and key not in first:
+                    first[key] = (timestamp, row)
+        self.first = first
+
+    def save(self):
+        try:
+            write_json_atomic(self.path, {"sessions": self.sessions})
+            self._mtime = os.stat(self.path).st_mtime_ns
+            logging.info(f"📝 成功保存去重索引：{self.path}（共{len(self.first)}个视频）")
+        except Exception as e:
+            logging.error(f"❌ 保存去重索引失败（{self.path}）：{str(e)}")
+            self._mtime = None
+
+    def refresh(self, manager):
+        # Drops deleted sessions and scans the ones that are new or whose row count changed;
+        # returns True when the index was modified
+        self.load()
+        metas = {meta["timestamp"]: meta for meta in manager.get_history()}
+        removed = [timestamp for timestamp in self.sessions if timestamp not in metas]
+        for timestamp in removed:
+            del self.sessions[timestamp]
+        scanned = 0
+        for timestamp, meta in metas.items():
+            entry = self.sessions.get(timestamp)
+            if entry is not None and entry["count"] == meta.get("count", 0):
+                continue
+            keys = []
+            for chunk in manager.iter_data(meta):
+                keys.extend(dedup_keys(chunk))
+            self.sessions[timestamp] = {"count": meta.get("count", 0), "keys": keys}
+            scanned += 1
+        if not (removed or scanned):
+            return False
+        self._rebuild()
+        self.save()
+        logging.info(f"🔄 更新去重索引：扫描{scanned}条历史记录，移除{len(removed)}条")
+        return True
+
+    def add_session(self, timestamp, keys, count=None):
+        # Sessions are added newest last, so existing first copies stay first. first is
+        # replaced rather than updated, so running imports keep their snapshot of it.
+        self.sessions[timestamp] = {"count": len(keys) if count is None else count, "keys": list(keys)}
+        first = dict(self.first)
+        for row, key in enumerate(keys):
+            if key:
+                first.setdefault(key, (timestamp, row))
+        self.first = first
+
+
+class DedupImport:
+    # Deduplication state of one streaming import. Entering `with` brings the index up to date
+    # and takes a snapshot of it, so parallel imports do not wait for each other; prepare()
+    # looks each row up (snapshot first, then the rows imported so far) and flags or drops
+    # duplicates, and the annotations of the first copy are carried over. finish() locks the
+    # index until `with` ends, so the session is stored before another import refreshes it.
+    def __init__(self, manager, mode=None, custom_columns=()):
+        self.manager = manager
+        self.mode = dedup_mode(mode)
+        self.custom_columns = list(custom_columns)
+        self.index = manager.dedup_index() if self.mode != "off" else None
+        self.keys = []  # key of every stored row of this import
+        self.seen = {}  # key -> row within this import
+        self.reused = {}  # row -> annotation record carried over from the first copy
+        self.late = {}  # row -> DUPLICATE_COLUMN value, for copies a parallel import registered first
+        self.first = {}  # snapshot of the index: key -> (timestamp, row)
+        self._locked = False
+        self._metas = {}
+        self._stores = {}
+        self._empty = AnnotationStore(1, self.custom_columns).record(0)
+        self.stats = {"rows": 0, "duplicates": 0, "in_file": 0, "skipped": 0, "reused": 0, "late": 0}
+
+    def __enter__(self):
+        if self.index is not None:
+            with self.index.lock:
+                self.index.refresh(self.manager)
+                self.first = self.index.first
+            self._metas = {meta["timestamp"]: meta for meta in self.manager.get_history()}
+        return self
+
+    def __exit__(self, *exc):
+        if self._locked:
+            self._locked = False
+            self.index.lock.release()
+
+    def prepare(self, chunk, start, timestamp):
+        # Returns the chunk to store (rows start..) and [(row, record)] of carried-over annotations
+        if self.index is None:
+            return chunk, []
+        keys = dedup_keys(chunk)
+        firsts = list(map(self.first.get, keys))  # one hash lookup per row
+        keep, refs, reused = [], [], []
+        for key, first in zip(keys, firsts):
+            row = start + len(refs)  # refs has one entry per stored row
+            if first is None and key in self.seen:
+                first = (timestamp, self.seen[key])
+                self.stats["in_file"] += 1
+            if first is None:
+                if key:
+                    self.seen[key] = row
+                keep.append(True)
+                refs.append("")
+                continue
+            self.stats["duplicates"] += 1
+            if self.mode == "skip":
+                keep.append(False)
+                continue
+            keep.append(True)
+            refs.append(f"{first[0]}#{first[1] + 1}")
+            record = self.reused.get(first[1]) if first[0] == timestamp else self._record(*first)
+            if record is not None:
+                self.reused[row] = record
+                reused.append((row, record))
+        self.stats["rows"] += len(keys)
+        self.stats["reused"] += len(reused)
+        if len(refs) < len(keys):
+            self.stats["skipped"] += len(keys) - len(refs)
+            chunk = chunk[keep].reset_index(drop=True)
+            keys = [key for key, kept in zip(keys, keep) if kept]
+        self.keys.extend(keys)
+        if self.mode == "flag":
+            chunk = chunk.assign(**{DUPLICATE_COLUMN: refs})
+        return chunk, reused
+
+    def _record(self, timestamp, row):
+        # Annotation of the first copy in the target's fields, None when it is empty
+        loaded = self._stores.get(timestamp)
+        if loaded is None:
+            meta = self._metas.get(timestamp)
+            if meta is None:
+                return None
+            store = self.manager.load_annotations(meta, meta.get("count", 0), "")
+            loaded = self._stores[timestamp] = (store, store.annotated())
+        store, annotated = loaded
+        if row >= store.n_rows or not annotated[row]:
+            return None
+        target = AnnotationStore(1, self.custom_columns)
+        target.apply_record(0, store.record(row))
+        record = target.record(0)
+        return None if record == self._empty else record
+
+    def finish(self, timestamp, count):
+        # Re-checks the new keys against the current index and adds the imported session;
+        # returns the statistics for meta["dedup"]. Copies found late are already stored: in
+        # "flag" mode the backend writes self.late into DUPLICATE_COLUMN, in "skip" mode they stay.
+        if self.index is None:
+            return None
+        self.index.lock.acquire()
+        self._locked = True
+        self.index.load()
+        for key, row in self.seen.items():
+            first = self.index.first.get(key)
+            if first is not None and first[0] != timestamp:
+                self.late[row] = f"{first[0]}#{first[1] + 1}"
+        self.stats["late"] = len(self.late)
+        self.stats["duplicates"] += len(self.late)
+        self.index.add_session(timestamp, self.keys, count)
+        self.index.save()
+        stats = dict(self.stats, mode=self.mode)
+        logging.info(
+            f"🔍 导入去重：共{stats['rows']}条，重复{stats['duplicates']}条（文件内{stats['in_file']}条，"
+            f"同时导入{stats['late']}条），跳过{stats['skipped']}条，沿用已有标注{stats['reused']}条"
+        )
+        return stats
+
+
+def format_dedup_stats(stats):
+    if not stats:
+        return ""
+    if not stats["duplicates"]:
+        return "无重复视频"
+    text = f"重复视频{stats['duplicates']}条"
+    if stats["skipped"]:
+        text += f"（已跳过{stats['skipped']}条）"
+    if stats["reused"]:
+        text += f"，沿用已有标注{stats['reused']}条"
+    return text
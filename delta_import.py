@@ -0,0 +1,101 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from dedup_index import dedup_keys
+
+# Re-crawling a topic refreshes the engagement counts of videos that are already stored.
+# An update import joins the new crawl against a session on the dedup keys (video_id, else
+# the normalized video_url): matched rows get their counts replaced in place, videos the
+# session does not have yet are appended, and the annotations (indexed by row) stay valid.
+METRIC_COLUMNS = ["like_count", "comment_count", "share_count", "collect_count", "play_count", "danmaku_count"]
+KEY_COLUMNS = ("video_id", "video_url")
+
+
+def metric_values(column):
+    # Counts as float64 (NaN = missing or not a number), whatever dtype they were read with
+    return pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+
+
+def format_count(value):
+    # One count as written back: an int when integral, so data.csv keeps "123" and not "123.0"
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class DeltaMerge:
+    # Join of a new crawl against the stored rows of a session, one chunk at a time:
+    #   merge = DeltaMerge(stored)              stored: key and metric columns, positional rows
+    #   new_rows = merge.apply(chunk)           per chunk of the crawl; returns the rows to append
+    #   merge.changed_rows()                    the stored rows whose counts changed
+    #   merge.updates(col)                      (rows, values) of the changed cells of one column
+    def __init__(self, stored):
+        if not any(name in stored.columns for name in KEY_COLUMNS):
+            raise ValueError("历史记录缺少video_id/video_url列，无法按视频更新")
+        self.n_rows = len(stored)
+        # Object dtype: hash joins on it are much faster than on the Arrow-backed default strings
+        keys = pd.DataFrame({"key": pd.Series(dedup_keys(stored), dtype=object), "row": np.arange(self.n_rows)})
+        self.keys = keys[keys["key"] != ""]
+        self.metrics = [name for name in METRIC_COLUMNS if name in stored.columns]
+        self.current = {name: metric_values(stored[name]) for name in self.metrics}
+        self.changed_cells = {name: np.zeros(self.n_rows, dtype=bool) for name in self.metrics}
+        self.added = set()  # keys appended by this update
+        self.stats = {"rows": 0, "matched": 0, "changed": 0, "added": 0, "unkeyed": 0}
+
+    def apply(self, chunk):
+        if not any(name in chunk.columns for name in KEY_COLUMNS):
+            raise ValueError("导入文件缺少video_id/video_url列，无法按视频更新")
+        keys = pd.DataFrame({"key": pd.Series(dedup_keys(chunk), dtype=object), "pos": np.arange(len(chunk))})
+        keyed = keys[keys["key"] != ""].drop_duplicates("key", keep="last")  # the crawl's latest copy of a video
+        # Vectorized join; a video stored twice in the session gets both copies updated
+        matched = keyed.merge(self.keys, on="key", how="inner")
+        pos, rows = matched["pos"].to_numpy(), matched["row"].to_numpy()
+        for name in self.metrics:
+            if name not in chunk.columns:
+                continue
+            new = metric_values(chunk[name])[pos]
+            old = self.current[name][rows]
+            differ = ~np.isnan(new) & (new != old)  # a count missing from the crawl keeps the stored one
+            self.current[name][rows[differ]] = new[differ]
+            self.changed_cells[name][rows[differ]] = True
+
+        unmatched = keyed[~keyed["key"].isin(self.keys["key"]) & ~keyed["key"].isin(list(self.added))].sort_values("pos")
+        self.added.update(unmatched["key"])
+        self.stats["rows"] += len(chunk)
+        self.stats["matched"] += int(matched["pos"].nunique())
+        self.stats["added"] += len(unmatched)
+        self.stats["unkeyed"] += int((keys["key"] == "").sum())
+        new_rows = chunk.iloc[unmatched["pos"].to_numpy()].reset_index(drop=True)
+        for name in self.metrics:
+            if name in new_rows.columns:
+                values = pd.to_numeric(new_rows[name], errors="coerce")
+                if (values.dropna() % 1 == 0).all():
+                    new_rows[name] = values.astype("Int64")  # not "1.0" when the crawl had gaps
+        return new_rows
+
+    def changed_rows(self):
+        changed = np.zeros(self.n_rows, dtype=bool)
+        for cells in self.changed_cells.values():
+            changed |= cells
+        return np.flatnonzero(changed)
+
+    def updates(self, name):
+        # Only cells the crawl changed are rewritten; cells it left empty keep their stored text
+        rows = np.flatnonzero(self.changed_cells[name])
+        return rows, [format_count(value) for value in self.current[name][rows]]
+
+    def finish(self):
+        self.stats["changed"] = len(self.changed_rows())
+        logging.info(
+            f"🔄 更新导入：读取{self.stats['rows']}条，匹配{self.stats['matched']}条，"
+            f"更新计数{self.stats['changed']}条，新增{self.stats['added']}条，无法匹配{self.stats['unkeyed']}条"
+        )
+        return dict(self.stats)
+
+
+def format_update_stats(stats):
+    text = f"匹配{stats['matched']}条，更新计数{stats['changed']}条，新增{stats['added']}条"
+    if stats.get("unkeyed"):
+        text += f"，{stats['unkeyed']}条缺少video_id/video_url未导入"
+    return text
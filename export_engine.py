@@ -0,0 +1,262 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+from annotation_store import AnnotationStore
+
+EXPORT_CHUNK_ROWS = 50000  # rows held in memory at once while exporting
+EXPORT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "jsonl": ".jsonl", "xlsx": ".xlsx"}
+EXPORT_LAYOUTS = ("joined", "wide")  # joined: one "a, b" text column per field; wide: one 0/1 column per item
+DETAIL_COLUMNS = ("jama_details", "discern_details")
+SESSION_COLUMNS = ("session_timestamp", "source_file")  # leading columns of a multi-session export
+XLSX_MAX_ROWS = 1048576  # rows per worksheet, header included
+
+
+def annotation_columns(store, start=0, stop=None, layout="joined", sep=", "):
+    # {column: values} of the annotation columns for the data rows [start, stop)
+    stop = store.n_rows if stop is None else stop
+    if stop > store.n_rows:
+        store.resize(stop)
+    columns = {
+        "jama_score": store.scores("jama", start, stop),
+        "gqs_score": store.values("gqs", sep, start, stop),
+        "discern_score": store.scores("discern", start, stop),
+    }
+    multi_fields = ["jama", "discern"]
+    for col in store.custom_columns:
+        name = col["name"]
+        if col["type"] == "multi" and layout == "wide":
+            multi_fields.append(name)
+        elif col["type"] == "numeric" and not store.has_overflow(name):
+            columns[name] = store.arrays[name][start:stop]  # NaN when unset
+        else:
+            columns[name] = store.values(name, sep, start, stop)
+    if layout == "wide":
+        for field in multi_fields:
+            for item, flags in store.item_flags(field, start, stop).items():
+                columns[f"{field}_{item}"] = flags
+            # Always present (empty without items outside the vocabulary), so the header
+            # follows from the field definitions alone
+            columns[f"{field}_其他"] = store.extra_items(field, sep, start, stop)
+    else:
+        columns["jama_details"] = store.values("jama", sep, start, stop)
+        columns["discern_details"] = store.values("discern", sep, start, stop)
+    return columns
+
+
+def annotate_chunk(chunk, store, start, layout="joined", sep=", "):
+    # Data rows [start, start + len(chunk)) followed by their annotation columns
+    frame = chunk.reset_index(drop=True)
+    for name, values in annotation_columns(store, start, start + len(frame), layout, sep).items():
+        frame[name] = values
+    return frame
+
+
+# --- sources -----------------------------------------------------------------------
+
+class ExportSource:
+    # One session to export: its data columns, a factory of data chunks in row order and
+    # a loader of its annotations. Nothing is read until the export reaches the session.
+    def __init__(self, meta, columns, chunks, annotations, custom_columns=()):
+        self.meta = meta
+        self.columns = list(columns)
+        self.chunks = chunks
+        self.annotations = annotations
+        self.custom_columns = list(custom_columns)
+
+
+def frame_source(meta, df, store, chunksize=EXPORT_CHUNK_ROWS):
+    # A session already in memory, e.g. the one open in the GUI (pass a copy of its store)
+    def chunks():
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    return ExportSource(meta, df.columns, chunks, lambda: store, store.custom_columns)
+
+
+def session_source(manager, meta, chunksize=EXPORT_CHUNK_ROWS):
+    # A stored session, streamed from the history manager
+    return ExportSource(
+        meta,
+        manager.data_columns(meta),
+        lambda: manager.iter_data(meta, chunksize),
+        lambda: manager.load_annotations(meta, meta.get("count", 0)),
+        meta.get("custom_columns", [])
+    )
+
+
+def export_columns(sources, layout="joined", sep=", "):
+    # Column union of all sources: session columns (several sources only), data columns,
+    # annotation columns, with the joined detail columns last. Annotation columns come from
+    # an empty store of each source's fields, so no session is loaded for the header.
+    data_names, annotation_names = {}, {}
+    for source in sources:
+        data_names.update(dict.fromkeys(source.columns))
+        template = AnnotationStore(0, source.custom_columns)
+        annotation_names.update(dict.fromkeys(annotation_columns(template, 0, 0, layout, sep)))
+    annotation_names = sorted(annotation_names, key=lambda name: name in DETAIL_COLUMNS)
+    leading = list(SESSION_COLUMNS) if len(sources) > 1 else []
+    return leading + [name for name in data_names if name not in annotation_names] + annotation_names
+
+
+def numeric_columns(sources):
+    # Numeric custom fields of any source; a chunk without values must not make them strings
+    return {col["name"] for source in sources for col in source.custom_columns if col["type"] == "numeric"}
+
+
+# --- writers -----------------------------------------------------------------------
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, frame):
+        if len(frame):
+            frame.to_json(self.file, orient="records", lines=True, force_ascii=False, date_format="iso")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    # The schema comes from the first chunk (columns without values become strings, except the
+    # numeric annotation fields); later chunks are cast to it, so columns whose type changes
+    # between sessions fail clearly
+    def __init__(self, path, numeric=()):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("导出Parquet需要安装pyarrow")
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.numeric = set(numeric)
+        self.writer = None
+
+    def write(self, frame):
+        pa = self.pa
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            schema = pa.schema([
+                pa.field(field.name, pa.float64() if field.name in self.numeric else pa.string())
+                if column.null_count == len(column) else field
+                for field, column in zip(table.schema, table.columns)
+            ])
+            self.writer = self.pq.ParquetWriter(self.path, schema.remove_metadata())
+        schema = self.writer.schema
+        arrays = []
+        for field in schema:
+            column = table.column(field.name)
+            if not column.type.equals(field.type):
+                try:
+                    column = column.cast(field.type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    raise ValueError(f"列“{field.name}”的类型前后不一致，无法写入Parquet：{column.type} → {field.type}")
+            arrays.append(column)
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class XlsxWriter:
+    # openpyxl write-only workbook: rows are streamed to disk, a new worksheet is started
+    # when one is full
+    def __init__(self, path):
+        try:
+            from openpyxl import Workbook
+            from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        except ImportError:
+            raise ValueError("导出XLSX需要安装openpyxl")
+        self.path = path
+        self.illegal = ILLEGAL_CHARACTERS_RE
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self.header = None
+
+    def _new_sheet(self):
+        self.sheet = self.workbook.create_sheet(f"Sheet{len(self.workbook.worksheets) + 1}")
+        self.sheet.append(self.header)
+        self.sheet_rows = 1
+
+    def write(self, frame):
+        if self.header is None:
+            self.header = [str(name) for name in frame.columns]
+            self._new_sheet()
+        frame = frame.astype(object)
+        for name in frame.columns:
+            text = frame[name].map(lambda value: isinstance(value, str))
+            if text.any():
+                frame.loc[text, name] = frame.loc[text, name].str.replace(self.illegal, "", regex=True)
+        frame = frame.where(frame.notna(), None)
+        for row in frame.itertuples(index=False, name=None):
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter, "jsonl": JsonlWriter, "xlsx": XlsxWriter}
+
+
+def export_sessions(sources, path, fmt="csv", layout="joined", sep=", ", progress=None):
+    # Streams every source into one file, one chunk at a time; returns the rows written.
+    # progress(rows, fraction) is called after each chunk.
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的导出格式：{fmt}")
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"不支持的导出布局：{layout}")
+    columns = export_columns(sources, layout, sep)
+    total = sum(source.meta.get("count", 0) for source in sources) or 1
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    options = {"numeric": numeric_columns(sources)} if fmt == "parquet" else {}
+    writer = WRITERS[fmt](tmp_path, **options)
+    rows = 0
+    try:
+        for source in sources:
+            store = source.annotations()
+            start = 0
+            for chunk in source.chunks():
+                frame = annotate_chunk(chunk, store, start, layout, sep)
+                start += len(frame)
+                if len(sources) > 1:
+                    frame.insert(0, "session_timestamp", source.meta["timestamp"])
+                    frame.insert(1, "source_file", source.meta["filename"])
+                writer.write(frame.reindex(columns=columns))
+                rows += len(frame)
+                if progress is not None:
+                    progress(rows, min(1.0, rows / total))
+        if rows == 0:
+            writer.write(pd.DataFrame(columns=columns))  # header only
+        writer.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            writer.close()
+        except Exception:
+            pass
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logging.info(f"📤 成功导出：{path}（{len(sources)}个历史记录，共{rows}条）")
+    return rows
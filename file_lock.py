@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_TIMEOUT = 30  # seconds to wait for another process before giving up
+LOCK_POLL = 0.05
+
+
+class FileLock:
+    # Advisory lock on a side file (<path>), shared by every process that opens the same
+    # session folder: flock on POSIX, msvcrt.locking on Windows. Re-entrant within a process.
+    #   with FileLock(os.path.join(folder, ".lock")):
+    #       ...
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._file = None
+        self._depth = 0
+        self._thread_lock = threading.RLock()
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth:
+            self._depth += 1
+            return self
+        try:
+            self._file = open(self.path, "a+b")
+            deadline = time.monotonic() + self.timeout
+            while not self._try_lock():
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待文件锁超时（{self.path}），可能有其他用户正在保存")
+                time.sleep(LOCK_POLL)
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+        return self
+
+    def _try_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def lock_path(folder):
+    return os.path.join(folder, ".lock")
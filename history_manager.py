@@ -1,119 +1,464 @@
 import os
 import json
+import threading
+import warnings
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
+from annotation_store import AnnotationStore
+from annotation_journal import AnnotationJournal, write_json_atomic
+from file_lock import FileLock, lock_path
+from dedup_index import DedupIndex, DedupImport, DEDUP_INDEX_FILE, DUPLICATE_COLUMN
+from delta_import import DeltaMerge
+from import_pipeline import iter_chunks, conform_chunk, IMPORT_CHUNK_ROWS, TEXT_COLUMNS
+from instrumentation import timed
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # optional; sessions are then always read from data.csv
+    feather = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 HISTORY_DIR = ".history"
+JOURNAL_FILE = "annotations.journal.jsonl"
+INDEX_FILE = "index.json"
+SNAPSHOT_FILE = "data.feather"  # columnar copy of data.csv, rebuilt whenever it is older than the CSV
+ANNOTATION_SNAPSHOT_FILE = "annotations.npz"  # binary copy of annotations.json, same freshness rule
+COMPACT_THRESHOLD = 5000  # journal entries before it is folded into annotations.json
+ANNOTATORS_DIR = "annotators"  # annotators/<name>/ holds the annotation files of one coder
+ANNOTATOR_ENV = "LABEL_TOOL_ANNOTATOR"
+EXPECTED_COLUMNS = [
+    "title", "publish_time", "author_name", "like_count", "comment_count",
+    "share_count", "collect_count", "video_url", "danmaku_count", "duration",
+    "video_id", "play_count", "author_official_role", "is_verified"
+]
+ZERO_FILLED_COLUMNS = [
+    "like_count", "comment_count", "share_count", "collect_count",
+    "danmaku_count", "play_count", "author_official_role", "is_verified"
+]
+
+def fill_expected_columns(df):
+    for col in EXPECTED_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0 if col in ZERO_FILLED_COLUMNS else ""
+    return df
+
+def check_annotator(name):
+    # "" is the session's main layer; any other name is used as a folder name
+    name = (name or "").strip()
+    if name.startswith(".") or any(c in name for c in '/\\:*?"<>|'):
+        raise ValueError(f"标注员名称不合法：{name}")
+    return name
+
+def typed_frame(df):
+    # publish_time becomes datetime64 when every non-empty value parses; otherwise it is kept as read
+    if "publish_time" in df.columns and df["publish_time"].dtype.kind not in "iufM":
+        values = df["publish_time"]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(values, errors="coerce")
+        if parsed.notna().sum() == values.replace("", None).notna().sum():
+            df["publish_time"] = parsed
+    return df
 
 class HistoryManager:
-    def __init__(self, history_dir=HISTORY_DIR):
+    def __init__(self, history_dir=HISTORY_DIR, fsync_policy="always", compact_threshold=COMPACT_THRESHOLD, annotator=None):
         self.history_dir = history_dir
+        self.fsync_policy = fsync_policy
+        self.compact_threshold = compact_threshold
+        # Annotation layer used when a call does not name one ("" = main layer)
+        self.annotator = check_annotator(os.environ.get(ANNOTATOR_ENV, "") if annotator is None else annotator)
+        self._journals = {}  # layer folder -> AnnotationJournal
+        self._locks = {}  # layer folder -> FileLock shared with other processes
+        self._dedup_index = None
+        self._lock = threading.RLock()  # serializes journal appends and compaction across threads
+        # In-memory history index: timestamp -> {"meta": ..., "mtime": meta.json mtime_ns}
+        self._index = None
+        self._index_dir_mtime = None
+        self._sorted_metas = []
         os.makedirs(self.history_dir, exist_ok=True)
         logging.info(f"✅ 初始化历史记录目录：{self.history_dir}")
 
     def get_history(self):
-        metas = []
+        # A stat of the history folder and of each meta.json per call while the index is valid:
+        # another process rewriting a meta.json in place does not change the folder's mtime
+        with self._lock:
+            if self._index is None or self._dir_mtime() != self._index_dir_mtime or self._meta_changed():
+                self._load_index()
+            return list(self._sorted_metas)
+
+    def _dir_mtime(self):
+        return os.stat(self.history_dir).st_mtime_ns
+
+    def _meta_changed(self):
+        for name, entry in self._index.items():
+            try:
+                mtime = os.stat(os.path.join(self.history_dir, name, "meta.json")).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != entry.get("mtime"):
+                return True
+        return False
+
+    def _read_meta(self, name):
+        meta_file_path = os.path.join(self.history_dir, name, "meta.json")
+        if not os.path.exists(meta_file_path):
+            logging.warning(f"⚠️ 跳过无元数据的目录：{os.path.join(self.history_dir, name)}")
+            return None
+        try:
+            mtime = os.stat(meta_file_path).st_mtime_ns
+            with open(meta_file_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            logging.debug(f"📥 成功加载元数据：{meta_file_path}")
+            return {"meta": meta, "mtime": mtime}
+        except Exception as e:
+            logging.error(f"❌ 加载元数据失败（{meta_file_path}）：{str(e)}")
+            return None
+
+    def _load_index(self):
+        # Reuse the persisted index for every folder whose meta.json is unchanged
+        index_file_path = os.path.join(self.history_dir, INDEX_FILE)
+        cached = {}
+        try:
+            with open(index_file_path, "r", encoding="utf-8") as f:
+                cached = json.load(f).get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            cached = {}
+
+        index = {}
+        reparsed = 0
         for name in os.listdir(self.history_dir):
             folder_path = os.path.join(self.history_dir, name)
-            if not os.path.isdir(folder_path):
-                continue
-            meta_file_path = os.path.join(folder_path, "meta.json")
-            if not os.path.exists(meta_file_path):
-                logging.warning(f"⚠️ 跳过无元数据的目录：{folder_path}")
+            if name.startswith(".") or not os.path.isdir(folder_path):
                 continue
+            entry = cached.get(name)
             try:
-                with open(meta_file_path, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-                metas.append(meta)
-                logging.debug(f"📥 成功加载元数据：{meta_file_path}")
-            except Exception as e:
-                logging.error(f"❌ 加载元数据失败（{meta_file_path}）：{str(e)}")
-                continue
-        metas.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        logging.info(f"📊 共加载 {len(metas)} 条历史导入记录")
-        return metas
+                mtime = os.stat(os.path.join(folder_path, "meta.json")).st_mtime_ns
+            except OSError:
+                mtime = None
+            if entry is None or entry.get("mtime") != mtime:
+                entry = self._read_meta(name)
+                reparsed += 1
+            if entry is not None:
+                index[name] = entry
+        self._index = index
+        self._sort_index()
+        self._save_index()
+        logging.info(f"📊 共加载 {len(self._sorted_metas)} 条历史导入记录（重新解析{reparsed}条）")
+
+    def _sort_index(self):
+        self._sorted_metas = sorted(
+            (entry["meta"] for entry in self._index.values()),
+            key=lambda x: x.get("timestamp", ""), reverse=True
+        )
 
-    def get_data(self, meta):
+    def _save_index(self):
+        # Rewritten in place so that the history folder's own mtime does not change;
+        # a torn index is simply rebuilt from the meta files on the next load
+        index_file_path = os.path.join(self.history_dir, INDEX_FILE)
+        try:
+            if not os.path.exists(index_file_path):
+                open(index_file_path, "w").close()
+            with open(index_file_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self._index}, f, ensure_ascii=False)
+            self._index_dir_mtime = self._dir_mtime()
+        except Exception as e:
+            logging.error(f"❌ 保存历史索引失败（{index_file_path}）：{str(e)}")
+            self._index_dir_mtime = None
+
+    def _update_index(self, timestamp, meta=None):
+        with self._lock:
+            if self._index is None:
+                return
+            if meta is None:
+                self._index.pop(timestamp, None)
+            else:
+                meta_file_path = os.path.join(self.history_dir, timestamp, "meta.json")
+                mtime = os.stat(meta_file_path).st_mtime_ns if os.path.exists(meta_file_path) else None
+                self._index[timestamp] = {"meta": meta, "mtime": mtime}
+            self._sort_index()
+            self._save_index()
+
+    @timed("history.get_data")
+    def get_data(self, meta, progress=None, annotator=None):
+        # progress(rows, fraction) is called between the data and annotation steps
         crawl_folder = os.path.join(self.history_dir, meta["timestamp"])
         data_file_path = os.path.join(crawl_folder, "data.csv")
-        anno_file_path = os.path.join(crawl_folder, "annotations.json")
+        snapshot_file_path = os.path.join(crawl_folder, SNAPSHOT_FILE)
+
+        df = self._read_snapshot(snapshot_file_path, data_file_path)
+        if df is not None:
+            if progress is not None:
+                progress(len(df), 0.5)
+            return df, self.load_annotations(meta, len(df), annotator)
 
         df = pd.DataFrame()
-        jama = []
-        gqs = []
-        discern = []
-        custom_data = {}
 
         if os.path.exists(data_file_path):
             try:
-                df = pd.read_csv(data_file_path, encoding="utf-8-sig")
+                df = pd.read_csv(data_file_path, encoding="utf-8-sig", dtype=TEXT_COLUMNS)
                 logging.info(f"📥 成功加载数据：{data_file_path}（共{len(df)}条）")
             except Exception as e:
                 logging.error(f"❌ UTF-8编码读取数据失败（{data_file_path}）：{str(e)}")
                 try:
-                    df = pd.read_csv(data_file_path, encoding="latin1")
+                    df = pd.read_csv(data_file_path, encoding="latin1", dtype=TEXT_COLUMNS)
                     logging.info(f"📥 备用编码（latin1）加载数据成功：{data_file_path}")
                 except Exception as e2:
                     logging.error(f"❌ 备用编码读取数据失败（{data_file_path}）：{str(e2)}")
+            if not df.empty:
+                df = typed_frame(df)
+                self._write_snapshot(df, snapshot_file_path)
+
+        if progress is not None:
+            progress(len(df), 0.5)
+        return df, self.load_annotations(meta, len(df), annotator)
+
+    def data_stamp(self, meta):
+        # Changes whenever the session's data.csv is rewritten; None when the session is gone
+        try:
+            stat = os.stat(os.path.join(self.history_dir, meta["timestamp"], "data.csv"))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _fresh_snapshot(self, meta):
+        # Path of the columnar snapshot when it can be used instead of data.csv, else None
+        crawl_folder = os.path.join(self.history_dir, meta["timestamp"])
+        snapshot_file_path = os.path.join(crawl_folder, SNAPSHOT_FILE)
+        data_file_path = os.path.join(crawl_folder, "data.csv")
+        if feather is None or not os.path.exists(snapshot_file_path):
+            return None
+        if os.path.exists(data_file_path) and \
+                os.stat(snapshot_file_path).st_mtime_ns < os.stat(data_file_path).st_mtime_ns:
+            return None
+        return snapshot_file_path
+
+    def data_columns(self, meta):
+        # Column names of a session without reading its rows
+        snapshot_file_path = self._fresh_snapshot(meta)
+        if snapshot_file_path is not None:
+            return feather.read_table(snapshot_file_path, memory_map=True).column_names
+        data_file_path = os.path.join(self.history_dir, meta["timestamp"], "data.csv")
+        if not os.path.exists(data_file_path):
+            return []
+        return pd.read_csv(data_file_path, encoding="utf-8-sig", nrows=0).columns.tolist()
+
+    def iter_data(self, meta, chunksize=IMPORT_CHUNK_ROWS):
+        # Session rows in order, at most chunksize at a time: slices of the memory-mapped
+        # snapshot when it is fresh, otherwise chunks of data.csv
+        snapshot_file_path = self._fresh_snapshot(meta)
+        if snapshot_file_path is not None:
+            table = feather.read_table(snapshot_file_path, memory_map=True)
+            for start in range(0, table.num_rows, chunksize):
+                yield table.slice(start, chunksize).to_pandas()
+            return
+        data_file_path = os.path.join(self.history_dir, meta["timestamp"], "data.csv")
+        if not os.path.exists(data_file_path):
+            return
+        for chunk in pd.read_csv(data_file_path, encoding="utf-8-sig", chunksize=chunksize, dtype=TEXT_COLUMNS):
+            yield typed_frame(chunk)
+
+    def _read_snapshot(self, snapshot_file_path, data_file_path):
+        # Memory-mapped read of the columnar snapshot, if it is at least as new as data.csv
+        if feather is None or not os.path.exists(snapshot_file_path):
+            return None
+        try:
+            if os.path.exists(data_file_path) and \
+                    os.stat(snapshot_file_path).st_mtime_ns < os.stat(data_file_path).st_mtime_ns:
+                logging.info(f"⚠️ 列式快照已过期，重新读取CSV：{snapshot_file_path}")
+                return None
+            df = feather.read_table(snapshot_file_path, memory_map=True).to_pandas()
+            logging.info(f"📥 成功加载列式快照：{snapshot_file_path}（共{len(df)}条）")
+            return df
+        except Exception as e:
+            logging.error(f"❌ 加载列式快照失败（{snapshot_file_path}）：{str(e)}")
+            return None
+
+    def _write_snapshot(self, df, snapshot_file_path):
+        # Uncompressed so that numeric columns can be used straight from the memory map
+        if feather is None:
+            return
+        tmp_path = f"{snapshot_file_path}.tmp"
+        try:
+            feather.write_feather(df, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, snapshot_file_path)
+            logging.info(f"📝 成功保存列式快照：{snapshot_file_path}")
+        except Exception as e:
+            logging.error(f"❌ 保存列式快照失败（{snapshot_file_path}）：{str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @timed("history.load_annotations")
+    def load_annotations(self, meta, n_rows=0, annotator=None):
+        # Snapshot plus journal replay of one layer; reads only the annotation files
+        folder = self.layer_folder(meta, annotator)
+        anno_file_path = os.path.join(folder, "annotations.json")
+        npz_file_path = os.path.join(folder, ANNOTATION_SNAPSHOT_FILE)
+        custom_columns = meta.get("custom_columns", [])
+
+        if not os.path.isdir(folder):
+            # An annotator who has not saved anything in this session yet
+            store = AnnotationStore(n_rows, custom_columns)
+            store.sync_state = {"base": None, "offset": 0}
+            return store
+
+        with self._lock, self.layer_lock(meta, annotator):
+            store = self._read_annotation_snapshot(npz_file_path, anno_file_path, custom_columns, n_rows)
+            if store is None and os.path.exists(anno_file_path):
+                try:
+                    with open(anno_file_path, "r", encoding="utf-8") as f:
+                        annotations_data = json.load(f)
+                    store = AnnotationStore.from_records(annotations_data, custom_columns, n_rows=n_rows)
+                    logging.info(f"📥 成功加载注解数据：{anno_file_path}（共{len(annotations_data)}条）")
+                    if n_rows > len(annotations_data):
+                        logging.info(f"📝 扩展注解长度以匹配数据：原注解{len(annotations_data)}条 → 新注解{n_rows}条")
+                    self._write_annotation_snapshot(store, npz_file_path)
+                except Exception as e:
+                    logging.error(f"❌ 加载注解数据失败（{anno_file_path}）：{str(e)}")
+                    store = AnnotationStore(n_rows, custom_columns)
+            elif store is None:
+                if folder == os.path.join(self.history_dir, meta["timestamp"]):
+                    logging.warning(f"⚠️ 注解文件不存在：{anno_file_path}，初始化空注解")
+                store = AnnotationStore(n_rows, custom_columns)
+
+            journal = self.get_journal(meta, annotator)
+            offset = 0
+            if journal.exists():
+                replayed, offset = journal.replay(store)
+                store.dirty = set()
+                logging.info(f"📥 回放注解日志：{journal.path}（共{replayed}条）")
+            store.sync_state = {"base": self._layer_base(folder), "offset": offset}
+
+        return store
+
+    def sync_annotations(self, meta, store, annotator=None):
+        # Brings a loaded store up to date with what other processes appended to its layer,
+        # parsing only the journal lines after the store's offset; unsaved rows of the store
+        # are kept. Returns the changed rows, or None when the layer was compacted meanwhile
+        # (or the store was not loaded from it) and has to be reloaded.
+        state = store.sync_state
+        if state is None:
+            return None
+        folder = self.layer_folder(meta, annotator)
+        journal = self.get_journal(meta, annotator)
+        if journal.size() == state["offset"] and self._layer_base(folder) == state["base"]:
+            return []
+        with self._lock, self.layer_lock(meta, annotator):
+            return self._sync_locked(folder, journal, store)
+
+    def _sync_locked(self, folder, journal, store):
+        state = store.sync_state
+        if self._layer_base(folder) != state["base"] or journal.size() < state["offset"]:
+            return None
+        entries, offset = journal.read(state["offset"])
+        rows = journal.apply(store, entries, skip=store.dirty, only_changed=True)
+        journal.count += len(entries)
+        state["offset"] = offset
+        if rows:
+            logging.info(f"🔄 同步注解：{journal.path}（共{len(rows)}行有变化）")
+        return rows
+
+    def _layer_base(self, folder):
+        # mtime of the layer's annotations.json, which changes whenever the journal is folded into it
+        try:
+            return os.stat(os.path.join(folder, "annotations.json")).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_annotation_snapshot(self, npz_file_path, anno_file_path, custom_columns, n_rows):
+        if not os.path.exists(npz_file_path):
+            return None
+        try:
+            if os.path.exists(anno_file_path) and \
+                    os.stat(npz_file_path).st_mtime_ns < os.stat(anno_file_path).st_mtime_ns:
+                logging.info(f"⚠️ 注解快照已过期，重新读取JSON：{npz_file_path}")
+                return None
+            with np.load(npz_file_path, allow_pickle=False) as data:
+                store = AnnotationStore.from_arrays(data, custom_columns, n_rows)
+            if store is None:
+                logging.info(f"⚠️ 注解快照字段定义不一致，重新读取JSON：{npz_file_path}")
+                return None
+            logging.info(f"📥 成功加载注解快照：{npz_file_path}（共{store.n_rows}条）")
+            return store
+        except Exception as e:
+            logging.error(f"❌ 加载注解快照失败（{npz_file_path}）：{str(e)}")
+            return None
+
+    def _write_annotation_snapshot(self, store, npz_file_path):
+        tmp_path = f"{npz_file_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **store.to_arrays())
+            os.replace(tmp_path, npz_file_path)
+            logging.info(f"📝 成功保存注解快照：{npz_file_path}")
+        except Exception as e:
+            logging.error(f"❌ 保存注解快照失败（{npz_file_path}）：{str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def layer_folder(self, meta, annotator=None):
+        # Annotation files of a layer: the session folder itself for the main layer,
+        # annotators/<name>/ inside it for a named annotator
+        annotator = self.annotator if annotator is None else check_annotator(annotator)
+        crawl_folder = os.path.join(self.history_dir, meta["timestamp"])
+        return os.path.join(crawl_folder, ANNOTATORS_DIR, annotator) if annotator else crawl_folder
+
+    def layer_lock(self, meta, annotator=None):
+        # Advisory lock of a layer, held while its journal, annotations.json or snapshot
+        # are written or read together, so coders sharing the folder never interleave.
+        # The lock file lives in the layer folder, which only a write creates (_create_layer)
+        folder = self.layer_folder(meta, annotator)
+        with self._lock:
+            lock = self._locks.get(folder)
+            if lock is None:
+                lock = self._locks[folder] = FileLock(lock_path(folder))
+            return lock
+
+    def _create_layer(self, meta, annotator=None):
+        # A named annotator's folder appears with their first saved row, not when a layer is read
+        os.makedirs(self.layer_folder(meta, annotator), exist_ok=True)
+
+    def list_annotators(self, meta):
+        # Named annotator layers of a session that hold a journal or annotations.json
+        folder = os.path.join(self.history_dir, meta["timestamp"], ANNOTATORS_DIR)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            name for name in os.listdir(folder)
+            if not name.startswith(".") and any(
+                os.path.exists(os.path.join(folder, name, file_name)) for file_name in (JOURNAL_FILE, "annotations.json")
+            )
+        )
+
+    def get_journal(self, meta, annotator=None):
+        folder = self.layer_folder(meta, annotator)
+        journal = self._journals.get(folder)
+        if journal is None:
+            journal = AnnotationJournal(os.path.join(folder, JOURNAL_FILE), fsync_policy=self.fsync_policy)
+            self._journals[folder] = journal
+        return journal
 
-        if os.path.exists(anno_file_path):
+    def _create_session_folder(self):
+        # Timestamps name the session folders; imports within the same second (or from
+        # parallel processes) take the next free second, makedirs being the atomic claim
+        moment = datetime.now()
+        while True:
+            timestamp = moment.strftime("%Y%m%d%H%M%S")
+            crawl_folder = os.path.join(self.history_dir, timestamp)
             try:
-                with open(anno_file_path, "r", encoding="utf-8") as f:
-                    annotations_data = json.load(f)
-                for ann in annotations_data:
-                    jama.append(set(ann.get("jama", [])))
-                    gqs.append(int(ann.get("gqs", 1)))
-                    discern.append(set(ann.get("discern", [])))
-                    for col in meta.get("custom_columns", []):
-                        col_name = col["name"]
-                        col_type = col["type"]
-                        if col_name not in custom_data:
-                            custom_data[col_name] = []
-                        value = ann.get(col_name, set() if col_type == "multi" else "")
-                        if col_type == "multi" and isinstance(value, list):
-                            value = set(value)
-                        custom_data[col_name].append(value)
-                logging.info(f"📥 成功加载注解数据：{anno_file_path}（共{len(annotations_data)}条）")
-            except Exception as e:
-                logging.error(f"❌ 加载注解数据失败（{anno_file_path}）：{str(e)}")
-                jama = [set() for _ in range(len(df))]
-                gqs = [1 for _ in range(len(df))]
-                discern = [set() for _ in range(len(df))]
-                for col in meta.get("custom_columns", []):
-                    col_name = col["name"]
-                    col_type = col["type"]
-                    custom_data[col_name] = [set() if col_type == "multi" else "" for _ in range(len(df))]
-        else:
-            logging.warning(f"⚠️ 注解文件不存在：{anno_file_path}，初始化空注解")
-            jama = [set() for _ in range(len(df))]
-            gqs = [1 for _ in range(len(df))]
-            discern = [set() for _ in range(len(df))]
-            for col in meta.get("custom_columns", []):
-                col_name = col["name"]
-                col_type = col["type"]
-                custom_data[col_name] = [set() if col_type == "multi" else "" for _ in range(len(df))]
-
-        if len(df) > len(jama):
-            jama.extend([set() for _ in range(len(df) - len(jama))])
-            gqs.extend([1 for _ in range(len(df) - len(gqs))])
-            discern.extend([set() for _ in range(len(df) - len(discern))])
-            for col in meta.get("custom_columns", []):
-                col_name = col["name"]
-                col_type = col["type"]
-                custom_data[col_name].extend([set() if col_type == "multi" else "" for _ in range(len(df) - len(custom_data[col_name]))])
-            logging.info(f"📝 扩展注解长度以匹配数据：原注解{len(jama)-len(df)+len(jama)}条 → 新注解{len(jama)}条")
-
-        return df, jama, gqs, discern, custom_data
+                os.makedirs(crawl_folder)
+                logging.info(f"📁 创建新历史记录目录：{crawl_folder}")
+                return timestamp, crawl_folder
+            except FileExistsError:
+                moment += timedelta(seconds=1)
 
+    @timed("history.add_history")
     def add_history(self, filename, data, custom_columns):
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        crawl_folder = os.path.join(self.history_dir, timestamp)
-        os.makedirs(crawl_folder, exist_ok=True)
-        logging.info(f"📁 创建新历史记录目录：{crawl_folder}")
+        timestamp, crawl_folder = self._create_session_folder()
 
         meta = {
             "timestamp": timestamp,
@@ -133,62 +478,226 @@ class HistoryManager:
             logging.error(f"❌ 保存元数据失败（{meta_file_path}）：{str(e)}")
 
         try:
-            df = pd.DataFrame(data)
-            expected_columns = [
-                "title", "publish_time", "author_name", "like_count", "comment_count",
-                "share_count", "collect_count", "video_url", "danmaku_count", "duration",
-                "video_id", "play_count", "author_official_role", "is_verified"
-            ]
-            for col in expected_columns:
-                if col not in df.columns:
-                    if col in ["like_count", "comment_count", "share_count", "collect_count",
-                               "danmaku_count", "play_count", "author_official_role"]:
-                        df[col] = 0
-                    else:
-                        df[col] = ""
+            df = fill_expected_columns(pd.DataFrame(data))
             df.to_csv(data_file_path, index=False, encoding="utf-8-sig")
             logging.info(f"📝 成功保存数据：{data_file_path}（共{len(df)}条，{len(df.columns)}个字段）")
         except Exception as e:
             logging.error(f"❌ 保存数据失败（{data_file_path}）：{str(e)}")
 
-        empty_annotations = [
-            {
-                "jama": [],
-                "gqs": 1,
-                "discern": [],
-                **{col["name"]: [] if col["type"] == "multi" else "" for col in custom_columns}
-            }
-            for _ in range(len(data))
-        ]
+        empty_store = AnnotationStore(len(data), custom_columns)
+        empty_annotations = empty_store.to_records()
         try:
             with open(anno_file_path, "w", encoding="utf-8") as f:
                 json.dump(empty_annotations, f, ensure_ascii=False, indent=2)
             logging.info(f"📝 成功初始化空注解：{anno_file_path}（共{len(empty_annotations)}条）")
+            self._write_annotation_snapshot(empty_store, os.path.join(crawl_folder, ANNOTATION_SNAPSHOT_FILE))
         except Exception as e:
             logging.error(f"❌ 初始化注解失败（{anno_file_path}）：{str(e)}")
 
+        self._update_index(timestamp, meta)
         return meta
 
-    def save_annotations(self, meta, jama, gqs, discern, custom_data):
-        crawl_folder = os.path.join(self.history_dir, meta["timestamp"])
+    @timed("history.add_history_from_file")
+    def add_history_from_file(self, file_path, custom_columns, chunksize=IMPORT_CHUNK_ROWS, progress=None, dedup=None):
+        # dedup: "flag", "skip" or "off" (see dedup_index); the index is brought up to date
+        # before the new session folder exists
+        with DedupImport(self, dedup, custom_columns) as deduper:
+            meta = self._import_file(file_path, custom_columns, chunksize, progress, deduper)
+        self._update_index(meta["timestamp"], meta)
+        return meta
+
+    def _import_file(self, file_path, custom_columns, chunksize, progress, deduper):
+        # Streaming import: one chunk in memory at a time, data.csv and annotations.json are
+        # appended per chunk. meta.json is written last, so an interrupted import leaves a
+        # folder that get_history() skips.
+        timestamp, crawl_folder = self._create_session_folder()
+        filename = os.path.basename(file_path)
+
+        meta_file_path = os.path.join(crawl_folder, "meta.json")
+        data_file_path = os.path.join(crawl_folder, "data.csv")
         anno_file_path = os.path.join(crawl_folder, "annotations.json")
+        # Every row starts with the same empty annotation record
+        empty_record = json.dumps(AnnotationStore(1, custom_columns).record(0), ensure_ascii=False, separators=(",", ":"))
+
+        count = 0
+        columns = None
+        try:
+            with open(anno_file_path, "w", encoding="utf-8") as anno_file:
+                anno_file.write("[")
+                for chunk, fraction in iter_chunks(file_path, chunksize):
+                    chunk = conform_chunk(chunk, columns, fill_expected_columns)
+                    chunk, reused = deduper.prepare(chunk, count, timestamp)
+                    chunk.to_csv(
+                        data_file_path, index=False, encoding="utf-8-sig" if columns is None else "utf-8",
+                        mode="w" if columns is None else "a", header=columns is None
+                    )
+                    records = [empty_record] * len(chunk)
+                    for row, record in reused:
+                        records[row - count] = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+                    if records:
+                        anno_file.write(("," if count else "") + ",".join(records))
+                    columns = list(chunk.columns)
+                    count += len(chunk)
+                    if progress is not None:
+                        progress(count, fraction)
+                anno_file.write("]")
+            if columns is None:
+                fill_expected_columns(pd.DataFrame()).to_csv(data_file_path, index=False, encoding="utf-8-sig")
+            logging.info(f"📝 成功保存数据：{data_file_path}（共{count}条，{len(columns or [])}个字段）")
+            store = AnnotationStore(count, custom_columns)
+            for row, record in deduper.reused.items():
+                store.apply_record(row, record)
+            self._write_annotation_snapshot(store, os.path.join(crawl_folder, ANNOTATION_SNAPSHOT_FILE))
 
-        annotations = [
-            {
-                "jama": list(jama[i]),
-                "gqs": gqs[i],
-                "discern": list(discern[i]),
-                **{col_name: list(custom_data[col_name][i]) if isinstance(custom_data[col_name][i], set) else custom_data[col_name][i] for col_name in custom_data}
+            meta = {
+                "timestamp": timestamp,
+                "filename": filename,
+                "count": count,
+                "custom_columns": custom_columns
             }
-            for i in range(len(jama))
-        ]
+            stats = deduper.finish(timestamp, count)
+            if stats is not None:
+                meta["dedup"] = stats
+            if deduper.late and deduper.mode == "flag":
+                # Rare (a parallel import registered the same videos first): one rewrite as text
+                stored = pd.read_csv(data_file_path, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+                stored.iloc[list(deduper.late), stored.columns.get_loc(DUPLICATE_COLUMN)] = list(deduper.late.values())
+                tmp_path = f"{data_file_path}.tmp"
+                stored.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+                os.replace(tmp_path, data_file_path)
+            with open(meta_file_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            logging.info(f"📝 成功保存元数据：{meta_file_path}")
+        except Exception as e:
+            logging.error(f"❌ 导入文件失败（{file_path}）：{str(e)}")
+            import shutil
+            shutil.rmtree(crawl_folder, ignore_errors=True)
+            raise
+        return meta
 
+    @timed("history.update_history_from_file")
+    def update_history_from_file(self, meta, file_path, chunksize=IMPORT_CHUNK_ROWS, progress=None):
+        # Refreshes a session from a new crawl of the same topic (see delta_import): counts of
+        # matched videos are replaced, new videos appended, annotation files are not touched.
+        # data.csv is appended to when only new videos came in; a changed count means a CSV
+        # rewrite (temp file + rename), since a CSV row cannot be updated in place.
+        crawl_folder = os.path.join(self.history_dir, meta["timestamp"])
+        data_file_path = os.path.join(crawl_folder, "data.csv")
+        meta_file_path = os.path.join(crawl_folder, "meta.json")
+        with self.layer_lock(meta, ""):
+            # Read as text so that rewritten rows keep their original formatting (ids, dates)
+            stored = pd.read_csv(data_file_path, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+            merge = DeltaMerge(stored)
+            added = []
+            for chunk, fraction in iter_chunks(file_path, chunksize):
+                new_rows = merge.apply(chunk)
+                if len(new_rows):
+                    added.append(fill_expected_columns(new_rows).reindex(columns=stored.columns))
+                if progress is not None:
+                    progress(merge.stats["rows"], fraction)
+            stats = merge.finish()
+            rows = merge.changed_rows()
+            try:
+                if len(rows):
+                    for name in merge.metrics:
+                        cells, values = merge.updates(name)
+                        stored.iloc[cells, stored.columns.get_loc(name)] = [str(value) for value in values]
+                    tmp_path = f"{data_file_path}.tmp"
+                    stored.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+                    for new_rows in added:
+                        new_rows.to_csv(tmp_path, index=False, encoding="utf-8", mode="a", header=False)
+                    os.replace(tmp_path, data_file_path)
+                else:
+                    for new_rows in added:
+                        new_rows.to_csv(data_file_path, index=False, encoding="utf-8", mode="a", header=False)
+                logging.info(f"📝 成功更新数据：{data_file_path}（更新{len(rows)}条，新增{stats['added']}条）")
+
+                with open(meta_file_path, "r", encoding="utf-8") as f:
+                    meta_data = json.load(f)
+                meta_data["count"] = len(stored) + stats["added"]
+                meta_data["last_update"] = dict(stats, filename=os.path.basename(file_path),
+                                                time=datetime.now().strftime("%Y%m%d%H%M%S"))
+                with open(meta_file_path, "w", encoding="utf-8") as f:
+                    json.dump(meta_data, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                logging.error(f"❌ 更新数据失败（{data_file_path}）：{str(e)}")
+                raise
+        self._update_index(meta["timestamp"], meta_data)
+        return meta_data
+
+    def dedup_index(self):
+        # Shared by every import of this history folder (see dedup_index.DedupIndex)
+        with self._lock:
+            if self._dedup_index is None:
+                self._dedup_index = DedupIndex(os.path.join(self.history_dir, DEDUP_INDEX_FILE))
+            return self._dedup_index
+
+    @timed("history.save_annotations")
+    def save_annotations(self, meta, store, rows=None, annotator=None):
+        # Appends the edited rows to the layer's journal; cost depends on the
+        # number of edited rows, not on the session size
+        rows = store.take_dirty() if rows is None else rows
+        if not rows:
+            return 0
         try:
-            with open(anno_file_path, "w", encoding="utf-8") as f:
-                json.dump(annotations, f, ensure_ascii=False, indent=2)
-            logging.info(f"📝 成功保存注解：{anno_file_path}（共{len(annotations)}条）")
-        except Exception as e:
-            logging.error(f"❌ 保存注解失败（{anno_file_path}）：{str(e)}")
+            return self.append_annotations(meta, [(row, store.record(row)) for row in rows], store, annotator)
+        except Exception:
+            store.dirty.update(rows)
+            raise
+
+    @timed("history.append_annotations")
+    def append_annotations(self, meta, entries, store=None, annotator=None):
+        # entries: [(row, record)]; safe to call from a worker thread when store is None
+        self._create_layer(meta, annotator)
+        with self._lock, self.layer_lock(meta, annotator):
+            journal = self.get_journal(meta, annotator)
+            state = store.sync_state if store is not None else None
+            in_sync = state is not None and journal.size() == state["offset"]
+            try:
+                written = journal.append(entries)
+                logging.info(f"📝 成功追加注解日志：{journal.path}（共{written}条）")
+            except Exception as e:
+                logging.error(f"❌ 追加注解日志失败（{journal.path}）：{str(e)}")
+                raise
+            if in_sync:
+                state["offset"] = journal.size()  # nobody else wrote in between
+            if journal.count >= self.compact_threshold:
+                self.compact_annotations(meta, store, annotator)
+        return written
+
+    @timed("history.compact_annotations")
+    def compact_annotations(self, meta, store=None, annotator=None):
+        # Folds the layer's journal into a new annotations.json snapshot (temp file + rename).
+        # A loaded store first takes in what others appended; a store that was not loaded
+        # from the layer (sync_state None) replaces it as it is.
+        folder = self.layer_folder(meta, annotator)
+        anno_file_path = os.path.join(folder, "annotations.json")
+        self._create_layer(meta, annotator)
+        with self._lock, self.layer_lock(meta, annotator):
+            journal = self.get_journal(meta, annotator)
+            if store is not None and store.sync_state is not None and \
+                    self._sync_locked(folder, journal, store) is None:
+                store = None  # compacted by someone else since it was loaded: fold what is on disk
+            if store is None:
+                store = self.load_annotations(meta, annotator=annotator)
+            try:
+                write_json_atomic(anno_file_path, store.to_records())
+                self._write_annotation_snapshot(store, os.path.join(folder, ANNOTATION_SNAPSHOT_FILE))
+                store.dirty = set()
+                journal.clear()
+                store.sync_state = {"base": self._layer_base(folder), "offset": 0}
+                logging.info(f"📝 成功压缩注解：{anno_file_path}（共{store.n_rows}条）")
+                return True
+            except Exception as e:
+                logging.error(f"❌ 压缩注解失败（{anno_file_path}）：{str(e)}")
+                return False
+
+    def replace_annotations(self, meta, store, annotator=None):
+        # Overwrites a layer with store, e.g. with the result of merging several annotators
+        store.sync_state = None
+        if not self.compact_annotations(meta, store, annotator):
+            raise ValueError(f"写入注解失败：{self.layer_folder(meta, annotator)}")
+        return store.n_rows
 
     def save_custom_columns(self, meta, custom_columns):
         if not meta:
@@ -196,11 +705,13 @@ class HistoryManager:
         crawl_folder = os.path.join(self.history_dir, meta["timestamp"])
         meta_file_path = os.path.join(crawl_folder, "meta.json")
         try:
-            with open(meta_file_path, "r", encoding="utf-8") as f:
-                meta_data = json.load(f)
-            meta_data["custom_columns"] = custom_columns
-            with open(meta_file_path, "w", encoding="utf-8") as f:
-                json.dump(meta_data, f, ensure_ascii=False, indent=2)
+            with self.layer_lock(meta, ""):
+                with open(meta_file_path, "r", encoding="utf-8") as f:
+                    meta_data = json.load(f)
+                meta_data["custom_columns"] = custom_columns
+                with open(meta_file_path, "w", encoding="utf-8") as f:
+                    json.dump(meta_data, f, ensure_ascii=False, indent=2)
+            self._update_index(meta["timestamp"], meta_data)
             logging.info(f"📝 成功保存自定义字段：{meta_file_path}")
         except Exception as e:
             logging.error(f"❌ 保存自定义字段失败（{meta_file_path}）：{str(e)}")
@@ -213,8 +724,20 @@ class HistoryManager:
         try:
             import shutil
             shutil.rmtree(crawl_folder)
+            for cache in (self._journals, self._locks):
+                for folder in [folder for folder in cache if os.path.commonpath([folder, crawl_folder]) == crawl_folder]:
+                    del cache[folder]
+            self._update_index(meta["timestamp"])
             logging.info(f"🗑️ 成功删除历史记录：{crawl_folder}（文件名：{meta['filename']}）")
             return True
         except Exception as e:
             logging.error(f"❌ 删除历史记录失败（{crawl_folder}）：{str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+def open_history_manager(backend=None, **kwargs):
+    # "files" keeps one .history/<timestamp>/ folder per import, "sqlite" uses a single database
+    backend = backend or os.environ.get("LABEL_TOOL_BACKEND", "files")
+    if backend == "sqlite":
+        from sqlite_history import SqliteHistoryManager
+        return SqliteHistoryManager(**kwargs)
+    return HistoryManager(**kwargs)
@@ -0,0 +1,87 @@
+import os
+import logging
+
+import pandas as pd
+
+IMPORT_CHUNK_ROWS = 50000  # rows held in memory at once while importing
+SUPPORTED_EXTENSIONS = (".csv", ".txt", ".xlsx", ".xls")
+# Read as text: 19-digit video ids do not survive float64, which a numeric column with gaps becomes
+TEXT_COLUMNS = {"video_id": str}
+
+
+def iter_chunks(file_path, chunksize=IMPORT_CHUNK_ROWS):
+    # Yields (chunk DataFrame, fraction of the input consumed or None) without loading the whole file
+    if file_path.endswith(".csv"):
+        yield from _iter_text_chunks(file_path, chunksize, sep=",", encoding="utf-8-sig")
+    elif file_path.endswith(".txt"):
+        yield from _iter_text_chunks(file_path, chunksize, sep="\t", encoding="utf-8")
+    elif file_path.endswith(".xlsx"):
+        yield from _iter_xlsx_chunks(file_path, chunksize)
+    elif file_path.endswith(".xls"):
+        # The legacy binary format has no streaming reader; it is read at once and sliced
+        df = pd.read_excel(file_path, dtype=TEXT_COLUMNS)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize].reset_index(drop=True), min(1.0, (start + chunksize) / len(df))
+    else:
+        raise ValueError("不支持的文件格式")
+
+
+def _iter_text_chunks(file_path, chunksize, sep, encoding):
+    total = os.path.getsize(file_path) or 1
+    # Opened in binary so that tell() reports how far the parser has read
+    with open(file_path, "rb") as f:
+        for chunk in pd.read_csv(f, sep=sep, encoding=encoding, chunksize=chunksize, dtype=TEXT_COLUMNS):
+            yield chunk, min(1.0, f.tell() / total)
+
+
+def _iter_xlsx_chunks(file_path, chunksize):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        logging.warning("⚠️ 未安装openpyxl，Excel文件将一次性读取")
+        df = pd.read_excel(file_path, dtype=TEXT_COLUMNS)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize].reset_index(drop=True), min(1.0, (start + chunksize) / len(df))
+        return
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = sheet.max_row or 0
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        buffer = []
+        done = 1
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                done += len(buffer)
+                yield _xlsx_frame(buffer, header), (done / total if total else None)
+                buffer = []
+        if buffer:
+            yield _xlsx_frame(buffer, header), 1.0
+    finally:
+        workbook.close()
+
+
+def _xlsx_frame(rows, header):
+    df = pd.DataFrame(rows, columns=header)
+    for name in TEXT_COLUMNS:
+        if name in header:
+            i = header.index(name)
+            df[name] = [
+                None if row[i] is None else str(int(row[i])) if isinstance(row[i], float) and row[i].is_integer() else str(row[i])
+                for row in rows
+            ]
+    return df
+
+
+def conform_chunk(chunk, columns, fill):
+    # Missing expected columns are filled per chunk; every chunk is written with the columns of the first
+    chunk = fill(chunk)
+    if columns is not None and list(chunk.columns) != columns:
+        chunk = chunk.reindex(columns=columns)
+    return chunk
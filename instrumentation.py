@@ -0,0 +1,224 @@
+import os
+import io
+import json
+import time
+import logging
+import threading
+import functools
+import contextlib
+from collections import Counter, deque
+from datetime import datetime
+
+# Timers and counters for the hot paths, plus optional cProfile/tracemalloc capture.
+#   with metrics.timer("ui.sort"): ...         time a block
+#   @timed("history.get_data")                 time every call of a function
+#   metrics.count("rows.loaded", len(df))      add to a counter
+# LABEL_TOOL_PROFILE=cprofile|tracemalloc|all starts capturing at startup; the capture is
+# written to LABEL_TOOL_PROFILE_DIR (default profiles/) when the program ends.
+# Kept free of numpy/pandas so that it can be imported on the startup path.
+
+PROFILE_ENV = "LABEL_TOOL_PROFILE"
+PROFILE_DIR_ENV = "LABEL_TOOL_PROFILE_DIR"
+PROFILE_DIR = "profiles"
+WINDOW = 1000  # latest samples kept per timer for the rolling percentiles
+TOP_ALLOCATIONS = 30  # lines listed in the tracemalloc report
+
+
+def _percentile(ordered, q):
+    # Nearest-rank percentile of an ascending list
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class Metrics:
+    # Thread-safe rolling latencies (ms) per timer name and monotonically increasing counters
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._calls = Counter()
+        self._total_ms = Counter()
+        self._counters = Counter()
+        self.started = time.time()
+
+    def record(self, name, ms):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(ms)
+            self._calls[name] += 1
+            self._total_ms[name] += ms
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def timed(self, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        # {"timers": {name: calls, total and rolling p50/p95/p99/max}, "counters": {...}}
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            calls, total_ms, counters = dict(self._calls), dict(self._total_ms), dict(self._counters)
+        timers = {}
+        for name, ordered in sorted(samples.items()):
+            timers[name] = {
+                "calls": calls[name],
+                "total_ms": round(total_ms[name], 3),
+                "p50_ms": round(_percentile(ordered, 50), 3),
+                "p95_ms": round(_percentile(ordered, 95), 3),
+                "p99_ms": round(_percentile(ordered, 99), 3),
+                "max_ms": round(ordered[-1], 3),
+            }
+        return {
+            "since": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "timers": timers,
+            "counters": dict(sorted(counters.items())),
+        }
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = [f"{'操作':<32}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'最大(ms)':>10}"]
+        for name, t in summary["timers"].items():
+            lines.append(f"{name:<32}{t['calls']:>8}{t['p50_ms']:>10.2f}{t['p95_ms']:>10.2f}"
+                         f"{t['p99_ms']:>10.2f}{t['max_ms']:>10.2f}")
+        if summary["counters"]:
+            lines.append("")
+            lines.extend(f"{name:<32}{value:>8}" for name, value in summary["counters"].items())
+        return "\n".join(lines)
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        logging.info(f"📊 性能统计已保存：{path}")
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._calls.clear()
+            self._total_ms.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+
+class Profiler:
+    # cProfile of the calling thread plus every task passed through call() (worker threads),
+    # and/or process-wide tracemalloc; stop() writes the capture files
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profile = None
+        self._stats = None
+        self.cpu = False
+        self.memory = False
+
+    @property
+    def active(self):
+        return self.cpu or self.memory
+
+    def start(self, cpu=True, memory=False):
+        if self.active:
+            return
+        if cpu:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            self._stats = None
+            self.cpu = True
+        if memory:
+            import tracemalloc
+            tracemalloc.start(25)
+            self.memory = True
+        logging.info(f"🔍 开始性能分析（cProfile：{'开' if self.cpu else '关'}，tracemalloc：{'开' if self.memory else '关'}）")
+
+    def start_from_env(self):
+        mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+        if mode in ("", "0", "off"):
+            return False
+        self.start(cpu=mode in ("1", "cprofile", "cpu", "all"), memory=mode in ("tracemalloc", "memory", "all"))
+        return self.active
+
+    def call(self, fn, *args, **kwargs):
+        # Runs fn; while cProfile is on, its calls are added to the capture
+        if not self.cpu:
+            return fn(*args, **kwargs)
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Python 3.12+: the active profiler already sees every thread
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._add(profile)
+
+    def _add(self, profile):
+        import pstats
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def stop(self, directory=None):
+        # Stops capturing and writes profile_<ts>.prof (pstats), memory_<ts>.txt / .tracemalloc
+        # and metrics_<ts>.json; returns the written paths
+        if not self.active:
+            return []
+        directory = directory or os.environ.get(PROFILE_DIR_ENV, PROFILE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        paths = []
+        if self.cpu:
+            self._profile.disable()
+            self._add(self._profile)
+            path = os.path.join(directory, f"profile_{stamp}.prof")
+            self._stats.dump_stats(path)
+            paths.append(path)
+            self._profile = self._stats = None
+            self.cpu = False
+        if self.memory:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.memory = False
+            path = os.path.join(directory, f"memory_{stamp}.tracemalloc")
+            snapshot.dump(path)
+            paths.append(path)
+            report = io.StringIO()
+            report.write(f"当前分配：{current / 1048576:.1f} MB，峰值：{peak / 1048576:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                report.write(f"{stat}\n")
+            path = os.path.join(directory, f"memory_{stamp}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(report.getvalue())
+            paths.append(path)
+        paths.append(metrics.write_summary(os.path.join(directory, f"metrics_{stamp}.json")))
+        logging.info(f"🔍 性能分析结果已保存：{', '.join(paths)}")
+        return paths
+
+
+metrics = Metrics()
+profiler = Profiler()
+timed = metrics.timed
@@ -0,0 +1,11 @@
+# Rating items shared by the store, the table and the GUI; kept free of heavy imports
+# so that the window can be built before numpy and pandas are loaded
+JAMA_ITEMS = ["作者身份", "信息来源", "披露声明", "时效性"]
+GQS_ITEMS = ["差(1)", "一般(2)", "中等(3)", "良好(4)", "优秀(5)"]
+DISCERN_ITEMS = [
+    "视频目的清晰且简洁",
+    "信息来源可靠且明确提及",
+    "内容基于可靠证据或研究",
+    "提及不同的治疗或管理选项",
+    "披露利益冲突或资助来源"
+]
@@ -0,0 +1,416 @@
+import os
+import sys
+import json
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from history_manager import HISTORY_DIR, open_history_manager
+from annotation_store import GQS_ITEMS, MAX_BITMASK_ITEMS
+from instrumentation import profiler
+from annotation_merge import MERGE_STRATEGIES, merge_annotations
+from dedup_index import DEDUP_MODES, DEDUP_ENV, format_dedup_stats
+from delta_import import format_update_stats
+from analytics import AnalyticsCache, combine, summarize, format_analytics
+from reliability import BOOTSTRAP_SAMPLES, TOP_DISAGREEMENTS, load_sources, analyze, format_reliability, disagreement_frame
+from export_engine import EXPORT_FORMATS, EXPORT_LAYOUTS, EXPORT_CHUNK_ROWS, export_sessions, session_source
+
+# Headless entry point: no Qt import anywhere on this path, so it runs on servers without a display.
+#   python label_tool.py list
+#   python label_tool.py import a.csv b.xlsx --jobs 4
+#   python label_tool.py import a.csv --dedup skip          (leave out videos already imported)
+#   python label_tool.py update 20250921103000 recrawl.csv  (refresh counts, append new videos)
+#   python label_tool.py export --all --out exports/ --jobs 4
+#   python label_tool.py export --all --format parquet --layout wide --single-file all.parquet
+#   python label_tool.py stats 20250921103000 --json
+#   python label_tool.py analytics --all --by is_verified      (means, distributions, pass rates)
+#   python label_tool.py compact --all
+#   python label_tool.py --annotator alice export --all     (one annotator's layer)
+#   python label_tool.py merge --all --strategy majority     (annotator layers -> main annotations)
+#   python label_tool.py reliability 20250921103000          (agreement between its annotator layers)
+#   python label_tool.py reliability a.csv b.csv --disagreements review.csv
+# LABEL_TOOL_PROFILE=cprofile profiles the command (with --jobs 1 for the work itself)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def manager_options(args):
+    options = {"annotator": args.annotator} if args.annotator is not None else {}
+    if args.backend == "sqlite":
+        return dict(options, db_path=args.db) if args.db else options
+    return dict(options, history_dir=args.history_dir)
+
+
+def open_manager(backend, options):
+    return open_history_manager(backend, **options)
+
+
+def select_sessions(manager, names, select_all):
+    # Sessions by timestamp or imported file name
+    metas = manager.get_history()
+    if select_all:
+        return metas
+    selected = []
+    for name in names:
+        matches = [meta for meta in metas if name in (meta["timestamp"], meta["filename"])]
+        if not matches:
+            raise ValueError(f"找不到历史记录：{name}")
+        selected.extend(match for match in matches if match not in selected)
+    return selected
+
+
+def run_jobs(job, items, jobs):
+    # (item, result or None, error or None) per item; a process pool when jobs > 1
+    if jobs <= 1 or len(items) <= 1:
+        for item in items:
+            try:
+                yield item, job(item), None
+            except Exception as e:
+                yield item, None, str(e)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(job, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, str(e)
+
+
+# --- jobs (top level so that they can be sent to worker processes) -------------------
+
+def import_job(item):
+    backend, options, file_path, custom_columns, chunksize, dedup = item
+    manager = open_manager(backend, options)
+
+    def progress(rows, fraction):
+        logging.info(f"📥 正在导入：{os.path.basename(file_path)}（已读取{rows}条）")
+
+    return manager.add_history_from_file(file_path, custom_columns, chunksize=chunksize, progress=progress, dedup=dedup)
+
+
+def export_job(item):
+    backend, options, metas, path, fmt, layout, chunksize = item
+    manager = open_manager(backend, options)
+    sources = [session_source(manager, meta, chunksize) for meta in metas]
+    return path, export_sessions(sources, path, fmt, layout)
+
+
+def stats_job(item):
+    backend, options, meta = item
+    manager = open_manager(backend, options)
+    store = manager.load_annotations(meta, meta.get("count", 0))
+    return session_stats(meta, store)
+
+
+def analytics_job(item):
+    backend, options, meta, by = item
+    manager = open_manager(backend, options)
+    return AnalyticsCache(manager).get(meta, by).aggregates()
+
+
+def compact_job(item):
+    backend, options, meta = item
+    manager = open_manager(backend, options)
+    return manager.compact_annotations(meta)
+
+
+def merge_job(item):
+    backend, options, meta, annotators, strategy, target = item
+    manager = open_manager(backend, options)
+    return merge_annotations(manager, meta, annotators, strategy, target).n_rows
+
+
+def session_stats(meta, store):
+    # Means and the GQS distribution are over the annotated rows, as in analytics.summarize
+    # (an untouched row would count as GQS 1 and score 0)
+    annotated = store.annotated()
+    jama = store.scores("jama")[annotated]
+    discern = store.scores("discern")[annotated]
+    gqs = store.arrays["gqs"][annotated]
+    custom = {}
+    for col in store.custom_columns:
+        name = col["name"]
+        values = store.arrays[name]
+        if col["type"] == "numeric":
+            filled = ~np.isnan(values)
+            custom[name] = {"filled": int(filled.sum()), "mean": float(values[filled].mean()) if filled.any() else None}
+        elif col["type"] == "enum":
+            counts = np.bincount(values, minlength=len(col["enum_values"]) + 1)
+            custom[name] = {label: int(counts[i + 1]) for i, label in enumerate(col["enum_values"])}
+        else:
+            custom[name] = {
+                label: int(((values >> np.asarray(i, dtype=values.dtype)) & 1).sum())
+                for i, label in enumerate(col["enum_values"][:MAX_BITMASK_ITEMS])
+            }
+    n_annotated = int(annotated.sum())
+    return {
+        "timestamp": meta["timestamp"],
+        "filename": meta["filename"],
+        "rows": store.n_rows,
+        "annotated": n_annotated,
+        "jama_mean": float(jama.mean()) if n_annotated else None,
+        "gqs_mean": float(gqs.mean()) if n_annotated else None,
+        "discern_mean": float(discern.mean()) if n_annotated else None,
+        "gqs_distribution": {
+            label: int(count) for label, count in zip(GQS_ITEMS, np.bincount(gqs.clip(1, 5), minlength=6)[1:])
+        },
+        "custom": custom,
+    }
+
+
+# --- commands ------------------------------------------------------------------------
+
+def cmd_list(args):
+    manager = open_manager(args.backend, manager_options(args))
+    metas = manager.get_history()
+    if args.json:
+        print(json.dumps(metas, ensure_ascii=False, indent=2))
+        return 0
+    for meta in metas:
+        annotators = manager.list_annotators(meta)
+        print(f"{meta['timestamp']}  {meta['count']:>8}  {meta['filename']}  (自定义字段{len(meta.get('custom_columns', []))}个)"
+              + (f"  标注员：{', '.join(annotators)}" if annotators else ""))
+    return 0
+
+
+def cmd_import(args):
+    custom_columns = []
+    if args.custom_columns:
+        with open(args.custom_columns, "r", encoding="utf-8") as f:
+            custom_columns = json.load(f)
+    options = manager_options(args)
+    # SQLite takes one writer at a time, so its imports run one after another
+    jobs = 1 if args.backend == "sqlite" else args.jobs
+    items = [(args.backend, options, path, custom_columns, args.chunksize, args.dedup) for path in args.files]
+    failed = 0
+    for item, meta, error in run_jobs(import_job, items, jobs):
+        if error:
+            failed += 1
+            print(f"❌ 导入失败：{item[2]}：{error}", file=sys.stderr)
+        else:
+            stats = format_dedup_stats(meta.get("dedup"))
+            print(f"✅ {meta['timestamp']}  {meta['count']:>8}  {meta['filename']}" + (f"  {stats}" if stats else ""))
+    return 1 if failed else 0
+
+
+def cmd_update(args):
+    manager = open_manager(args.backend, manager_options(args))
+    metas = select_sessions(manager, [args.session], False)
+    if len(metas) != 1:
+        raise ValueError(f"找到多条历史记录，请使用导入时间戳：{args.session}")
+
+    def progress(rows, fraction):
+        logging.info(f"📥 正在更新：{os.path.basename(args.file)}（已读取{rows}条）")
+
+    meta = manager.update_history_from_file(metas[0], args.file, chunksize=args.chunksize, progress=progress)
+    print(f"✅ {meta['timestamp']}  {meta['count']:>8}  {meta['filename']}  {format_update_stats(meta['last_update'])}")
+    return 0
+
+
+def cmd_export(args):
+    options = manager_options(args)
+    metas = select_sessions(open_manager(args.backend, options), args.sessions, args.all)
+    export_options = (args.format, args.layout, args.chunksize)
+    if args.single_file:
+        # All selected sessions streamed into one file, one after another
+        items = [(args.backend, options, metas, args.single_file) + export_options]
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        items = []
+        for meta in metas:
+            name = os.path.splitext(meta["filename"])[0]
+            path = os.path.join(args.out, f"{name}_{meta['timestamp']}{EXPORT_FORMATS[args.format]}")
+            items.append((args.backend, options, [meta], path) + export_options)
+    failed = 0
+    for item, result, error in run_jobs(export_job, items, args.jobs):
+        if error:
+            failed += 1
+            print(f"❌ 导出失败：{item[3]}：{error}", file=sys.stderr)
+        else:
+            print(f"✅ {result[1]:>8}  {result[0]}")
+    return 1 if failed else 0
+
+
+def cmd_stats(args):
+    options = manager_options(args)
+    metas = select_sessions(open_manager(args.backend, options), args.sessions, args.all)
+    items = [(args.backend, options, meta) for meta in metas]
+    results, failed = [], 0
+    for item, result, error in run_jobs(stats_job, items, args.jobs):
+        if error:
+            failed += 1
+            print(f"❌ 统计失败：{item[2]['timestamp']}：{error}", file=sys.stderr)
+        else:
+            results.append(result)
+    results.sort(key=lambda x: x["timestamp"], reverse=True)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            print(f"{result['timestamp']}  {result['filename']}：共{result['rows']}条，已标注{result['annotated']}条，"
+                  f"JAMA均分{_fmt(result['jama_mean'])}，GQS均分{_fmt(result['gqs_mean'])}，"
+                  f"DISCERN均分{_fmt(result['discern_mean'])}")
+    return 1 if failed else 0
+
+
+def cmd_analytics(args):
+    options = manager_options(args)
+    manager = open_manager(args.backend, options)
+    metas = select_sessions(manager, args.sessions, args.all)
+    if args.by and not any(
+        args.by in manager.data_columns(meta) or args.by == "gqs"
+        or any(col["name"] == args.by for col in meta.get("custom_columns", []))
+        for meta in metas
+    ):
+        raise ValueError(f"找不到分组字段：{args.by}")
+    items = [(args.backend, options, meta, args.by) for meta in metas]
+    parts, failed = [], 0
+    for item, result, error in run_jobs(analytics_job, items, args.jobs):
+        if error:
+            failed += 1
+            print(f"❌ 统计失败：{item[2]['timestamp']}：{error}", file=sys.stderr)
+        else:
+            parts.append(result)
+    summary = summarize(combine(parts))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(format_analytics(summary))
+    return 1 if failed else 0
+
+
+def cmd_compact(args):
+    options = manager_options(args)
+    metas = select_sessions(open_manager(args.backend, options), args.sessions, args.all)
+    items = [(args.backend, options, meta) for meta in metas]
+    failed = 0
+    for item, result, error in run_jobs(compact_job, items, args.jobs):
+        if error or not result:
+            failed += 1
+            print(f"❌ 压缩失败：{item[2]['timestamp']}：{error or ''}", file=sys.stderr)
+        else:
+            print(f"✅ {item[2]['timestamp']}  {item[2]['filename']}")
+    return 1 if failed else 0
+
+
+def cmd_merge(args):
+    options = manager_options(args)
+    metas = select_sessions(open_manager(args.backend, options), args.sessions, args.all)
+    items = [(args.backend, options, meta, args.annotators, args.strategy, args.target) for meta in metas]
+    failed = 0
+    for item, result, error in run_jobs(merge_job, items, args.jobs):
+        if error:
+            failed += 1
+            print(f"❌ 合并失败：{item[2]['timestamp']}：{error}", file=sys.stderr)
+        else:
+            print(f"✅ {item[2]['timestamp']}  {result:>8}  {item[2]['filename']}")
+    return 1 if failed else 0
+
+
+def cmd_reliability(args):
+    manager = open_manager(args.backend, manager_options(args))
+    metas = select_sessions(manager, args.sessions, args.all)
+    sources = load_sources(manager, metas, args.annotators)
+    report = analyze(sources, args.bootstrap, args.jobs, args.seed, args.top)
+    if args.disagreements:
+        disagreement_frame(report).to_csv(args.disagreements, index=False, encoding="utf-8-sig")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_reliability(report))
+    return 0
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="label_tool", description="Label Tool 命令行工具（无需图形界面）")
+    parser.add_argument("--backend", choices=["files", "sqlite"], default=os.environ.get("LABEL_TOOL_BACKEND", "files"))
+    parser.add_argument("--history-dir", default=HISTORY_DIR, help="历史记录目录（files后端）")
+    parser.add_argument("--db", default=None, help="数据库文件（sqlite后端）")
+    parser.add_argument("--annotator", default=None, help="标注员名称，读写该标注员的标注层（默认主标注，或环境变量LABEL_TOOL_ANNOTATOR）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    jobs_parser = argparse.ArgumentParser(add_help=False)
+    jobs_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="并行进程数")
+
+    list_parser = subparsers.add_parser("list", help="列出历史导入记录")
+    list_parser.add_argument("--json", action="store_true")
+    list_parser.set_defaults(func=cmd_list)
+
+    import_parser = subparsers.add_parser("import", parents=[jobs_parser], help="导入一个或多个数据文件")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--custom-columns", help="自定义字段定义（JSON文件）")
+    import_parser.add_argument("--chunksize", type=int, default=50000)
+    import_parser.add_argument("--dedup", choices=DEDUP_MODES, default=os.environ.get(DEDUP_ENV, "flag"),
+                               help="按video_id/video_url检查已导入过的视频。flag：保留并在duplicate_of列标记，沿用已有标注；"
+                                    "skip：不导入重复视频；off：不检查")
+    import_parser.set_defaults(func=cmd_import)
+
+    update_parser = subparsers.add_parser("update", help="用重新抓取的数据更新历史记录（更新计数、追加新视频，保留标注）")
+    update_parser.add_argument("session", help="导入时间戳或文件名")
+    update_parser.add_argument("file")
+    update_parser.add_argument("--chunksize", type=int, default=50000)
+    update_parser.set_defaults(func=cmd_update)
+
+    for name, func, help_text in (
+        ("export", cmd_export, "导出标注结果（CSV/Parquet/JSONL/XLSX）"),
+        ("stats", cmd_stats, "统计评分结果"),
+        ("analytics", cmd_analytics, "按分组汇总多个历史记录的评分（均分、分布、各条目通过率）"),
+        ("compact", cmd_compact, "将注解日志合并到快照"),
+        ("merge", cmd_merge, "逐行合并多个标注员的标注"),
+        ("reliability", cmd_reliability, "标注一致性：Cohen/Fleiss kappa、Krippendorff alpha及分歧最大的数据"),
+    ):
+        sub = subparsers.add_parser(name, parents=[jobs_parser], help=help_text)
+        sub.add_argument("sessions", nargs="*", help="导入时间戳或文件名")
+        sub.add_argument("--all", action="store_true", help="处理全部历史记录")
+        if name == "export":
+            sub.add_argument("--out", default="exports", help="导出目录")
+            sub.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+            sub.add_argument("--layout", choices=EXPORT_LAYOUTS, default="joined",
+                             help="joined：每个字段一列；wide：每个JAMA/DISCERN选项一列0/1")
+            sub.add_argument("--chunksize", type=int, default=EXPORT_CHUNK_ROWS)
+            sub.add_argument("--single-file", help="将所选历史记录合并导出到一个文件")
+        if name in ("stats", "analytics"):
+            sub.add_argument("--json", action="store_true")
+        if name == "analytics":
+            sub.add_argument("--by", default="", help="分组字段：数据列（如is_verified、author_name）、gqs或单选自定义字段")
+        if name == "merge":
+            sub.add_argument("--annotators", nargs="+", help="参与合并的标注员（默认全部）")
+            sub.add_argument("--strategy", choices=MERGE_STRATEGIES, default="majority",
+                             help="majority：多数标注员选择的选项；union：任一标注员选择；intersection：全部标注员选择")
+            sub.add_argument("--target", default="", help="写入的标注层（默认主标注，会覆盖其内容）")
+        if name == "reliability":
+            sub.add_argument("--annotators", nargs="+",
+                             help="参与比较的标注层（\"\"为主标注）。默认：单条历史记录比较其全部标注员，多条历史记录按video_id/video_url对齐比较")
+            sub.add_argument("--bootstrap", type=int, default=BOOTSTRAP_SAMPLES, help="bootstrap次数（0为不计算置信区间）")
+            sub.add_argument("--seed", type=int, default=0)
+            sub.add_argument("--top", type=int, default=TOP_DISAGREEMENTS, help="列出分歧最大的数据条数")
+            sub.add_argument("--disagreements", help="将分歧最大的数据保存为CSV，便于裁定")
+            sub.add_argument("--json", action="store_true")
+        sub.set_defaults(func=func)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "sessions", None) == [] and not getattr(args, "all", True):
+        parser.error("请指定历史记录或使用 --all")
+    profiler.start_from_env()
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(f"❌ {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        profiler.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+import logging
+import warnings
+import multiprocessing
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from annotation_store import MAX_BITMASK_ITEMS
+from dedup_index import dedup_keys
+
+# Agreement between coders. A source is one annotation layer of one session; layers of the same
+# session are aligned row by row, different sessions on the video keys (video_id, else the
+# normalized video_url). Every JAMA/DISCERN/custom multi item is a binary variable, the JAMA
+# and DISCERN scores and GQS are ordinal scales, enum fields nominal and numeric fields interval.
+# A row a coder has not rated counts as missing on that row, not as "all no"; a row rated
+# GQS 1 with nothing ticked is a rating (see AnnotationStore.rated).
+#   cohen_kappa   Cohen's kappa, averaged over all pairs of coders (quadratic weights for ordinal)
+#   fleiss_kappa  Fleiss' kappa over the rows every coder annotated
+#   alpha         Krippendorff's alpha with the variable's level of measurement, missing data allowed
+# Confidence intervals are percentile bootstraps over the rows, drawn for each variable on its
+# own; a replicate only reweights the collapsed rows (see Agreement), so it costs a multinomial
+# draw and a few small matrix products instead of a pass over every row.
+BOOTSTRAP_SAMPLES = 1000
+CONFIDENCE = 0.95
+TOP_DISAGREEMENTS = 50
+STATISTICS = ("cohen_kappa", "fleiss_kappa", "alpha")
+MAIN_LAYER = "主标注"
+
+
+class Source:
+    def __init__(self, meta, annotator, keys, titles, store):
+        self.meta = meta
+        self.annotator = annotator
+        self.keys = keys
+        self.titles = titles
+        self.store = store
+
+    @property
+    def name(self):
+        return f"{self.meta['filename']}（{self.annotator or MAIN_LAYER}）"
+
+
+def load_sources(manager, metas, annotators=None):
+    # One source per (session, layer). Without annotators: every annotator layer of a single
+    # session, or the manager's own layer of each of several sessions.
+    sources = []
+    for meta in metas:
+        if annotators is not None:
+            layers = list(annotators)
+        elif len(metas) == 1:
+            layers = manager.list_annotators(meta)
+        else:
+            layers = [manager.annotator]
+        if not layers:
+            continue
+        keys, titles = [], []
+        for chunk in manager.iter_data(meta):
+            keys.extend(dedup_keys(chunk))
+            titles.extend(chunk["title"].fillna("").astype(str).tolist() if "title" in chunk.columns else [""] * len(chunk))
+        for annotator in layers:
+            store = manager.load_annotations(meta, meta.get("count", 0), annotator)
+            sources.append(Source(meta, annotator, keys, titles, store))
+    if len(sources) < 2:
+        raise ValueError("至少需要两个标注来源（多个标注员或多条历史记录）")
+    return sources
+
+
+def align(sources):
+    # (unit names, rows): rows[u, j] is the row of unit u in source j, -1 when it has none.
+    # Units found in fewer than two sources carry no agreement information and are dropped.
+    if len({source.meta["timestamp"] for source in sources}) == 1:
+        n_rows = max(source.store.n_rows for source in sources)
+        units = [f"#{row + 1}" for row in range(n_rows)]
+        rows = np.tile(np.arange(n_rows, dtype=np.int64)[:, None], (1, len(sources)))
+        for j, source in enumerate(sources):
+            rows[source.store.n_rows:, j] = -1
+    else:
+        positions = []
+        for source in sources:
+            index = pd.Index(source.keys, dtype=object)
+            position = pd.Series(np.arange(len(index)), index=index)
+            positions.append(position[(index != "") & ~index.duplicated()])
+        names = pd.Index(pd.unique(np.concatenate([position.index.to_numpy() for position in positions])), dtype=object)
+        rows = np.stack([position.reindex(names).fillna(-1).to_numpy(dtype=np.int64) for position in positions], axis=1)
+        units = names.tolist()
+    shared = (rows >= 0).sum(axis=1) >= 2
+    return [unit for unit, keep in zip(units, shared) if keep], rows[shared]
+
+
+class Agreement:
+    # What the statistics need of one variable, over the units at least two coders rated.
+    # Nominal/ordinal units are collapsed to their distinct rows of category codes (a handful
+    # for a binary item), each weighted by its number of units; interval units stay as they are.
+    def __init__(self, level, values):
+        self.level = level
+        self.n_coders = values.shape[1]
+        present = ~np.isnan(values)
+        values = values[present.sum(axis=1) >= 2]
+        present = ~np.isnan(values)
+        if level == "interval":
+            self.values = values
+            self.frequencies = np.ones(len(values))
+            return
+        self.categories = np.unique(values[present])
+        codes = np.where(present, np.searchsorted(self.categories, np.nan_to_num(values)), -1)
+        if len(codes):
+            codes, frequencies = np.unique(codes, axis=0, return_counts=True)
+        else:
+            frequencies = np.zeros(0)
+        self.codes = codes
+        self.frequencies = frequencies.astype(np.float64)
+        n_patterns, n_categories = len(codes), len(self.categories)
+        flat = (np.arange(n_patterns)[:, None] * n_categories + codes)[codes >= 0]
+        self.counts = np.bincount(flat, minlength=n_patterns * n_categories).reshape(n_patterns, n_categories).astype(np.float64)
+
+    def resample(self, rng):
+        # Weights of one bootstrap replicate: units drawn with replacement, counted per pattern
+        n_units = int(self.frequencies.sum())
+        if self.level == "interval":
+            return np.bincount(rng.integers(0, n_units, n_units), minlength=n_units).astype(np.float64)
+        return rng.multinomial(n_units, self.frequencies / n_units).astype(np.float64)
+
+    def _disagreement_weights(self, marginals=None):
+        # delta(c, k) between categories for alpha / Cohen's kappa
+        n = len(self.categories)
+        if self.level == "nominal":
+            return 1.0 - np.eye(n)
+        if marginals is None:  # Cohen: quadratic weights on the category ranks
+            ranks = np.arange(n, dtype=np.float64)
+            return (np.subtract.outer(ranks, ranks) / max(n - 1, 1)) ** 2
+        # Krippendorff's ordinal metric: (sum of n_g for g between c and k - (n_c + n_k) / 2)^2
+        cumulative = np.cumsum(marginals)
+        low, high = np.minimum.outer(np.arange(n), np.arange(n)), np.maximum.outer(np.arange(n), np.arange(n))
+        between = cumulative[high] - cumulative[low] + marginals[low]
+        return (between - (marginals[low] + marginals[high]) / 2) ** 2
+
+    def alpha(self, weights):
+        if self.level == "interval":
+            present = ~np.isnan(self.values)
+            m = present.sum(axis=1)
+            x = np.where(present, self.values, 0.0)
+            s1, s2 = x.sum(axis=1), (x * x).sum(axis=1)
+            n = (weights * m).sum()
+            if n <= 1:
+                return np.nan
+            observed = (weights * 2 * (m * s2 - s1 * s1) / (m - 1)).sum()
+            expected = 2 * (n * (weights * s2).sum() - (weights * s1).sum() ** 2) / (n - 1)
+            return 1 - observed / expected if expected > 0 else np.nan
+        counts = self.counts
+        scaled = counts * (weights / (counts.sum(axis=1) - 1))[:, None]
+        coincidences = scaled.T @ counts - np.diag(scaled.sum(axis=0))
+        marginals = coincidences.sum(axis=1)
+        n = marginals.sum()
+        if n <= 1:
+            return np.nan
+        delta = self._disagreement_weights(marginals)
+        expected = (np.outer(marginals, marginals) * delta).sum() / (n - 1)
+        return 1 - (coincidences * delta).sum() / expected if expected > 0 else np.nan
+
+    def fleiss_kappa(self, weights):
+        if self.level == "interval":
+            return np.nan
+        n_coders = self.n_coders
+        complete = self.counts.sum(axis=1) == n_coders
+        counts, w = self.counts[complete], weights[complete]
+        total = w.sum()
+        if total == 0:
+            return np.nan
+        agreement = ((counts * counts).sum(axis=1) - n_coders) / (n_coders * (n_coders - 1))
+        observed = (w * agreement).sum() / total
+        shares = (w[:, None] * counts).sum(axis=0) / (total * n_coders)
+        expected = (shares * shares).sum()
+        return (observed - expected) / (1 - expected) if expected < 1 else np.nan
+
+    def cohen_kappa(self, weights):
+        if self.level == "interval":
+            return np.nan
+        n = len(self.categories)
+        delta = self._disagreement_weights()
+        kappas = []
+        for a, b in combinations(range(self.n_coders), 2):
+            both = (self.codes[:, a] >= 0) & (self.codes[:, b] >= 0)
+            table = np.bincount(self.codes[both, a] * n + self.codes[both, b], weights=weights[both],
+                                minlength=n * n).reshape(n, n)
+            total = table.sum()
+            if total == 0:
+                continue
+            expected = (delta * np.outer(table.sum(axis=1), table.sum(axis=0))).sum() / total
+            if expected > 0:
+                kappas.append(1 - (delta * table).sum() / expected)
+        return float(np.mean(kappas)) if kappas else np.nan
+
+    def statistics(self, weights=None):
+        weights = self.frequencies if weights is None else weights
+        return [self.cohen_kappa(weights), self.fleiss_kappa(weights), self.alpha(weights)]
+
+
+class Variable:
+    # Values of one variable, (units x coders) float with NaN = missing
+    def __init__(self, field, item, level, values, labels=None):
+        self.field = field
+        self.item = item
+        self.level = level
+        self.values = values
+        self.labels = labels  # enum labels by value, for display
+        self.agreement = Agreement(level, values)
+
+    @property
+    def name(self):
+        return f"{self.field}:{self.item}" if self.item else self.field
+
+    def display(self, value):
+        if np.isnan(value):
+            return None
+        if self.labels is not None:
+            return self.labels[int(value)]
+        return round(float(value), 4) if self.level == "interval" else int(value)
+
+    def disagreement(self):
+        # Mean pairwise disagreement per unit in [0, 1] (NaN where fewer than two coders rated)
+        values = self.values
+        spread = np.nanmax(values) - np.nanmin(values) if self.level != "nominal" and (~np.isnan(values)).any() else 1
+        total = np.zeros(len(values))
+        pairs = np.zeros(len(values))
+        for a, b in combinations(range(values.shape[1]), 2):
+            both = ~np.isnan(values[:, a]) & ~np.isnan(values[:, b])
+            if self.level == "nominal":
+                difference = values[:, a] != values[:, b]
+            else:
+                difference = np.abs(values[:, a] - values[:, b]) / (spread or 1)
+            total += np.where(both, difference, 0)
+            pairs += both
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / pairs
+
+
+def rated_units(sources, rows):
+    # (units x sources) bool: the source has the unit and its coder rated it
+    rated = np.zeros(rows.shape, dtype=bool)
+    for j, source in enumerate(sources):
+        row = rows[:, j]
+        take = row >= 0
+        rated[take, j] = source.store.annotated()[row[take]]
+    return rated
+
+
+def build_variables(sources, rows, rated):
+    def column(j, values):
+        out = np.full(len(rows), np.nan)
+        take = rated[:, j]
+        out[take] = values[rows[take, j]]
+        return out
+
+    def matrix(get):
+        return np.stack([column(j, get(source)) for j, source in enumerate(sources)], axis=1)
+
+    stores = [source.store for source in sources]
+    variables = []
+    for field in ("jama", "discern"):
+        for item in stores[0].vocab[field][:MAX_BITMASK_ITEMS]:
+            variables.append(Variable(field, item, "nominal", matrix(lambda source: _item_flags(source.store, field, item))))
+        variables.append(Variable(field, "", "ordinal", matrix(lambda source: source.store.scores(field).astype(np.float64))))
+    variables.append(Variable("gqs", "", "ordinal", matrix(lambda source: source.store.arrays["gqs"].astype(np.float64))))
+    # Custom fields that every source has with the same type
+    for col in stores[0].custom_columns:
+        name, col_type = col["name"], col["type"]
+        if not all(store.types.get(name) == col_type for store in stores):
+            continue
+        if col_type == "multi":
+            for item in col["enum_values"][:MAX_BITMASK_ITEMS]:
+                variables.append(Variable(name, item, "nominal", matrix(lambda source: _item_flags(source.store, name, item))))
+        elif col_type == "enum":
+            labels = list(dict.fromkeys(label for store in stores for label in store.vocab[name]))
+            variables.append(Variable(name, "", "nominal", matrix(lambda source: _enum_values(source.store, name, labels)), labels))
+        else:
+            variables.append(Variable(name, "", "interval", matrix(lambda source: source.store.arrays[name].astype(np.float64))))
+    return variables
+
+
+def _item_flags(store, field, item):
+    vocab = store.vocab[field][:MAX_BITMASK_ITEMS]
+    values = store.arrays[field]
+    if item not in vocab:
+        return np.zeros(store.n_rows)
+    return ((values >> values.dtype.type(vocab.index(item))) & 1).astype(np.float64)
+
+
+def _enum_values(store, field, labels):
+    # Codes of this store mapped to positions in the shared label list; unset -> NaN
+    lookup = np.array([np.nan] + [float(labels.index(label)) for label in store.vocab[field]])
+    return lookup[store.arrays[field]]
+
+
+def _bootstrap_chunk(task):
+    # Top level so that it can be sent to worker processes
+    agreements, n_samples, seed = task
+    rng = np.random.default_rng(seed)
+    results = np.full((n_samples, len(agreements), len(STATISTICS)), np.nan)
+    for sample in range(n_samples):
+        for i, agreement in enumerate(agreements):
+            if agreement.frequencies.sum():
+                results[sample, i] = agreement.statistics(agreement.resample(rng))
+    return results
+
+
+def bootstrap(variables, n_samples=BOOTSTRAP_SAMPLES, jobs=1, seed=0, progress=None):
+    # (n_samples, variables, statistics) replicates. Chunks go to a process pool started with
+    # "spawn": forking a process that runs Qt or other threads is not safe.
+    if not variables or not n_samples:
+        return np.full((0, len(variables), len(STATISTICS)), np.nan)
+    n_chunks = max(1, min(n_samples, jobs * 4))
+    sizes = [n_samples // n_chunks + (i < n_samples % n_chunks) for i in range(n_chunks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    agreements = [variable.agreement for variable in variables]
+    tasks = [(agreements, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    results = []
+    if jobs <= 1:
+        for task in tasks:
+            results.append(_bootstrap_chunk(task))
+            if progress is not None:
+                progress(sum(len(result) for result in results), len(results) / n_chunks)
+        return np.concatenate(results)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for result in pool.map(_bootstrap_chunk, tasks):
+            results.append(result)
+            if progress is not None:
+                progress(sum(len(result) for result in results), len(results) / n_chunks)
+    return np.concatenate(results)
+
+
+def disagreements(sources, units, rows, variables, top=TOP_DISAGREEMENTS):
+    # Units ranked by their summed disagreement over the items, GQS and custom fields (the JAMA
+    # and DISCERN scores are left out, their items are already counted)
+    ranked = [variable for variable in variables if not (variable.field in ("jama", "discern") and not variable.item)]
+    if not ranked or not units:
+        return []
+    per_variable = np.stack([np.nan_to_num(variable.disagreement()) for variable in ranked], axis=1)
+    scores = per_variable.sum(axis=1)
+    order = [unit for unit in np.argsort(-scores, kind="stable")[:top] if scores[unit] > 0]
+    result = []
+    for unit in order:
+        first = next(j for j in range(len(sources)) if rows[unit, j] >= 0)
+        result.append({
+            "unit": units[unit],
+            "title": sources[first].titles[rows[unit, first]] if rows[unit, first] < len(sources[first].titles) else "",
+            "rows": [int(row) + 1 if row >= 0 else None for row in rows[unit]],
+            "score": float(scores[unit]),
+            "fields": {
+                variable.name: [variable.display(value) for value in variable.values[unit]]
+                for variable, amount in zip(ranked, per_variable[unit]) if amount > 0
+            },
+        })
+    return result
+
+
+def _number(value):
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def analyze(sources, bootstrap_samples=BOOTSTRAP_SAMPLES, jobs=1, seed=0, top=TOP_DISAGREEMENTS, progress=None):
+    units, rows = align(sources)
+    rated = rated_units(sources, rows)
+    variables = build_variables(sources, rows, rated)
+    estimates = np.array([variable.agreement.statistics() for variable in variables]).reshape(len(variables), len(STATISTICS))
+    replicates = bootstrap(variables, bootstrap_samples, jobs, seed, progress)
+    tail = (1 - CONFIDENCE) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN replicates of undefined statistics
+        low, high = (np.nanpercentile(replicates, [tail, 100 - tail], axis=0) if len(replicates)
+                     else np.full((2,) + estimates.shape, np.nan))
+    report = []
+    for i, variable in enumerate(variables):
+        entry = {
+            "field": variable.field,
+            "item": variable.item,
+            "level": variable.level,
+            "units": int(((~np.isnan(variable.values)).sum(axis=1) >= 2).sum()),
+        }
+        for k, statistic in enumerate(STATISTICS):
+            entry[statistic] = _number(estimates[i, k])
+            entry[f"{statistic}_ci"] = [_number(low[i, k]), _number(high[i, k])]
+        report.append(entry)
+    jointly_rated = int((rated.sum(axis=1) >= 2).sum())
+    logging.info(f"📐 一致性分析：{len(sources)}个标注来源，{jointly_rated}条共同标注的数据，{len(variables)}个变量")
+    return {
+        "sources": [source.name for source in sources],
+        "units": jointly_rated,
+        "bootstrap_samples": len(replicates),
+        "confidence": CONFIDENCE,
+        "variables": report,
+        "disagreements": disagreements(sources, units, rows, variables, top),
+    }
+
+
+def _fmt(value, interval=None):
+    text = "-" if value is None else f"{value:.3f}"
+    if interval and interval[0] is not None:
+        text += f" [{interval[0]:.3f}, {interval[1]:.3f}]"
+    return text
+
+
+def format_reliability(report):
+    lines = [
+        "标注来源：" + "，".join(report["sources"]),
+        f"共同数据{report['units']}条，bootstrap {report['bootstrap_samples']}次，置信区间{report['confidence']:.0%}",
+        "",
+    ]
+    for entry in report["variables"]:
+        name = f"{entry['field']}:{entry['item']}" if entry["item"] else f"{entry['field']}（总分）" if entry["field"] in ("jama", "discern") else entry["field"]
+        lines.append(
+            f"{name}  [{entry['level']}，{entry['units']}条]  "
+            f"Cohen κ {_fmt(entry['cohen_kappa'], entry['cohen_kappa_ci'])}  "
+            f"Fleiss κ {_fmt(entry['fleiss_kappa'], entry['fleiss_kappa_ci'])}  "
+            f"α {_fmt(entry['alpha'], entry['alpha_ci'])}"
+        )
+    if report["disagreements"]:
+        lines.extend(["", "分歧最大的数据："])
+        for entry in report["disagreements"]:
+            rows = "/".join("-" if row is None else str(row) for row in entry["rows"])
+            lines.append(f"{entry['unit']}（行{rows}）分歧{entry['score']:.2f}  {entry['title'][:40]}")
+            for name, values in entry["fields"].items():
+                lines.append(f"    {name}：" + " | ".join("-" if value is None else str(value) for value in values))
+    return "\n".join(lines)
+
+
+def disagreement_frame(report):
+    # One row per listed unit and one column per source and field, for adjudication in a spreadsheet
+    records = []
+    for entry in report["disagreements"]:
+        record = {"unit": entry["unit"], "title": entry["title"], "score": entry["score"]}
+        for source, row in zip(report["sources"], entry["rows"]):
+            record[f"行号（{source}）"] = row
+        for name, values in entry["fields"].items():
+            for source, value in zip(report["sources"], values):
+                record[f"{name}（{source}）"] = value
+        records.append(record)
+    return pd.DataFrame(records)
@@ -0,0 +1,174 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from annotation_store import MAX_BITMASK_ITEMS
+
+EMPTY_VALUES = ("empty", "unset", "空", "未选择", "未评分")
+PREDICATE_PATTERN = re.compile(r"^(?P<field>[^<>=!:]+?)(?P<op><=|>=|!=|=|<|>|:)(?P<value>.*)$")
+FIELD_ALIASES = {"jama": "jama", "gqs": "gqs", "discern": "discern"}
+_EMPTY_ROWS = np.array([], dtype=np.int32)
+
+
+class TextIndex:
+    # Inverted index from character unigrams and bigrams to the rows containing them.
+    # Grams are built vectorized from the UTF-32 code points of all texts: a unigram is
+    # its code point, a bigram is (first << 32) | second, so both share one uint64 space.
+    # A query intersects the posting lists of its grams; words longer than two
+    # characters are then confirmed with a substring check on the candidates.
+    def __init__(self, texts):
+        self.texts = texts
+        joined = "\x00".join(texts) + "\x00"
+        points = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)) + 1
+        row_of = np.repeat(np.arange(len(texts), dtype=np.int32), lengths)
+        # Grams never span the NUL separator between two texts
+        unigram = points != 0
+        bigram = unigram[:-1] & unigram[1:]
+        grams = np.concatenate([points[unigram], ((points[:-1] << 32) | points[1:])[bigram]])
+        rows = np.concatenate([row_of[unigram], row_of[:-1][bigram]])
+
+        codes, uniques = pd.factorize(grams)
+        order = np.argsort(codes, kind="stable")  # rows stay ascending within each gram
+        codes, rows = codes[order], rows[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+        codes, self.rows = codes[keep], rows[keep]
+        self.bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+        self.gram_ids = dict(zip(uniques.tolist(), range(len(uniques))))
+
+    def postings(self, gram):
+        gram_id = self.gram_ids.get(gram)
+        if gram_id is None:
+            return _EMPTY_ROWS
+        return self.rows[self.bounds[gram_id]:self.bounds[gram_id + 1]]
+
+    def search(self, word):
+        word = word.lower()
+        points = [ord(char) for char in word]
+        if len(points) == 1:
+            grams = set(points)
+        else:
+            grams = {(first << 32) | second for first, second in zip(points, points[1:])}
+        lists = sorted((self.postings(gram) for gram in grams), key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        if len(word) > 2:
+            rows = np.array([row for row in rows if word in self.texts[row]], dtype=np.int32)
+        return rows
+
+
+class SessionIndex:
+    # Search over one session: free words match title or author, "field op value" terms
+    # filter on annotation state, e.g. "科普 jama<2 gqs:空 视频类型=广告"; terms are ANDed.
+    # Predicate masks are cached until the field is edited (invalidate()).
+    def __init__(self, df, store):
+        self.store = store
+        self.n_rows = len(df)
+        text = pd.Series("", index=df.index, dtype=object)
+        for name in ("title", "author_name"):
+            if name in df.columns:
+                text = text + "\n" + df[name].astype(object).where(df[name].notna(), "").astype(str)
+        self.text = TextIndex(text.str.lower().tolist())
+        self._masks = {}
+
+    def invalidate(self, field):
+        self._masks = {key: mask for key, mask in self._masks.items() if key[0] != field}
+
+    def query(self, text):
+        # Boolean mask over data rows, or None for an empty query; ValueError on a bad term
+        mask = None
+        for term in text.split():
+            term_mask = self._term_mask(term)
+            mask = term_mask if mask is None else mask & term_mask
+        return mask
+
+    def _term_mask(self, term):
+        match = PREDICATE_PATTERN.match(term)
+        if match:
+            field = self._field(match.group("field"))
+            if field is not None:
+                key = (field, match.group("op"), match.group("value"))
+                mask = self._masks.get(key)
+                if mask is None:
+                    mask = self._masks[key] = self._predicate_mask(*key)
+                return mask
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.text.search(term)] = True
+        return mask
+
+    def _field(self, name):
+        if name.lower() in FIELD_ALIASES:
+            return FIELD_ALIASES[name.lower()]
+        return name if name in self.store.types else None
+
+    def _overflowed(self, field):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for (name, row), value in self.store.overflow.items():
+            if name == field and value and row < self.n_rows:
+                mask[row] = True
+        return mask
+
+    def _predicate_mask(self, field, op, value):
+        col_type = self.store.types[field]
+        values = self.store.arrays[field][:self.n_rows]
+        if value.lower() in EMPTY_VALUES and op in (":", "=", "!="):
+            if col_type == "gqs":
+                empty = values == 1  # GQS has no unset state; 1 is the initial score
+            elif col_type in ("multi", "enum"):
+                empty = (values == 0) & ~self._overflowed(field)
+            else:
+                empty = np.isnan(values) & ~self._overflowed(field)
+            return ~empty if op == "!=" else empty
+
+        if col_type == "multi" and not _is_number(value):
+            # jama=作者身份 / jama!=作者身份: rows with / without that item
+            if op not in (":", "=", "!="):
+                raise ValueError(f"选项条件只支持 = 或 !=：{field}{op}{value}")
+            vocab = self.store.vocab[field]
+            if value in vocab[:MAX_BITMASK_ITEMS]:
+                has = (values & values.dtype.type(1 << vocab.index(value))) != 0
+            else:
+                has = np.zeros(self.n_rows, dtype=bool)
+            for (name, row), extra in self.store.overflow.items():
+                if name == field and value in extra and row < self.n_rows:
+                    has[row] = True
+            return ~has if op == "!=" else has
+        if col_type == "enum":
+            if op not in (":", "=", "!="):
+                raise ValueError(f"单选字段只支持 = 或 != 条件：{field}")
+            vocab = self.store.vocab[field]
+            equal = values == (vocab.index(value) + 1) if value in vocab else np.zeros(self.n_rows, dtype=bool)
+            for (name, row), raw in self.store.overflow.items():
+                if name == field and raw == value and row < self.n_rows:
+                    equal[row] = True
+            return ~equal if op == "!=" else equal
+
+        if not _is_number(value):
+            raise ValueError(f"条件值必须是数字：{field}{op}{value}")
+        number = float(value)
+        if col_type == "multi":
+            values = self.store.scores(field)[:self.n_rows]
+        if op in (":", "="):
+            return values == number
+        if op == "!=":
+            return values != number
+        if op == "<":
+            return values < number
+        if op == "<=":
+            return values <= number
+        if op == ">":
+            return values > number
+        return values >= number
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
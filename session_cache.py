@@ -0,0 +1,123 @@
+import os
+import logging
+from collections import OrderedDict
+
+SESSION_CACHE_ENV = "LABEL_TOOL_SESSION_CACHE_MB"
+SESSION_CACHE_MB = 1024  # default memory budget of the cached sessions
+SAMPLE_ROWS = 1000  # rows sampled to estimate the size of text columns
+
+
+def frame_nbytes(df):
+    # Memory of a frame: exact for typed columns, object columns estimated from a sample
+    # (memory_usage(deep=True) would walk every string of a large crawl)
+    total = 0
+    for name in df.columns:
+        column = df[name]
+        if column.dtype.kind == "O" and len(column) > SAMPLE_ROWS:
+            sample = column.iloc[:SAMPLE_ROWS].memory_usage(index=False, deep=True)
+            total += int(sample * len(column) / SAMPLE_ROWS)
+        else:
+            total += int(column.memory_usage(index=False, deep=True))
+    return total
+
+
+def cache_budget():
+    try:
+        return int(float(os.environ.get(SESSION_CACHE_ENV, SESSION_CACHE_MB)) * 1024 * 1024)
+    except ValueError:
+        return SESSION_CACHE_MB * 1024 * 1024
+
+
+class CachedSession:
+    # One loaded session as the GUI binds it: the frame, the live annotation store of one
+    # layer and the structures derived from them. Edits keep going into these objects while
+    # the session is cached, so switching back needs no reload.
+    def __init__(self, meta, annotator, df, store, stamp, nbytes, search_index=None):
+        self.meta = meta
+        self.annotator = annotator
+        self.df = df
+        self.store = store
+        self.stamp = stamp  # history_manager.data_stamp() when loaded
+        self.nbytes = nbytes
+        self.search_index = search_index
+        self.sort_keys = None
+        self.scores = None
+        self.analytics = {}  # group field -> SessionAnalytics, built when the analytics panel asks
+
+    @property
+    def key(self):
+        return self.meta["timestamp"], self.annotator
+
+
+class SessionCache:
+    # LRU of loaded sessions keyed by (timestamp, annotator) within a memory budget.
+    # The most recently used entry is never evicted; an evicted entry with unsaved rows is
+    # handed to write_back(entry) first. get() drops an entry whose data changed on disk.
+    def __init__(self, budget_bytes=None, write_back=None):
+        self.budget_bytes = cache_budget() if budget_bytes is None else budget_bytes
+        self.write_back = write_back
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def get(self, key, stamp):
+        entry = self._entries.get(key)
+        if entry is not None and entry.stamp != stamp:
+            logging.info(f"⚠️ 数据文件已变化，丢弃缓存：{key[0]}")
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, entry):
+        if entry.key in self._entries:
+            self._drop(entry.key)
+        self._entries[entry.key] = entry
+        self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > 1 and self.nbytes > self.budget_bytes:
+            key = next(iter(self._entries))
+            if not self._drop(key):
+                break
+            logging.info(f"🗑️ 会话缓存超出预算，移除：{key[0]}（缓存{len(self._entries)}个，{self.nbytes / 1048576:.0f} MB）")
+
+    def _drop(self, key):
+        # False when unsaved rows could not be written; the entry is then kept
+        entry = self._entries[key]
+        if entry.store.dirty and self.write_back is not None:
+            try:
+                self.write_back(entry)
+            except Exception as e:
+                logging.error(f"❌ 写回缓存注解失败（{key[0]}）：{str(e)}")
+                return False
+        del self._entries[key]
+        return True
+
+    def remove(self, key):
+        if key in self._entries:
+            self._drop(key)
+
+    def discard(self, timestamp):
+        # Every layer of a session, without write-back, e.g. after it was deleted
+        for key in [key for key in self._entries if key[0] == timestamp]:
+            del self._entries[key]
+
+    def clear(self):
+        for key in list(self._entries):
+            self._drop(key)
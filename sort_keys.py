@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from table_model import COUNT_COLUMNS
+
+
+def parse_duration(values):
+    # "2:28" / "1:02:03" / "148" / 148 -> seconds as float64, NaN where unparseable
+    series = pd.Series(values)
+    if series.dtype.kind in "iuf":
+        return series.to_numpy(dtype=np.float64)
+    text = series.astype(str).str.strip()
+    parts = text.str.split(":", expand=True).reindex(columns=range(3))
+    numbers = [pd.to_numeric(parts[i], errors="coerce").to_numpy(dtype=np.float64) for i in range(3)]
+    n_parts = text.str.count(":").to_numpy() + 1
+    return np.select(
+        [n_parts == 1, n_parts == 2, n_parts == 3],
+        [numbers[0], numbers[0] * 60 + numbers[1], numbers[0] * 3600 + numbers[1] * 60 + numbers[2]],
+        default=np.nan
+    )
+
+
+class SortKeyCache:
+    # Typed sort keys and argsort permutations of one session, keyed by column name
+    # (data column, score column or custom field). Keys are built on the first click;
+    # permutations are cached per direction until invalidate() is called for that column.
+    def __init__(self, df, store, scores):
+        self.df = df
+        self.store = store
+        self.scores = scores
+        self._keys = {}
+        self._orders = {}
+
+    def key(self, column):
+        key = self._keys.get(column)
+        if key is None:
+            key = self._keys[column] = self._build_key(column)
+        return key
+
+    def _build_key(self, column):
+        if column in self.scores:
+            return pd.Series(self.scores[column], copy=False)
+        custom_types = {col["name"]: col["type"] for col in self.store.custom_columns}
+        if custom_types.get(column) == "multi":
+            return pd.Series(self.store.scores(column))
+        if custom_types.get(column) == "numeric":
+            return pd.to_numeric(pd.Series(self.store.values(column)), errors="coerce")
+        if column in custom_types:
+            return pd.Series(self.store.values(column))
+        values = self.df[column].reset_index(drop=True)
+        if column == "publish_time":
+            return pd.to_datetime(values, errors="coerce")
+        if column == "duration":
+            return pd.Series(parse_duration(values))
+        if column in COUNT_COLUMNS:
+            return pd.to_numeric(values, errors="coerce")
+        return values
+
+    def order(self, column, ascending=True):
+        # View -> data row permutation; stable, missing values last in both directions
+        order = self._orders.get((column, ascending))
+        if order is None:
+            order = self.key(column).sort_values(
+                ascending=ascending, na_position="last", kind="stable"
+            ).index.to_numpy()
+            self._orders[(column, ascending)] = order
+        return order
+
+    def invalidate(self, column):
+        # Score keys are views of the live score arrays, only their permutations go stale
+        if column not in self.scores:
+            self._keys.pop(column, None)
+        self._orders.pop((column, True), None)
+        self._orders.pop((column, False), None)
@@ -0,0 +1,583 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from annotation_store import AnnotationStore
+from dedup_index import DedupIndex, DedupImport, DUPLICATE_COLUMN
+from delta_import import DeltaMerge, METRIC_COLUMNS, KEY_COLUMNS
+from history_manager import HistoryManager, HISTORY_DIR, ANNOTATOR_ENV, fill_expected_columns, check_annotator
+from import_pipeline import iter_chunks, conform_chunk, IMPORT_CHUNK_ROWS
+from instrumentation import timed
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SQLITE_DB = os.path.join(HISTORY_DIR, "history.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    timestamp TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    meta TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    session TEXT NOT NULL,
+    annotator TEXT NOT NULL DEFAULT '',
+    row INTEGER NOT NULL,
+    jama INTEGER NOT NULL DEFAULT 0,
+    gqs INTEGER NOT NULL DEFAULT 1,
+    discern INTEGER NOT NULL DEFAULT 0,
+    custom TEXT NOT NULL DEFAULT '{}',
+    seq INTEGER NOT NULL DEFAULT 0,
+    rated INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session, annotator, row)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS annotations_seq ON annotations (session, annotator, seq);
+"""
+
+# seq numbers the write transactions of a layer, so a sync only reads rows written after it
+UPSERT_ANNOTATION = """
+INSERT INTO annotations (session, annotator, row, jama, gqs, discern, custom, rated, seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session, annotator, row) DO UPDATE SET
+    jama = excluded.jama, gqs = excluded.gqs, discern = excluded.discern, custom = excluded.custom,
+    rated = excluded.rated, seq = excluded.seq
+"""
+
+
+def data_table(timestamp):
+    return f"data_{timestamp}"
+
+
+def layer_rows(values, annotator, seq):
+    # annotation_rows() tuples as UPSERT_ANNOTATION parameters of one layer
+    return [(value[0], annotator, value[1]) + value[2:] + (seq,) for value in values]
+
+
+def annotation_rows(session, store, rows):
+    # (session, row, jama mask, gqs, discern mask, custom json, rated) for the given store rows;
+    # labels outside the JAMA/DISCERN vocabulary travel in the custom json
+    custom_names = [col["name"] for col in store.custom_columns]
+    result = []
+    for row in rows:
+        custom = {}
+        if custom_names:
+            record = store.record(row)
+            custom = {name: record[name] for name in custom_names}
+        for field in ("jama", "discern"):
+            extra = store.overflow.get((field, row))
+            if extra:
+                custom[field] = sorted(extra)
+        result.append((
+            session, int(row),
+            int(store.arrays["jama"][row]), int(store.arrays["gqs"][row]), int(store.arrays["discern"][row]),
+            json.dumps(custom, ensure_ascii=False) if custom else "{}",
+            int(store.rated[row])
+        ))
+    return result
+
+
+class SqliteHistoryManager:
+    # Same API as HistoryManager, backed by one SQLite database in WAL mode.
+    # Imported data lives in one table per session, annotations in an indexed
+    # (session, row) table so one edited row is one upsert.
+    def __init__(self, db_path=SQLITE_DB, annotator=None, **kwargs):
+        self.db_path = db_path
+        self.annotator = check_annotator(os.environ.get(ANNOTATOR_ENV, "") if annotator is None else annotator)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Autosave writes from a worker thread; access is serialized by the lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._lock = threading.RLock()
+        self._dedup_index = None
+        self._claimed = set()  # timestamps of imports still running in this process
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self._upgrade_schema()
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+        logging.info(f"✅ 初始化历史记录数据库：{self.db_path}")
+
+    def _upgrade_schema(self):
+        # Databases from before annotator layers: their annotations become the main layer
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(annotations)")]
+        if "annotator" in columns and "rated" not in columns:
+            # Rows saved before the rated flag count as rated when they differ from the empty values
+            with self.conn:
+                self.conn.execute("ALTER TABLE annotations ADD COLUMN rated INTEGER NOT NULL DEFAULT 0")
+            logging.info(f"✅ 数据库已添加标注状态字段：{self.db_path}")
+        if not columns or "annotator" in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE annotations RENAME TO annotations_v1")
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(
+                "INSERT INTO annotations (session, row, jama, gqs, discern, custom) "
+                "SELECT session, row, jama, gqs, discern, custom FROM annotations_v1"
+            )
+            self.conn.execute("DROP TABLE annotations_v1")
+        logging.info(f"✅ 数据库已升级为多标注员结构：{self.db_path}")
+
+    def _layer(self, annotator):
+        return self.annotator if annotator is None else check_annotator(annotator)
+
+    def _begin_write(self, session, annotator):
+        # Takes the database write lock up front and returns the layer's next seq, so
+        # concurrent writers get distinct, increasing numbers
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM annotations WHERE session = ? AND annotator = ?",
+            (session, annotator)
+        ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def get_history(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT meta FROM sessions ORDER BY timestamp DESC").fetchall()
+        metas = []
+        for (meta_json,) in rows:
+            try:
+                metas.append(json.loads(meta_json))
+            except ValueError as e:
+                logging.error(f"❌ 加载元数据失败：{str(e)}")
+        logging.info(f"📊 共加载 {len(metas)} 条历史导入记录")
+        return metas
+
+    @timed("history.get_data")
+    def get_data(self, meta, progress=None, annotator=None):
+        table = data_table(meta["timestamp"])
+        try:
+            with self._lock:
+                df = pd.read_sql_query(f'SELECT * FROM "{table}" ORDER BY rowid', self.conn)
+            logging.info(f"📥 成功加载数据：{table}（共{len(df)}条）")
+        except Exception as e:
+            logging.error(f"❌ 加载数据失败（{table}）：{str(e)}")
+            df = pd.DataFrame()
+        if progress is not None:
+            progress(len(df), 0.5)
+        return df, self.load_annotations(meta, len(df), annotator)
+
+    def data_stamp(self, meta):
+        # Changes whenever the session's data table is rewritten; None when the session is gone
+        with self._lock:
+            row = self.conn.execute("SELECT count, meta FROM sessions WHERE timestamp = ?", (meta["timestamp"],)).fetchone()
+            if row is None:
+                return None
+            last = self.conn.execute(f'SELECT MAX(rowid) FROM "{data_table(meta["timestamp"])}"').fetchone()[0]
+        return row[0], last, json.loads(row[1]).get("revision", 0)
+
+    def data_columns(self, meta):
+        table = data_table(meta["timestamp"])
+        with self._lock:
+            rows = self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        return [row[1] for row in rows]
+
+    def iter_data(self, meta, chunksize=IMPORT_CHUNK_ROWS):
+        # Keyset pagination on rowid; the lock is only held while a chunk is read
+        table = data_table(meta["timestamp"])
+        last = 0
+        while True:
+            with self._lock:
+                chunk = pd.read_sql_query(
+                    f'SELECT rowid AS "__rowid", * FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    self.conn, params=(last, chunksize)
+                )
+            if chunk.empty:
+                return
+            last = int(chunk["__rowid"].iloc[-1])
+            yield chunk.drop(columns="__rowid")
+            if len(chunk) < chunksize:
+                return
+
+    @timed("history.load_annotations")
+    def load_annotations(self, meta, n_rows=0, annotator=None):
+        annotator = self._layer(annotator)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT row, jama, gqs, discern, custom, seq, rated FROM annotations "
+                "WHERE session = ? AND annotator = ? ORDER BY row",
+                (meta["timestamp"], annotator)
+            ).fetchall()
+        n_rows = max(n_rows, rows[-1][0] + 1 if rows else 0)
+        store = AnnotationStore(n_rows, meta.get("custom_columns", []))
+        self._apply_rows(store, rows)
+        store.dirty = set()
+        store.sync_state = {"seq": max((r[5] for r in rows), default=0)}
+        logging.info(f"📥 成功加载注解数据：{meta['timestamp']}（共{len(rows)}条）")
+        return store
+
+    def _apply_rows(self, store, rows):
+        # rows: (row, jama, gqs, discern, custom, seq, rated) as selected from the annotations table
+        if not rows:
+            return
+        index = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        for pos, field in ((1, "jama"), (2, "gqs"), (3, "discern")):
+            values = store.arrays[field]
+            values[index] = np.fromiter((r[pos] for r in rows), dtype=np.int64, count=len(rows)).astype(values.dtype)
+        for r in rows:
+            row, custom = r[0], r[4]
+            for field in ("jama", "discern"):
+                store.overflow.pop((field, row), None)
+            if custom == "{}":
+                continue
+            for field, value in json.loads(custom).items():
+                if field in ("jama", "discern"):
+                    store.overflow[(field, row)] = set(value)
+                elif field in store.types:
+                    store.set_value(field, row, value)
+        store.rated[index] = np.fromiter((r[6] for r in rows), dtype=bool, count=len(rows))
+
+    def sync_annotations(self, meta, store, annotator=None):
+        # Reads only the rows of the layer written after the store's last seen seq; unsaved
+        # rows of the store are kept. Returns the changed rows, or None when the store was
+        # not loaded from this backend.
+        state = store.sync_state
+        if state is None or "seq" not in state:
+            return None
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT row, jama, gqs, discern, custom, seq, rated FROM annotations "
+                "WHERE session = ? AND annotator = ? AND seq > ?",
+                (meta["timestamp"], self._layer(annotator), state["seq"])
+            ).fetchall()
+        if not rows:
+            return []
+        state["seq"] = max(r[5] for r in rows)
+        rows = [r for r in rows if r[0] not in store.dirty]
+        if rows:
+            store.resize(max(r[0] for r in rows) + 1)
+        before = {r[0]: store.record(r[0]) for r in rows if r[0] < store.n_rows}
+        dirty = set(store.dirty)
+        self._apply_rows(store, rows)
+        store.dirty = dirty
+        changed = sorted(r[0] for r in rows if before.get(r[0]) != store.record(r[0]))
+        if changed:
+            logging.info(f"🔄 同步注解：{meta['timestamp']}（共{len(changed)}行有变化）")
+        return changed
+
+    def list_annotators(self, meta):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT annotator FROM annotations WHERE session = ? AND annotator != '' ORDER BY annotator",
+                (meta["timestamp"],)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _new_timestamp(self):
+        # Next free second, so two imports within one second do not replace each other; a
+        # running import has no sessions row yet, so its timestamp is claimed until it ends
+        moment = datetime.now()
+        with self._lock:
+            while True:
+                timestamp = moment.strftime("%Y%m%d%H%M%S")
+                taken = timestamp in self._claimed or self.conn.execute(
+                    "SELECT 1 FROM sessions WHERE timestamp = ? UNION ALL "
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                    (timestamp, data_table(timestamp))
+                ).fetchone() is not None
+                if not taken:
+                    self._claimed.add(timestamp)
+                    return timestamp
+                moment += timedelta(seconds=1)
+
+    @timed("history.add_history")
+    def add_history(self, filename, data, custom_columns):
+        timestamp = self._new_timestamp()
+        df = fill_expected_columns(pd.DataFrame(data))
+        meta = {
+            "timestamp": timestamp,
+            "filename": filename,
+            "count": len(df),
+            "custom_columns": custom_columns
+        }
+        try:
+            self._insert_session(meta, df, AnnotationStore(len(df), custom_columns))
+        finally:
+            with self._lock:
+                self._claimed.discard(timestamp)
+        return meta
+
+    @timed("history.add_history_from_file")
+    def add_history_from_file(self, file_path, custom_columns, chunksize=IMPORT_CHUNK_ROWS, progress=None, dedup=None):
+        # Streaming import, one transaction per chunk (to_sql commits on its own), so the lock
+        # is free for the UI thread between chunks. The session row is inserted last; an
+        # interrupted import drops what it wrote.
+        timestamp = self._new_timestamp()
+        table = data_table(timestamp)
+        empty = annotation_rows(timestamp, AnnotationStore(1, custom_columns), [0])[0]
+        count = 0
+        columns = None
+        try:
+            with DedupImport(self, dedup, custom_columns) as deduper:
+                for chunk, fraction in iter_chunks(file_path, chunksize):
+                    chunk = conform_chunk(chunk, columns, fill_expected_columns)
+                    chunk, reused = deduper.prepare(chunk, count, timestamp)
+                    values = [(timestamp, row) + empty[2:] for row in range(count, count + len(chunk))]
+                    if reused:
+                        batch = AnnotationStore.from_records([record for _, record in reused], custom_columns)
+                        for (row, _), value in zip(reused, annotation_rows(timestamp, batch, range(len(reused)))):
+                            values[row - count] = (timestamp, row) + value[2:]
+                    with self._lock, self.conn:
+                        chunk.to_sql(table, self.conn, index=False, if_exists="append")
+                        self.conn.executemany(UPSERT_ANNOTATION, layer_rows(values, "", 0))
+                    columns = list(chunk.columns)
+                    count += len(chunk)
+                    if progress is not None:
+                        progress(count, fraction)
+                meta = {
+                    "timestamp": timestamp,
+                    "filename": os.path.basename(file_path),
+                    "count": count,
+                    "custom_columns": custom_columns
+                }
+                stats = deduper.finish(timestamp, count)
+                if stats is not None:
+                    meta["dedup"] = stats
+                with self._lock, self.conn:
+                    if columns is None:
+                        fill_expected_columns(pd.DataFrame()).to_sql(table, self.conn, index=False)
+                    if deduper.late and deduper.mode == "flag":
+                        # rowids of the new table count from 1 in row order
+                        self.conn.executemany(
+                            f'UPDATE "{table}" SET "{DUPLICATE_COLUMN}" = ? WHERE rowid = ?',
+                            [(ref, row + 1) for row, ref in deduper.late.items()]
+                        )
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO sessions (timestamp, filename, count, meta) VALUES (?, ?, ?, ?)",
+                        (timestamp, meta["filename"], count, json.dumps(meta, ensure_ascii=False))
+                    )
+            logging.info(f"📝 成功保存数据：{table}（共{count}条，{len(columns or [])}个字段）")
+        except Exception as e:
+            logging.error(f"❌ 导入文件失败（{file_path}）：{str(e)}")
+            with self._lock, self.conn:
+                self.conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+                self.conn.execute("DELETE FROM annotations WHERE session = ?", (timestamp,))
+            raise
+        finally:
+            with self._lock:
+                self._claimed.discard(timestamp)
+        return meta
+
+    @timed("history.update_history_from_file")
+    def update_history_from_file(self, meta, file_path, chunksize=IMPORT_CHUNK_ROWS, progress=None):
+        # Refreshes a session from a new crawl (see delta_import): one UPDATE per count that
+        # changed and an INSERT of the new videos, in one transaction; annotations stay
+        timestamp = meta["timestamp"]
+        table = data_table(timestamp)
+        columns = self.data_columns(meta)
+        if not columns:
+            raise ValueError(f"历史记录不存在：{timestamp}")
+        selected = ", ".join(f'"{name}"' for name in KEY_COLUMNS + tuple(METRIC_COLUMNS) if name in columns)
+        with self._lock:
+            stored = pd.read_sql_query(f'SELECT rowid AS "__rowid", {selected} FROM "{table}" ORDER BY rowid', self.conn)
+        merge = DeltaMerge(stored)
+        added = []
+        for chunk, fraction in iter_chunks(file_path, chunksize):
+            new_rows = merge.apply(chunk)
+            if len(new_rows):
+                added.append(fill_expected_columns(new_rows).reindex(columns=columns))
+            if progress is not None:
+                progress(merge.stats["rows"], fraction)
+        stats = merge.finish()
+        rows = merge.changed_rows()
+        try:
+            with self._lock, self.conn:
+                row = self.conn.execute("SELECT meta FROM sessions WHERE timestamp = ?", (timestamp,)).fetchone()
+                if row is None:
+                    raise ValueError(f"历史记录不存在：{timestamp}")
+                rowids = stored["__rowid"].to_numpy()
+                for name in merge.metrics:
+                    cells, values = merge.updates(name)
+                    if len(cells):
+                        self.conn.executemany(
+                            f'UPDATE "{table}" SET "{name}" = ? WHERE rowid = ?',
+                            zip(values, rowids[cells].tolist())
+                        )
+                for new_rows in added:
+                    new_rows.to_sql(table, self.conn, index=False, if_exists="append")
+                meta_data = json.loads(row[0])
+                meta_data["count"] = len(stored) + stats["added"]
+                # Part of data_stamp(): rows updated in place change neither the count nor the last rowid
+                if len(rows):
+                    meta_data["revision"] = meta_data.get("revision", 0) + 1
+                meta_data["last_update"] = dict(stats, filename=os.path.basename(file_path),
+                                                time=datetime.now().strftime("%Y%m%d%H%M%S"))
+                self.conn.execute(
+                    "UPDATE sessions SET count = ?, meta = ? WHERE timestamp = ?",
+                    (meta_data["count"], json.dumps(meta_data, ensure_ascii=False), timestamp)
+                )
+            logging.info(f"📝 成功更新数据：{table}（更新{len(rows)}条，新增{stats['added']}条）")
+        except Exception as e:
+            logging.error(f"❌ 更新数据失败（{table}）：{str(e)}")
+            raise
+        return meta_data
+
+    def dedup_index(self):
+        # Kept next to the database file: history.db -> history.dedup.json
+        with self._lock:
+            if self._dedup_index is None:
+                self._dedup_index = DedupIndex(f"{os.path.splitext(self.db_path)[0]}.dedup.json")
+            return self._dedup_index
+
+    def _insert_session(self, meta, df, store):
+        timestamp = meta["timestamp"]
+        try:
+            with self._lock, self.conn:
+                self.conn.execute(f'DROP TABLE IF EXISTS "{data_table(timestamp)}"')
+                self.conn.execute("DELETE FROM annotations WHERE session = ?", (timestamp,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sessions (timestamp, filename, count, meta) VALUES (?, ?, ?, ?)",
+                    (timestamp, meta["filename"], meta["count"], json.dumps(meta, ensure_ascii=False))
+                )
+                df.to_sql(data_table(timestamp), self.conn, index=False)
+                self.conn.executemany(UPSERT_ANNOTATION, layer_rows(annotation_rows(timestamp, store, range(store.n_rows)), "", 0))
+            logging.info(f"📝 成功保存数据：{data_table(timestamp)}（共{len(df)}条，{len(df.columns)}个字段）")
+        except Exception as e:
+            logging.error(f"❌ 保存数据失败（{data_table(timestamp)}）：{str(e)}")
+
+    @timed("history.save_annotations")
+    def save_annotations(self, meta, store, rows=None, annotator=None):
+        rows = store.take_dirty() if rows is None else rows
+        if not rows:
+            return 0
+        try:
+            self._write_layer(meta, annotation_rows(meta["timestamp"], store, rows), store, annotator)
+            logging.info(f"📝 成功保存注解：{meta['timestamp']}（共{len(rows)}条）")
+        except Exception as e:
+            store.dirty.update(rows)
+            logging.error(f"❌ 保存注解失败（{meta['timestamp']}）：{str(e)}")
+            raise
+        return len(rows)
+
+    @timed("history.append_annotations")
+    def append_annotations(self, meta, entries, store=None, annotator=None):
+        # entries: [(row, record)] as produced by AutosaveManager
+        entries = list(entries)
+        if not entries:
+            return 0
+        batch = AnnotationStore.from_records([record for _, record in entries], meta.get("custom_columns", []))
+        values = annotation_rows(meta["timestamp"], batch, range(len(entries)))
+        values = [(value[0], row) + value[2:] for (row, _), value in zip(entries, values)]
+        self._write_layer(meta, values, store, annotator)
+        logging.info(f"📝 成功保存注解：{meta['timestamp']}（共{len(values)}条）")
+        return len(values)
+
+    def _write_layer(self, meta, values, store=None, annotator=None, replace=False):
+        # One write transaction on a layer; the store's seq follows when nobody else wrote in between
+        annotator = self._layer(annotator)
+        with self._lock, self.conn:
+            seq = self._begin_write(meta["timestamp"], annotator)
+            if replace:
+                self.conn.execute(
+                    "DELETE FROM annotations WHERE session = ? AND annotator = ?", (meta["timestamp"], annotator)
+                )
+            self.conn.executemany(UPSERT_ANNOTATION, layer_rows(values, annotator, seq))
+        state = store.sync_state if store is not None else None
+        if replace:
+            store.sync_state = {"seq": seq}
+        elif state is not None and state.get("seq") == seq - 1:
+            state["seq"] = seq
+        return seq
+
+    def replace_annotations(self, meta, store, annotator=None):
+        # Overwrites a layer with store, e.g. with the result of merging several annotators
+        self._write_layer(meta, annotation_rows(meta["timestamp"], store, range(store.n_rows)), store, annotator, replace=True)
+        store.dirty = set()
+        logging.info(f"📝 成功写入注解：{meta['timestamp']}（{self._layer(annotator) or '主标注'}，共{store.n_rows}条）")
+        return store.n_rows
+
+    @timed("history.compact_annotations")
+    def compact_annotations(self, meta=None, store=None, annotator=None):
+        # Annotations are updated in place; compaction only checkpoints the WAL
+        try:
+            with self._lock:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return True
+        except Exception as e:
+            logging.error(f"❌ 压缩数据库失败（{self.db_path}）：{str(e)}")
+            return False
+
+    def save_custom_columns(self, meta, custom_columns):
+        if not meta:
+            return
+        try:
+            with self._lock, self.conn:
+                row = self.conn.execute("SELECT meta FROM sessions WHERE timestamp = ?", (meta["timestamp"],)).fetchone()
+                if row is None:
+                    logging.warning(f"⚠️ 历史记录不存在：{meta['timestamp']}")
+                    return
+                meta_data = json.loads(row[0])
+                meta_data["custom_columns"] = custom_columns
+                self.conn.execute(
+                    "UPDATE sessions SET meta = ? WHERE timestamp = ?",
+                    (json.dumps(meta_data, ensure_ascii=False), meta["timestamp"])
+                )
+            logging.info(f"📝 成功保存自定义字段：{meta['timestamp']}")
+        except Exception as e:
+            logging.error(f"❌ 保存自定义字段失败（{meta['timestamp']}）：{str(e)}")
+
+    def delete_history(self, meta):
+        timestamp = meta["timestamp"]
+        try:
+            with self._lock, self.conn:
+                deleted = self.conn.execute("DELETE FROM sessions WHERE timestamp = ?", (timestamp,)).rowcount
+                self.conn.execute("DELETE FROM annotations WHERE session = ?", (timestamp,))
+                self.conn.execute(f'DROP TABLE IF EXISTS "{data_table(timestamp)}"')
+            if not deleted:
+                logging.warning(f"⚠️ 待删除的历史记录不存在：{timestamp}")
+                return False
+            logging.info(f"🗑️ 成功删除历史记录：{timestamp}（文件名：{meta['filename']}）")
+            return True
+        except Exception as e:
+            logging.error(f"❌ 删除历史记录失败（{timestamp}）：{str(e)}")
+            return False
+
+    def migrate_from(self, history_dir=HISTORY_DIR, overwrite=False):
+        # Imports every .history/<timestamp>/ folder, annotation journals and annotator layers included
+        source = HistoryManager(history_dir, annotator="")
+        with self._lock:
+            existing = {row[0] for row in self.conn.execute("SELECT timestamp FROM sessions")}
+        migrated = 0
+        for meta in source.get_history():
+            if meta["timestamp"] in existing and not overwrite:
+                logging.info(f"⏭️ 跳过已迁移的历史记录：{meta['timestamp']}")
+                continue
+            df, store = source.get_data(meta)
+            meta = dict(meta, count=len(df))
+            self._insert_session(meta, df, store)
+            for annotator in source.list_annotators(meta):
+                self.replace_annotations(meta, source.load_annotations(meta, len(df), annotator), annotator)
+            migrated += 1
+        logging.info(f"✅ 迁移完成：共{migrated}条历史记录 → {self.db_path}")
+        return migrated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label Tool SQLite 历史记录存储")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="将 .history 目录导入 SQLite 数据库")
+    migrate.add_argument("--history-dir", default=HISTORY_DIR)
+    migrate.add_argument("--db", default=SQLITE_DB)
+    migrate.add_argument("--overwrite", action="store_true", help="覆盖数据库中已存在的记录")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        manager = SqliteHistoryManager(args.db)
+        manager.migrate_from(args.history_dir, overwrite=args.overwrite)
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
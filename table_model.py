@@ -0,0 +1,420 @@
+from PyQt5.QtCore import Qt, QAbstractItemModel, QAbstractTableModel, QModelIndex, QRect, QEvent, QTimer, pyqtSignal
+from PyQt5.QtGui import QDoubleValidator
+from PyQt5.QtWidgets import (
+    QApplication, QStyledItemDelegate, QStyle, QStyleOptionButton, QStyleOptionComboBox,
+    QStyleOptionViewItem, QComboBox, QLineEdit
+)
+
+# (header, data column) pairs for the fixed part of the table
+BASE_COLUMNS = [
+    ("标题", "title"),
+    ("发布时间", "publish_time"),
+    ("作者", "author_name"),
+    ("点赞数", "like_count"),
+    ("评论数", "comment_count"),
+    ("分享数", "share_count"),
+    ("收藏数", "collect_count"),
+    ("认证状态", "is_verified"),
+    ("查看", None),
+    ("视频时长（秒）", "duration"),
+    ("JAMA评分", "jama_score"),
+    ("GQS评分", "gqs_score"),
+    ("DISCERN评分", "discern_score"),
+]
+COUNT_COLUMNS = {"like_count", "comment_count", "share_count", "collect_count"}
+VIEW_COLUMN = 8
+JAMA_COLUMN = 10
+GQS_COLUMN = 11
+DISCERN_COLUMN = 12
+CUSTOM_COLUMN_START = 13
+UNSELECTED_TEXT = "未选择"
+
+# Extra roles consumed by AnnotationDelegate
+KIND_ROLE = Qt.UserRole + 1
+OPTIONS_ROLE = Qt.UserRole + 2
+SCORE_ROLE = Qt.UserRole + 3
+
+
+class AnnotationTableModel(QAbstractTableModel):
+    # (data row, column, value) - the model never mutates annotations itself,
+    # the owner applies the edit and calls refresh_cell()
+    cellEdited = pyqtSignal(int, int, object)
+
+    def __init__(self, jama_items, gqs_items, discern_items, parent=None):
+        super().__init__(parent)
+        self.jama_items = jama_items
+        self.gqs_items = gqs_items
+        self.discern_items = discern_items
+        self.custom_columns = []
+        self._columns = {}
+        self._data_rows = 0
+        self._row_count = 0
+        # Sort permutation of data rows (None means load order) and row filter (None shows all);
+        # _rows is the resulting view row -> data row map, _position its inverse (-1 = hidden)
+        self._order = None
+        self._mask = None
+        self._rows = None
+        self._position = None
+        self.store = None
+
+    def set_session(self, df, store, custom_columns):
+        # df None means no session
+        self.beginResetModel()
+        # Keep references to the columns only; cell text is produced on demand
+        self._columns = {} if df is None else {
+            name: df[name] for _, name in BASE_COLUMNS
+            if name is not None and name in df.columns
+        }
+        self._data_rows = 0 if df is None else len(df)
+        self.store = store
+        self.custom_columns = list(custom_columns)
+        self._order = None
+        self._mask = None
+        self._update_rows()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_session(None, None, self.custom_columns)
+
+    def set_custom_columns(self, custom_columns):
+        self.beginResetModel()
+        self.custom_columns = list(custom_columns)
+        self.endResetModel()
+
+    def insert_custom_column(self, col_def):
+        column = CUSTOM_COLUMN_START + len(self.custom_columns)
+        self.beginInsertColumns(QModelIndex(), column, column)
+        self.custom_columns.append(col_def)
+        self.endInsertColumns()
+        return column
+
+    def remove_custom_column(self, name):
+        names = [col["name"] for col in self.custom_columns]
+        if name not in names:
+            return -1
+        column = CUSTOM_COLUMN_START + names.index(name)
+        self.beginRemoveColumns(QModelIndex(), column, column)
+        del self.custom_columns[column - CUSTOM_COLUMN_START]
+        self.endRemoveColumns()
+        return column
+
+    def set_order(self, order):
+        # Reorder rows through a permutation of data rows; nothing is copied or rebuilt.
+        # numpy is imported on first use: the empty table is built before it is loaded
+        import numpy as np
+        self.layoutAboutToBeChanged.emit([], QAbstractItemModel.VerticalSortHint)
+        persistent = self.persistentIndexList()
+        data_rows = [self.source_row(index.row()) for index in persistent]
+        self._order = None if order is None else np.asarray(order, dtype=np.int64)
+        self._update_rows()
+        self.changePersistentIndexList(
+            persistent,
+            [self.index(self.view_row(row), index.column()) for row, index in zip(data_rows, persistent)]
+        )
+        self.layoutChanged.emit([], QAbstractItemModel.VerticalSortHint)
+
+    def set_filter(self, mask):
+        # Show only data rows where mask is True (None shows all), in the current sort order
+        import numpy as np
+        self.beginResetModel()
+        self._mask = None if mask is None else np.asarray(mask, dtype=bool)
+        self._update_rows()
+        self.endResetModel()
+
+    def _update_rows(self):
+        rows = self._order
+        if rows is None and self._mask is None:
+            self._rows = self._position = None
+            self._row_count = self._data_rows
+            return
+        import numpy as np
+        if self._mask is not None:
+            rows = np.arange(self._data_rows) if rows is None else rows
+            rows = rows[self._mask[rows]]
+        self._rows = rows
+        self._position = np.full(self._data_rows, -1, dtype=np.int64)
+        self._position[rows] = np.arange(len(rows))
+        self._row_count = len(rows)
+
+    def source_row(self, row):
+        return int(self._rows[row]) if self._rows is not None else row
+
+    def view_row(self, row):
+        # -1 when the data row is filtered out
+        return int(self._position[row]) if self._position is not None else row
+
+    def refresh_cell(self, row, column):
+        index = self.index(self.view_row(row), column)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+    def refresh_annotations(self):
+        # Annotation cells of every row, e.g. after edits of another process were synced in
+        if self._row_count:
+            self.dataChanged.emit(self.index(0, JAMA_COLUMN), self.index(self._row_count - 1, self.columnCount() - 1))
+
+    def column_kind(self, column):
+        if column < CUSTOM_COLUMN_START:
+            if column == JAMA_COLUMN or column == DISCERN_COLUMN:
+                return "check"
+            if column == GQS_COLUMN:
+                return "gqs"
+            if column == VIEW_COLUMN:
+                return "view"
+            return "text"
+        return self.custom_columns[column - CUSTOM_COLUMN_START]["type"]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(BASE_COLUMNS) + len(self.custom_columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Vertical:
+            return str(section + 1)
+        if section < CUSTOM_COLUMN_START:
+            return BASE_COLUMNS[section][0]
+        if section - CUSTOM_COLUMN_START < len(self.custom_columns):
+            return self.custom_columns[section - CUSTOM_COLUMN_START]["name"]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self.column_kind(index.column()) in ("gqs", "numeric", "enum"):
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def _text_value(self, row, column):
+        name = BASE_COLUMNS[column][1]
+        values = self._columns.get(name)
+        if values is None:
+            return "" if name not in COUNT_COLUMNS else "0"
+        value = values.iat[row]
+        if name in COUNT_COLUMNS:
+            try:
+                return str(int(value))
+            except (TypeError, ValueError):  # NaN / None: missing count
+                return "0"
+        if type(value).__name__ == "NaTType":  # checked by name so that pandas is not imported here
+            return ""
+        return str(value)
+
+    def column_field(self, column):
+        if column == JAMA_COLUMN:
+            return "jama"
+        if column == GQS_COLUMN:
+            return "gqs"
+        if column == DISCERN_COLUMN:
+            return "discern"
+        return self.custom_columns[column - CUSTOM_COLUMN_START]["name"]
+
+    def _options(self, column):
+        if column == JAMA_COLUMN:
+            return self.jama_items
+        if column == DISCERN_COLUMN:
+            return self.discern_items
+        return self.custom_columns[column - CUSTOM_COLUMN_START]["enum_values"]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = self.source_row(index.row()), index.column()
+        kind = self.column_kind(column)
+        if role == KIND_ROLE:
+            return kind
+
+        if kind == "text":
+            return self._text_value(row, column) if role in (Qt.DisplayRole, Qt.ToolTipRole) else None
+        if kind == "view":
+            return "查看" if role == Qt.DisplayRole else None
+        field = self.column_field(column)
+        if kind in ("check", "multi"):
+            selected = self.store.get_items(field, row)
+            options = self._options(column)
+            if role == Qt.DisplayRole:
+                return ", ".join(item for item in options if item in selected)
+            if role == Qt.EditRole:
+                return selected
+            if role == OPTIONS_ROLE:
+                return options
+            if role == SCORE_ROLE:
+                return f"({len(selected)}/{len(options)})"
+            return None
+        if kind == "gqs":
+            score = self.store.get_value(field, row)
+            if role in (Qt.DisplayRole, Qt.EditRole):
+                return self.gqs_items[score - 1] if 0 < score <= len(self.gqs_items) else self.gqs_items[0]
+            if role == OPTIONS_ROLE:
+                return self.gqs_items
+            if role == SCORE_ROLE:
+                return f"({score}/{len(self.gqs_items)})"
+            return None
+        value = self.store.get_value(field, row)
+        if kind == "enum":
+            if role in (Qt.DisplayRole, Qt.EditRole):
+                return str(value) if value else UNSELECTED_TEXT
+            if role == OPTIONS_ROLE:
+                return [UNSELECTED_TEXT] + self.custom_columns[column - CUSTOM_COLUMN_START]["enum_values"]
+            return None
+        # numeric
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return str(value)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        kind = self.column_kind(index.column())
+        if kind == "gqs":
+            value = self.gqs_items.index(value) + 1
+        elif kind in ("text", "view"):
+            return False
+        self.cellEdited.emit(self.source_row(index.row()), index.column(), value)
+        return True
+
+
+class AnnotationDelegate(QStyledItemDelegate):
+    # Paints checkbox groups and combo boxes straight from the model; the only
+    # real widgets are the short-lived editors for combo and numeric cells. A click on a
+    # combo cell opens its dropdown at once; editors opened from the keyboard (F2) show
+    # no dropdown, so the arrow keys keep moving through the table.
+    CHECK_SPACING = 5
+    MARGIN = 2
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._popup = False  # the next combo editor was opened by a click
+
+    def _style(self, option):
+        widget = option.widget
+        return widget.style() if widget is not None else QApplication.style()
+
+    def _paint_background(self, painter, option, index):
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        opt.text = ""
+        self._style(option).drawPrimitive(QStyle.PE_PanelItemViewItem, opt, painter, option.widget)
+
+    def _paint_score(self, painter, option, index, x):
+        score = index.data(SCORE_ROLE)
+        if not score:
+            return
+        rect = QRect(x, option.rect.y(), option.rect.right() - x, option.rect.height())
+        painter.drawText(rect, Qt.AlignVCenter | Qt.AlignLeft, score)
+
+    def _check_rects(self, option, options):
+        style = self._style(option)
+        indicator = style.pixelMetric(QStyle.PM_IndicatorWidth, None, option.widget)
+        spacing = style.pixelMetric(QStyle.PM_CheckBoxLabelSpacing, None, option.widget)
+        x = option.rect.x() + self.MARGIN
+        rects = []
+        for item in options:
+            width = indicator + spacing + option.fontMetrics.width(item)
+            rects.append(QRect(x, option.rect.y(), width, option.rect.height()))
+            x += width + self.CHECK_SPACING
+        return rects, x
+
+    def _combo_rect(self, option, index):
+        width = max(option.fontMetrics.width(text) for text in index.data(OPTIONS_ROLE)) + 40
+        if index.data(SCORE_ROLE):
+            width = min(width, option.rect.width() - option.fontMetrics.width(index.data(SCORE_ROLE)) - 10)
+        rect = QRect(option.rect)
+        rect.setWidth(max(0, min(width, option.rect.width() - self.MARGIN)))
+        rect.moveLeft(option.rect.x() + self.MARGIN)
+        return rect
+
+    def paint(self, painter, option, index):
+        kind = index.data(KIND_ROLE)
+        if kind in ("check", "multi"):
+            self._paint_background(painter, option, index)
+            selected = index.data(Qt.EditRole)
+            options = index.data(OPTIONS_ROLE)
+            rects, x = self._check_rects(option, options)
+            style = self._style(option)
+            for item, rect in zip(options, rects):
+                button = QStyleOptionButton()
+                button.rect = rect
+                button.text = item
+                button.state = QStyle.State_Enabled | (QStyle.State_On if item in selected else QStyle.State_Off)
+                style.drawControl(QStyle.CE_CheckBox, button, painter, option.widget)
+            self._paint_score(painter, option, index, x)
+        elif kind in ("gqs", "enum"):
+            self._paint_background(painter, option, index)
+            combo = QStyleOptionComboBox()
+            combo.rect = self._combo_rect(option, index)
+            combo.currentText = index.data(Qt.DisplayRole)
+            combo.state = QStyle.State_Enabled
+            style = self._style(option)
+            style.drawComplexControl(QStyle.CC_ComboBox, combo, painter, option.widget)
+            style.drawControl(QStyle.CE_ComboBoxLabel, combo, painter, option.widget)
+            self._paint_score(painter, option, index, combo.rect.right() + self.CHECK_SPACING)
+        else:
+            super().paint(painter, option, index)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        if index.data(KIND_ROLE) in ("check", "multi"):
+            _, x = self._check_rects(option, index.data(OPTIONS_ROLE))
+            size.setWidth(x - option.rect.x() + option.fontMetrics.width(index.data(SCORE_ROLE)) + self.MARGIN)
+        return size
+
+    def editorEvent(self, event, model, option, index):
+        kind = index.data(KIND_ROLE)
+        if kind in ("gqs", "enum") and event.type() == QEvent.MouseButtonRelease \
+                and event.button() == Qt.LeftButton and option.widget is not None:
+            self._popup = True
+            option.widget.edit(index)
+            self._popup = False
+            return True
+        if kind not in ("check", "multi"):
+            return super().editorEvent(event, model, option, index)
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            selected = index.data(Qt.EditRole)
+            options = index.data(OPTIONS_ROLE)
+            rects, _ = self._check_rects(option, options)
+            for item, rect in zip(options, rects):
+                if rect.contains(event.pos()):
+                    model.setData(index, (item, item not in selected), Qt.EditRole)
+                    return True
+        return False
+
+    def createEditor(self, parent, option, index):
+        kind = index.data(KIND_ROLE)
+        if kind in ("gqs", "enum"):
+            editor = QComboBox(parent)
+            editor.addItems(index.data(OPTIONS_ROLE))
+            editor.activated.connect(lambda _, e=editor: self._commit_and_close(e))
+            if self._popup:
+                QTimer.singleShot(0, editor.showPopup)
+            return editor
+        if kind == "numeric":
+            editor = QLineEdit(parent)
+            editor.setValidator(QDoubleValidator(editor))
+            return editor
+        return None
+
+    def _commit_and_close(self, editor):
+        self.commitData.emit(editor)
+        self.closeEditor.emit(editor)
+
+    def setEditorData(self, editor, index):
+        if isinstance(editor, QComboBox):
+            editor.setCurrentText(index.data(Qt.EditRole))
+        else:
+            editor.setText(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        value = editor.currentText() if isinstance(editor, QComboBox) else editor.text()
+        if value != index.data(Qt.EditRole):
+            model.setData(index, value, Qt.EditRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        if isinstance(editor, QComboBox):
+            editor.setGeometry(self._combo_rect(option, index))
+        else:
+            editor.setGeometry(option.rect)
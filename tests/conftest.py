@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from history_manager import open_history_manager
+
+BACKENDS = ("files", "sqlite")
+CUSTOM_COLUMNS = [
+    {"name": "视频类型", "type": "enum", "enum_values": ["科普", "广告"]},
+    {"name": "标签", "type": "multi", "enum_values": ["医学", "营养"]},
+    {"name": "得分", "type": "numeric", "enum_values": []},
+]
+
+
+def make_crawl(n_rows, start=0, seed=0):
+    # A small crawl in the expected_columns schema; video ids are long enough to lose
+    # precision as floats
+    rng = np.random.default_rng(seed)
+    ids = [str(7000000000000000000 + i) for i in range(start, start + n_rows)]
+    return pd.DataFrame({
+        "title": [f"视频 #{i}" for i in range(start, start + n_rows)],
+        "author_name": [f"作者{i % 7}" for i in range(start, start + n_rows)],
+        "like_count": rng.integers(0, 1000, n_rows),
+        "comment_count": rng.integers(0, 100, n_rows),
+        "video_url": [f"https://www.douyin.com/video/{video_id}" for video_id in ids],
+        "video_id": ids,
+        "is_verified": rng.integers(0, 2, n_rows),
+    })
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def open_manager(backend, tmp_path):
+    # Opens a fresh manager on the same storage each call, so a reload really reads from disk
+    managers = []
+
+    def opener(annotator=""):
+        if backend == "files":
+            manager = open_history_manager("files", history_dir=str(tmp_path / ".history"), annotator=annotator)
+        else:
+            manager = open_history_manager("sqlite", db_path=str(tmp_path / ".history" / "history.db"), annotator=annotator)
+        managers.append(manager)
+        return manager
+
+    yield opener
+    for manager in managers:
+        if hasattr(manager, "close"):
+            manager.close()
+
+
+@pytest.fixture
+def crawl_file(tmp_path):
+    # Writes a crawl to a CSV file and returns its path
+    def write(df, name="crawl.csv"):
+        path = tmp_path / name
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+        return str(path)
+    return write
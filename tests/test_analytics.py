@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from analytics import AnalyticsCache, SessionAnalytics, summarize
+from annotation_store import AnnotationStore
+from conftest import CUSTOM_COLUMNS, make_crawl
+
+
+def edit(store, rng, rows):
+    # Random edits of every field type, including rows reset to the empty, unrated record
+    empty = AnnotationStore(1, CUSTOM_COLUMNS).record(0)
+    for row in rows:
+        row = int(row)
+        store.set_value("gqs", row, int(rng.integers(1, 6)))
+        store.set_item("jama", row, "作者身份", bool(rng.integers(0, 2)))
+        store.set_item("discern", row, "视频目的清晰且简洁", bool(rng.integers(0, 2)))
+        store.set_value("视频类型", row, ["", "科普", "广告"][rng.integers(0, 3)])
+        store.set_value("标签", row, ["医学", "营养"][:rng.integers(0, 3)])
+        store.set_value("得分", row, float(rng.integers(0, 10)) if rng.integers(0, 2) else "")
+        if rng.integers(0, 4) == 0:
+            store.apply_record(row, empty)
+
+
+@pytest.mark.parametrize("by", ["", "is_verified", "gqs", "视频类型"])
+def test_incremental_refresh_matches_a_full_rebuild(open_manager, crawl_file, by):
+    manager = open_manager()
+    meta = manager.add_history_from_file(crawl_file(make_crawl(40)), CUSTOM_COLUMNS)
+    df, store = manager.get_data(meta)
+    analytics = SessionAnalytics(df, store, by)
+    rng = np.random.default_rng(1)
+    for _ in range(3):
+        rows = rng.choice(40, 8, replace=False)
+        edit(store, rng, rows)
+        analytics.invalidate_rows(rows)
+        assert summarize(analytics.aggregates()) == summarize(SessionAnalytics(df, store, by).aggregates())
+
+
+def test_cache_pulls_in_rows_saved_elsewhere(open_manager, crawl_file):
+    manager = open_manager()
+    meta = manager.add_history_from_file(crawl_file(make_crawl(10)), CUSTOM_COLUMNS)
+    cache = AnalyticsCache(manager)
+    before = cache.get(meta, "is_verified")
+
+    other = open_manager()
+    store = other.load_annotations(meta, 10)
+    edit(store, np.random.default_rng(2), range(0, 10, 3))
+    other.save_annotations(meta, store)
+    after = cache.get(meta, "is_verified")
+    assert after is before  # refreshed in place, not rebuilt
+    df, store = open_manager().get_data(meta)
+    assert summarize(after.aggregates()) == summarize(SessionAnalytics(df, store, "is_verified").aggregates())
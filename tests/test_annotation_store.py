@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+
+from annotation_store import AnnotationStore, RATED_KEY
+from conftest import CUSTOM_COLUMNS
+
+
+def filled_store():
+    store = AnnotationStore(6, CUSTOM_COLUMNS)
+    store.set_item("jama", 0, "作者身份", True)
+    store.set_item("jama", 0, "不在词表里", True)  # overflow item
+    store.set_value("gqs", 1, 4)
+    store.set_item("discern", 2, "视频目的清晰且简洁", True)
+    store.set_value("视频类型", 3, "科普")
+    store.set_value("视频类型", 4, "自定义选项")  # overflow value
+    store.set_value("标签", 3, ["营养"])
+    store.set_value("得分", 4, 2.5)
+    store.set_value("gqs", 5, 1)  # rated with the empty values
+    store.dirty = set()
+    return store
+
+
+def records_of(store):
+    return [store.record(row) for row in range(store.n_rows)]
+
+
+def test_records_round_trip():
+    store = filled_store()
+    loaded = AnnotationStore.from_records(store.to_records(), CUSTOM_COLUMNS)
+    assert records_of(loaded) == records_of(store)
+    assert loaded.rated.tolist() == [True] * 6
+
+
+def test_npz_round_trip():
+    store = filled_store()
+    buffer = io.BytesIO()
+    np.savez(buffer, **store.to_arrays())
+    buffer.seek(0)
+    with np.load(buffer, allow_pickle=False) as data:
+        loaded = AnnotationStore.from_arrays(data, CUSTOM_COLUMNS)
+    assert records_of(loaded) == records_of(store)
+
+
+def test_npz_with_other_field_definitions_is_rejected():
+    buffer = io.BytesIO()
+    np.savez(buffer, **filled_store().to_arrays())
+    buffer.seek(0)
+    changed = [dict(CUSTOM_COLUMNS[0], enum_values=["科普", "广告", "其他"])] + CUSTOM_COLUMNS[1:]
+    with np.load(buffer, allow_pickle=False) as data:
+        assert AnnotationStore.from_arrays(data, changed) is None
+
+
+def test_rated_row_with_empty_values_counts_as_annotated():
+    store = filled_store()
+    assert store.annotated().tolist() == [True] * 6
+    # Records written before the rated flag existed fall back to their content
+    legacy = [{field: value for field, value in record.items() if field != RATED_KEY} for record in store.to_records()]
+    assert AnnotationStore.from_records(legacy, CUSTOM_COLUMNS).annotated().tolist() == [True] * 5 + [False]
+
+
+def test_resize_keeps_rows_and_pads_with_empty_values():
+    store = filled_store()
+    store.resize(8)
+    assert records_of(store)[:6] == records_of(filled_store())
+    assert store.record(7) == AnnotationStore(1, CUSTOM_COLUMNS).record(0)
+    assert not store.annotated()[6:].any()
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from export_engine import EXPORT_FORMATS, export_columns, export_sessions, session_source
+from conftest import CUSTOM_COLUMNS, make_crawl
+
+# Readers of every export format; video ids are read as text so that they compare exactly
+READERS = {
+    "csv": lambda path: pd.read_csv(path, encoding="utf-8-sig", dtype={"video_id": str}),
+    "parquet": lambda path: pd.read_parquet(path),
+    "jsonl": lambda path: pd.read_json(path, lines=True, dtype={"video_id": str}),
+    "xlsx": lambda path: pd.read_excel(path, dtype={"video_id": str}),
+}
+OPTIONAL_MODULES = {"parquet": "pyarrow", "xlsx": "openpyxl"}
+
+
+def annotated_session(manager, crawl_file, start=0):
+    meta = manager.add_history_from_file(crawl_file(make_crawl(4, start), f"crawl{start}.csv"), CUSTOM_COLUMNS)
+    store = manager.load_annotations(meta, 4)
+    store.set_item("jama", 0, "作者身份", True)
+    store.set_value("gqs", 1, 5)
+    store.set_value("视频类型", 2, "广告")
+    store.set_value("标签", 3, ["医学", "营养"])
+    store.set_value("得分", 3, 3.5)
+    manager.save_annotations(meta, store)
+    return meta
+
+
+@pytest.mark.parametrize("fmt", sorted(EXPORT_FORMATS))
+@pytest.mark.parametrize("layout", ["joined", "wide"])
+def test_export_writes_data_and_annotations(open_manager, crawl_file, tmp_path, fmt, layout):
+    if fmt in OPTIONAL_MODULES:
+        pytest.importorskip(OPTIONAL_MODULES[fmt])
+    manager = open_manager()
+    meta = annotated_session(manager, crawl_file)
+    sources = [session_source(manager, meta, chunksize=3)]  # two chunks
+    path = str(tmp_path / f"export{EXPORT_FORMATS[fmt]}")
+    assert export_sessions(sources, path, fmt, layout) == 4
+
+    exported = READERS[fmt](path)
+    assert list(exported.columns) == export_columns(sources, layout)
+    assert exported["video_id"].tolist() == make_crawl(4)["video_id"].tolist()
+    assert exported["jama_score"].tolist() == [1, 0, 0, 0]
+    assert exported["gqs_score"].tolist() == [1, 5, 1, 1]
+    assert exported["视频类型"].fillna("").tolist() == ["", "", "广告", ""]
+    assert exported["得分"].fillna(0).tolist() == [0, 0, 0, 3.5]
+    if layout == "wide":
+        assert exported["标签_医学"].tolist() == [0, 0, 0, 1]
+        assert exported["jama_作者身份"].tolist() == [1, 0, 0, 0]
+    else:
+        assert exported["标签"].fillna("").tolist() == ["", "", "", "医学, 营养"]
+        assert exported["jama_details"].fillna("").tolist() == ["作者身份", "", "", ""]
+
+
+def test_export_of_several_sessions_leads_with_the_session(open_manager, crawl_file, tmp_path):
+    manager = open_manager()
+    metas = [annotated_session(manager, crawl_file), annotated_session(manager, crawl_file, start=10)]
+    path = str(tmp_path / "export.csv")
+    assert export_sessions([session_source(manager, meta) for meta in metas], path) == 8
+
+    exported = READERS["csv"](path)
+    assert list(exported.columns[:2]) == ["session_timestamp", "source_file"]
+    assert exported["source_file"].tolist() == ["crawl0.csv"] * 4 + ["crawl10.csv"] * 4
+    assert exported["gqs_score"].tolist() == [1, 5, 1, 1] * 2
@@ -0,0 +1,259 @@
+import os
+
+import pandas as pd
+import pytest
+
+from annotation_merge import merge_annotations
+from annotation_store import AnnotationStore
+from dedup_index import DUPLICATE_COLUMN
+from workers import WorkerCancelled
+from conftest import CUSTOM_COLUMNS, make_crawl
+
+
+def records_of(store, rows=None):
+    return [store.record(row) for row in (range(store.n_rows) if rows is None else rows)]
+
+
+def annotate(store):
+    # A few edits covering every field type, overflow values and a rated row left at GQS 1
+    store.set_item("jama", 0, "作者身份", True)
+    store.set_item("jama", 0, "不在词表里", True)
+    store.set_value("gqs", 1, 5)
+    store.set_item("discern", 2, "视频目的清晰且简洁", True)
+    store.set_value("视频类型", 3, "广告")
+    store.set_value("视频类型", 4, "自定义选项")
+    store.set_value("标签", 4, ["医学", "营养"])
+    store.set_value("得分", 5, 3.5)
+    store.set_value("gqs", 6, 1)
+    return records_of(store)
+
+
+def import_crawl(manager, crawl_file, df, dedup="off"):
+    return manager.add_history_from_file(crawl_file(df), CUSTOM_COLUMNS, dedup=dedup)
+
+
+def test_append_reload_compact_reload(open_manager, crawl_file):
+    manager = open_manager()
+    meta = import_crawl(manager, crawl_file, make_crawl(20))
+    df, store = manager.get_data(meta)
+    assert len(df) == 20
+    expected = annotate(store)
+    assert manager.save_annotations(meta, store) == 7
+
+    reloaded = open_manager().load_annotations(meta, 20)
+    assert records_of(reloaded) == expected
+    assert reloaded.annotated().tolist() == [True] * 7 + [False] * 13
+
+    second = open_manager()
+    store = second.load_annotations(meta, 20)
+    store.set_value("gqs", 10, 3)
+    second.save_annotations(meta, store)
+    expected[10] = store.record(10)
+    assert second.compact_annotations(meta)
+
+    compacted = open_manager().load_annotations(meta, 20)
+    assert records_of(compacted) == expected
+    assert compacted.rated[6]
+
+
+def test_later_edits_of_a_row_win(open_manager, crawl_file):
+    manager = open_manager()
+    meta = import_crawl(manager, crawl_file, make_crawl(5))
+    store = manager.load_annotations(meta, 5)
+    for score in (2, 4, 3):
+        store.set_value("gqs", 0, score)
+        manager.save_annotations(meta, store)
+    assert open_manager().load_annotations(meta, 5).get_value("gqs", 0) == 3
+
+
+def test_sync_picks_up_rows_saved_by_another_manager(open_manager, crawl_file):
+    manager = open_manager()
+    meta = import_crawl(manager, crawl_file, make_crawl(5))
+    store = manager.load_annotations(meta, 5)
+    other = open_manager()
+    theirs = other.load_annotations(meta, 5)
+    theirs.set_value("gqs", 2, 4)
+    theirs.set_value("gqs", 3, 1)
+    other.save_annotations(meta, theirs)
+    assert manager.sync_annotations(meta, store) == [2, 3]
+    assert store.get_value("gqs", 2) == 4 and store.rated[3]
+
+
+def test_annotator_layers_are_separate_and_merge(open_manager, crawl_file):
+    meta = import_crawl(open_manager(), crawl_file, make_crawl(4))
+    for annotator, scores in (("alice", [5, 2, 3, 1]), ("bob", [5, 2, 4, 1]), ("carol", [4, 2, 4, 1])):
+        manager = open_manager(annotator)
+        store = manager.load_annotations(meta, 4)
+        for row, score in enumerate(scores):
+            store.set_value("gqs", row, score)
+        manager.save_annotations(meta, store)
+    manager = open_manager()
+    assert manager.list_annotators(meta) == ["alice", "bob", "carol"]
+    assert not manager.load_annotations(meta, 4).annotated().any()
+    _, bob = manager.get_data(meta, annotator="bob")
+    assert bob.arrays["gqs"].tolist() == [5, 2, 4, 1]
+
+    merge_annotations(manager, meta, strategy="majority")
+    merged = open_manager().load_annotations(meta, 4)
+    assert merged.arrays["gqs"].tolist() == [5, 2, 4, 1]
+    assert merged.rated.all()
+
+
+def test_reading_a_layer_does_not_create_it(open_manager, crawl_file, backend):
+    meta = import_crawl(open_manager(), crawl_file, make_crawl(3))
+    manager = open_manager("dave")
+    store = manager.load_annotations(meta, 3)
+    assert manager.sync_annotations(meta, store) == []
+    if backend == "files":
+        assert not os.path.exists(manager.layer_folder(meta))
+        os.makedirs(manager.layer_folder(meta, "eve"))  # left behind empty
+    assert manager.list_annotators(meta) == []
+    store.set_value("gqs", 0, 4)
+    manager.save_annotations(meta, store)
+    assert manager.list_annotators(meta) == ["dave"]
+
+
+def test_update_import_keeps_annotations(open_manager, crawl_file):
+    manager = open_manager()
+    crawl = make_crawl(10)
+    meta = import_crawl(manager, crawl_file, crawl)
+    store = manager.load_annotations(meta, 10)
+    expected = annotate(store)
+    manager.save_annotations(meta, store)
+
+    # Re-crawl: the same videos shuffled with new counts, plus three new videos
+    recrawl = crawl.sample(frac=1, random_state=1).assign(like_count=lambda df: df["like_count"] + 1)
+    recrawl = pd.concat([recrawl, make_crawl(3, start=10)], ignore_index=True)
+    updated = manager.update_history_from_file(meta, crawl_file(recrawl, "recrawl.csv"))
+    assert updated["count"] == 13
+
+    reloaded = open_manager()
+    df, store = reloaded.get_data(updated)
+    assert len(df) == 13
+    assert df["video_id"].astype(str).tolist()[:10] == crawl["video_id"].tolist()
+    assert df["like_count"].astype(int).tolist()[:10] == (crawl["like_count"] + 1).tolist()
+    assert records_of(store, range(10)) == expected
+    assert not store.annotated()[10:].any()
+
+
+def stored_cells(manager, meta, backend):
+    # The stored cells as written: data.csv text, or the values of the SQLite table as text
+    if backend == "files":
+        path = os.path.join(manager.history_dir, meta["timestamp"], "data.csv")
+        return pd.read_csv(path, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    df = pd.read_sql_query(f'SELECT * FROM "data_{meta["timestamp"]}" ORDER BY rowid', manager.conn)
+    return df.astype(object).where(df.notna(), "").map(str)
+
+
+def test_update_import_rewrites_only_changed_counts(open_manager, crawl_file, backend):
+    # Cells the crawl leaves empty keep their stored text, rewritten counts stay integers
+    manager = open_manager()
+    crawl = make_crawl(3).assign(danmaku_count=[None, 7, 8], play_count=[100, 200, 300])
+    meta = import_crawl(manager, crawl_file, crawl)
+    before = stored_cells(manager, meta, backend)
+    recrawl = crawl.assign(like_count=crawl["like_count"] + 5, danmaku_count=None, play_count=[100, 250, None])
+    updated = manager.update_history_from_file(meta, crawl_file(recrawl, "recrawl.csv"))
+    assert updated["last_update"]["changed"] == 3
+
+    after = stored_cells(manager, meta, backend)
+    assert after["danmaku_count"].tolist() == before["danmaku_count"].tolist()
+    assert after["danmaku_count"][0] == ""
+    assert after["play_count"].tolist() == [before["play_count"][0], "250", before["play_count"][2]]
+    assert after["like_count"].tolist() == [str(value + 5) for value in crawl["like_count"]]
+    untouched = [name for name in before.columns if name not in ("like_count", "play_count")]
+    assert after[untouched].equals(before[untouched])
+
+
+def test_update_import_without_changes_keeps_data(open_manager, crawl_file):
+    manager = open_manager()
+    crawl = make_crawl(5)
+    meta = import_crawl(manager, crawl_file, crawl)
+    stamp = manager.data_stamp(meta)
+    updated = manager.update_history_from_file(meta, crawl_file(crawl, "same.csv"))
+    assert updated["count"] == 5
+    assert manager.data_stamp(meta) == stamp
+
+
+def test_columnar_snapshot_follows_data_changes(open_manager, crawl_file, backend):
+    if backend != "files":
+        pytest.skip("the columnar snapshot belongs to the files backend")
+    pytest.importorskip("pyarrow")
+    manager = open_manager()
+    crawl = make_crawl(4)
+    meta = import_crawl(manager, crawl_file, crawl)
+    snapshot = os.path.join(manager.history_dir, meta["timestamp"], "data.feather")
+    manager.get_data(meta)  # the first open writes the snapshot
+    assert manager._fresh_snapshot(meta) == snapshot
+
+    # Rewritten counts, then appended videos: each makes the snapshot stale until the next open
+    meta = manager.update_history_from_file(meta, crawl_file(crawl.assign(like_count=crawl["like_count"] + 1), "counts.csv"))
+    assert manager._fresh_snapshot(meta) is None
+    df, _ = open_manager().get_data(meta)
+    assert df["like_count"].tolist() == (crawl["like_count"] + 1).tolist()
+    meta = manager.update_history_from_file(meta, crawl_file(make_crawl(2, start=4), "more.csv"))
+    assert manager._fresh_snapshot(meta) is None
+    assert [len(chunk) for chunk in manager.iter_data(meta)] == [6]
+    df, _ = manager.get_data(meta)
+    assert df["video_id"].tolist() == make_crawl(6)["video_id"].tolist()
+    assert manager._fresh_snapshot(meta) == snapshot
+    reopened, _ = open_manager().get_data(meta)
+    pd.testing.assert_frame_equal(reopened, df)
+
+
+def test_dedup_flags_duplicates_and_reuses_annotations(open_manager, crawl_file):
+    manager = open_manager()
+    first = import_crawl(manager, crawl_file, make_crawl(6), dedup="flag")
+    store = manager.load_annotations(first, 6)
+    store.set_value("gqs", 2, 4)
+    store.set_value("gqs", 3, 1)  # rated with the empty values: carried over too
+    manager.save_annotations(first, store)
+
+    # Rows 2..5 of the first crawl again, then two new videos
+    second = import_crawl(open_manager(), crawl_file, make_crawl(6, start=2), dedup="flag")
+    assert second["dedup"]["duplicates"] == 4
+    assert second["dedup"]["reused"] == 2
+    df, store = open_manager().get_data(second)
+    assert df[DUPLICATE_COLUMN].fillna("").tolist() == [f"{first['timestamp']}#{row}" for row in (3, 4, 5, 6)] + ["", ""]
+    assert store.get_value("gqs", 0) == 4
+    assert store.annotated().tolist() == [True, True] + [False] * 4
+
+    skipped = import_crawl(open_manager(), crawl_file, make_crawl(8), dedup="skip")
+    assert skipped["count"] == 0
+
+
+def test_history_sees_meta_rewritten_by_another_manager(open_manager, crawl_file):
+    manager = open_manager()
+    meta = import_crawl(manager, crawl_file, make_crawl(4), dedup="flag")
+    assert manager.get_history()[0]["count"] == 4
+    other = open_manager()
+    other.save_custom_columns(meta, CUSTOM_COLUMNS[:1])
+    other.update_history_from_file(meta, crawl_file(make_crawl(6), "recrawl.csv"))
+    history = manager.get_history()
+    assert history[0]["count"] == 6
+    assert history[0]["custom_columns"] == CUSTOM_COLUMNS[:1]
+    # The dedup index rescans the grown session, so the appended videos count as seen
+    again = import_crawl(manager, crawl_file, make_crawl(2, start=4), dedup="flag")
+    assert again["dedup"]["duplicates"] == 2
+
+
+def test_cancelled_import_leaves_no_session(open_manager, crawl_file, backend):
+    manager = open_manager()
+    path = crawl_file(make_crawl(30))
+
+    def progress(rows, fraction):
+        if rows >= 10:
+            raise WorkerCancelled()
+
+    with pytest.raises(WorkerCancelled):
+        manager.add_history_from_file(path, CUSTOM_COLUMNS, chunksize=10, progress=progress, dedup="off")
+    assert open_manager().get_history() == []
+    if backend == "sqlite":
+        tables = manager.conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'data_%'").fetchall()
+        assert tables == []
+        assert manager.conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0] == 0
+
+
+def test_empty_store_matches_a_new_import(open_manager, crawl_file):
+    manager = open_manager()
+    meta = import_crawl(manager, crawl_file, make_crawl(3))
+    assert records_of(manager.load_annotations(meta, 3)) == records_of(AnnotationStore(3, CUSTOM_COLUMNS))
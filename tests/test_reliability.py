@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from reliability import Agreement
+
+NAN = np.nan
+# Krippendorff's reliability data: 4 coders x 12 units, with missing values
+# (Krippendorff 2011, "Computing Krippendorff's Alpha-Reliability")
+KRIPPENDORFF = np.array([
+    [1, 2, 3, 3, 2, 1, 4, 1, 2, NAN, NAN, NAN],
+    [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, NAN, 3],
+    [NAN, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, NAN],
+    [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, NAN],
+]).T
+# Fleiss (1971) as worked on Wikipedia: 10 subjects, 14 raters each, ratings per category 1..5
+FLEISS_COUNTS = [
+    [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+    [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+]
+
+
+def counts_to_ratings(counts):
+    # One row per subject, one column per rater; which rater gave which rating does not matter
+    return np.array([np.repeat(np.arange(1, len(row) + 1), row) for row in counts], dtype=np.float64)
+
+
+@pytest.mark.parametrize("level, expected", [("nominal", 0.743), ("ordinal", 0.815), ("interval", 0.849)])
+def test_alpha_matches_krippendorff(level, expected):
+    assert Agreement(level, KRIPPENDORFF).statistics()[2] == pytest.approx(expected, abs=5e-4)
+
+
+def test_fleiss_kappa_matches_fleiss():
+    _, fleiss, _ = Agreement("nominal", counts_to_ratings(FLEISS_COUNTS)).statistics()
+    assert fleiss == pytest.approx(0.210, abs=5e-4)
+
+
+def test_cohen_kappa_of_two_coders():
+    # 50 yes/no decisions: 20 both yes, 15 both no, 5 and 10 split (kappa 0.4)
+    pairs = [(1, 1)] * 20 + [(1, 0)] * 5 + [(0, 1)] * 10 + [(0, 0)] * 15
+    cohen, fleiss, alpha = Agreement("nominal", np.array(pairs, dtype=np.float64)).statistics()
+    assert cohen == pytest.approx(0.4)
+    # Two coders: Fleiss' kappa is Scott's pi, alpha the same with its small-sample correction
+    scott_pi = (0.7 - 0.505) / (1 - 0.505)
+    assert fleiss == pytest.approx(scott_pi)
+    assert alpha == pytest.approx(1 - (1 - scott_pi) * 99 / 100)
+
+
+def test_units_rated_by_one_coder_are_ignored():
+    values = np.vstack([KRIPPENDORFF, [[3, NAN, NAN, NAN]] * 5])
+    assert Agreement("nominal", values).statistics()[2] == Agreement("nominal", KRIPPENDORFF).statistics()[2]
@@ -0,0 +1,59 @@
+import threading
+import traceback
+import logging
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from instrumentation import metrics, profiler
+
+
+class WorkerCancelled(Exception):
+    pass
+
+
+class WorkerSignals(QObject):
+    # Emitted from a pool thread; connected slots run on the UI thread (queued connection)
+    progress = pyqtSignal(int, object)  # rows done, fraction done or None
+    finished = pyqtSignal(object)  # return value of the task
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class Worker(QRunnable):
+    # Runs fn(*args, progress=worker.report, **kwargs) on a QThreadPool. The task calls
+    # progress() between steps; after cancel() that call raises WorkerCancelled, so
+    # the task stops at its next step and cleans up like after any other error.
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancel_event = threading.Event()
+        self.setAutoDelete(False)  # the owner keeps a reference while the task is pending
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, rows, fraction=None):
+        if self._cancel_event.is_set():
+            raise WorkerCancelled()
+        self.signals.progress.emit(rows, fraction)
+
+    def run(self):
+        try:
+            if self._cancel_event.is_set():
+                raise WorkerCancelled()
+            with metrics.timer(f"task.{getattr(self.fn, '__name__', 'task')}"):
+                result = profiler.call(self.fn, *self.args, progress=self.report, **self.kwargs)
+        except WorkerCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            logging.error(f"❌ 后台任务失败：{str(e)}\n{traceback.format_exc()}")
+            self.signals.failed.emit(str(e))
+        else:
+            # A task that completed despite a late cancel() still reports its result
+            self.signals.finished.emit(result)